@@ -2,13 +2,16 @@
 import osmium
 import geopandas as gpd
 import pandas as pd
+import numpy as np
 from shapely.geometry import LineString, Point, Polygon, MultiPolygon
-from shapely.ops import transform as shapely_transform
-from functools import partial
-from pyproj import Transformer
 import json
+import os
+import sys
 import urllib.request
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.projection import from_lambert72, to_lambert72, transform_geometry  # noqa: E402
+
 PBF_FILE = "input.pbf"
 OUTPUT_FILE = "missing_nodes.geojson"          # MapRoulette (line-delimited)
 OUTPUT_FILE_JOSM = "missing_nodes_josm.geojson"  # JOSM (valid GeoJSON)
@@ -97,12 +100,11 @@ gdf["layer"] = gdf["layer"].fillna("0")
 gdf = gdf.to_crs(31370)
 
 # Précalculer les coordonnées des nœuds en projeté (pour le check précis)
-transformer = Transformer.from_crs("EPSG:4326", "EPSG:31370", always_xy=True)
-
-node_locations_proj = {}
-for nid, (lon, lat) in node_locations.items():
-    x, y = transformer.transform(lon, lat)
-    node_locations_proj[nid] = (x, y)
+# (une seule transformation vectorisée pour tous les nœuds)
+node_ids = np.fromiter(node_locations.keys(), dtype=np.int64, count=len(node_locations))
+node_lonlat = np.array(list(node_locations.values()), dtype=np.float64).reshape(-1, 2)
+node_x, node_y = to_lambert72(node_lonlat[:, 0], node_lonlat[:, 1])
+node_locations_proj = dict(zip(node_ids.tolist(), zip(node_x.tolist(), node_y.tolist())))
 
 # =========================
 # SPATIAL INDEX
@@ -222,8 +224,7 @@ with urllib.request.urlopen(POLY_URL) as resp:
 boundary_wgs = parse_poly(poly_text)
 
 # Projeter en EPSG:31370 (même CRS que les résultats)
-to_31370 = Transformer.from_crs("EPSG:4326", "EPSG:31370", always_xy=True)
-boundary = shapely_transform(partial(to_31370.transform), boundary_wgs)
+boundary = transform_geometry(boundary_wgs, to_lambert72)
 
 before = len(results)
 results = [r for r in results if boundary.contains(r["geometry"])]
@@ -236,11 +237,9 @@ if len(results) == 0:
     print("No issues found.")
     exit()
 
-# Transformer projeté → WGS84
-to_wgs84 = Transformer.from_crs("EPSG:31370", "EPSG:4326", always_xy=True)
-
+# Projeté → WGS84
 def project_to_wgs(geom):
-    return shapely_transform(partial(to_wgs84.transform), geom)
+    return transform_geometry(geom, from_lambert72)
 
 all_josm_features = []
 
@@ -1,10 +1,14 @@
 #!/usr/bin/env python3
 """
 1) Télécharge le GeoPackage UrbIS-Topo (région Bruxelles entière),
-   extrait la couche TOPO_POINTS et génère un GeoJSON par valeur du champ
-   DESCRFRE (reprojeté de Lambert 72 / EPSG:31370 vers WGS84 / EPSG:4326).
-
-2) Compare TOPO_POINTS_Arbre_haute_tige.geojson et TOPO_POINTS_Banc.geojson
+   extrait la couche TOPO_POINTS et l'écrit en GeoParquet partitionné par
+   valeur du champ DESCRFRE (reprojeté de Lambert 72 / EPSG:31370 vers
+   WGS84 / EPSG:4326) :
+       parquet_topo_points/DESCRFRE=<catégorie>/part-0.parquet
+   Les partitions sont produites en une seule passe (groupby). L'export
+   d'un GeoJSON par catégorie reste disponible avec --geojson.
+
+2) Compare les catégories Arbre_haute_tige et Banc
    avec les données déjà présentes dans OpenStreetMap (natural=tree et
    amenity=bench, extraits d'un PBF), en utilisant une distance configurable
    (défaut 1 m). Les points UrbIS sans correspondance OSM sont écrits dans
@@ -12,18 +16,30 @@
    MINIMAL avec des géométries Point (PAS MultiPoint), pour un import propre
    dans JOSM (sans relation parasite).
 
-   Le PBF OSM est SYSTÉMATIQUEMENT re-téléchargé à chaque exécution.
+   Le PBF OSM (Brussels-daily.pbf) est résolu par common.snapshot_store :
+   il n'est re-téléchargé que si la version publiée a changé.
+
+Les téléchargements passent par common.http_cache : le flux Atom est
+revalidé par requête conditionnelle (ETag / If-Modified-Since) dans le
+cache HTTP partagé, et le GPKG est conservé extrait dans ./urbis_cache/
+(ou $URBIS_CACHE_DIR), par nom de release daté : relancer le script sur
+des données inchangées ne télécharge rien de volumineux. Avec --offline
+(ou OSM_BE_OFFLINE=1), seuls le cache HTTP, le GPKG extrait et le PBF
+local sont utilisés.
 
 Dépendances :
-    pip install geopandas fiona pyproj requests lxml osmium shapely rtree
+    pip install geopandas fiona pyproj pyarrow requests lxml osmium shapely rtree
 """
 
+import argparse
 import os
 import re
 import sys
 import json
+import shutil
 import zipfile
-import tempfile
+import datetime
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from xml.etree import ElementTree as ET
 
@@ -32,27 +48,68 @@ import geopandas as gpd
 import osmium
 from shapely.geometry import Point, MultiPoint, mapping
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import http_cache  # noqa: E402
+from common.snapshot_store import DAILY_FILENAME, snapshot_path  # noqa: E402
+
 # ── Configuration UrbIS ──────────────────────────────────────────────
 ATOM_FEED_URL = (
     "https://urbisdownload.datastore.brussels/atomfeed/"
     "10ded91e-6a63-11ed-9d77-010101010000-en.xml"
 )
 OUTPUT_DIR = Path("geojson_topo_points")
+PARQUET_DIR = Path("parquet_topo_points")
+PARQUET_ROW_GROUP_SIZE = 50_000
 LAYER_NAME = "Topo_points"
 FIELD_NAME = "DESCRFRE"
 SOURCE_CRS = "EPSG:31370"   # Belgian Lambert 72
 TARGET_CRS = "EPSG:4326"    # WGS84 (lat/lon) — compatible OpenStreetMap
 METRIC_CRS = "EPSG:31370"   # Pour les calculs de distance (en mètres)
 
+# GPKG extrait, par release (le flux Atom est dans le cache HTTP partagé)
+CACHE_DIR = Path(os.environ.get("URBIS_CACHE_DIR", "urbis_cache"))
+PROBE_DAYS = 120            # repli : nombre de jours sondés si le flux est vide
+PROBE_WORKERS = 8           # requêtes HEAD simultanées pour ce repli
+SOURCE_MARKER = "_source.txt"   # release ayant produit les partitions GeoParquet
+
 # ── Configuration OSM ────────────────────────────────────────────────
-OSM_PBF_URL = (
-    "https://raw.githubusercontent.com/PasLoin/Osm-python-analyse_Belgium/"
-    "main/pbf_analyse/history/Brussels-daily.pbf"
-)
 CANDIDATES_DIR = Path("candidates")
 DEFAULT_DISTANCE_M = 1.0
 
 
+# Catégories comparées avec OSM (nom de partition, cf. safe_category_name)
+TREE_CATEGORY = "Arbre_haute_tige"
+BENCH_CATEGORY = "Banc"
+
+
+# ─────────────────────────────────────────────────────────────────────
+# Helpers : noms de catégorie / partitions GeoParquet
+# ─────────────────────────────────────────────────────────────────────
+
+def safe_category_name(cat) -> str:
+    """Nom de fichier/partition sûr pour une valeur DESCRFRE."""
+    safe_name = re.sub(r'[^\w\s-]', '', str(cat)).strip()
+    safe_name = re.sub(r'[\s]+', '_', safe_name)
+    return safe_name or "sans_nom"
+
+
+def partition_path(category: str) -> Path:
+    """Fichier GeoParquet de la partition DESCRFRE=<category>."""
+    return PARQUET_DIR / f"{FIELD_NAME}={category}" / "part-0.parquet"
+
+
+def load_topo_category(category: str, columns=("geometry",)):
+    """
+    Lit UNE partition DESCRFRE (ex. "Banc") : seul ce fichier est ouvert,
+    et seules les colonnes demandées sont décodées.
+    Renvoie None si la partition n'existe pas.
+    """
+    path = partition_path(category)
+    if not path.exists():
+        return None
+    return gpd.read_parquet(path, columns=list(columns))
+
+
 # ─────────────────────────────────────────────────────────────────────
 # Helper : MultiPoint → Point simples
 # ─────────────────────────────────────────────────────────────────────
@@ -81,13 +138,46 @@ def to_simple_points(geoms):
 # Partie 1 : Téléchargement et extraction UrbIS
 # ─────────────────────────────────────────────────────────────────────
 
+def probe_gpkg_url(region_code: str) -> str | None:
+    """
+    Repli quand le flux ne liste aucun GPKG : sonde les URL datées des
+    PROBE_DAYS derniers jours par requêtes HEAD concurrentes (pool borné),
+    par lots du plus récent au plus ancien. Renvoie l'URL la plus récente.
+    """
+    if http_cache.is_offline():
+        return None
+    base = "https://urbisdownload.datastore.brussels/UrbIS/Vector/M8/UrbIS-TOPO/GPKG/"
+    today = datetime.date.today()
+    urls = [
+        f"{base}UrbISTopo_31370_GPKG_{region_code}_"
+        f"{(today - datetime.timedelta(days=delta)).strftime('%Y%m%d')}.zip"
+        for delta in range(PROBE_DAYS)
+    ]
+
+    def exists(url: str) -> bool:
+        try:
+            r = http_cache.session().head(url, timeout=10, allow_redirects=True)
+            return r.status_code == 200
+        except requests.RequestException:
+            return False
+
+    with ThreadPoolExecutor(max_workers=PROBE_WORKERS) as pool:
+        for start in range(0, len(urls), PROBE_WORKERS):
+            batch = urls[start:start + PROBE_WORKERS]
+            hits = [u for u, ok in zip(batch, pool.map(exists, batch)) if ok]
+            if hits:
+                return hits[0]   # lot ordonné du plus récent au plus ancien
+    return None
+
+
 def fetch_gpkg_url_from_feed(feed_url: str) -> str:
     """Parse le flux Atom et renvoie l'URL du GPKG le plus récent."""
-    print("Téléchargement du flux Atom…")
-    resp = requests.get(feed_url, timeout=60)
-    resp.raise_for_status()
+    print("Flux Atom (requête conditionnelle)…")
+    r = http_cache.get(feed_url, ttl=0)
+    if r.from_cache:
+        print("  → inchangé, copie en cache utilisée")
 
-    root = ET.fromstring(resp.content)
+    root = ET.fromstring(r.content)
     REGION_CODE = "04000"
 
     gpkg_links: list[tuple[str, str]] = []
@@ -100,17 +190,11 @@ def fetch_gpkg_url_from_feed(feed_url: str) -> str:
 
     if not gpkg_links:
         print("Aucun lien GPKG région trouvé dans le flux, tentative avec l'URL directe…")
-        import datetime
-        base = "https://urbisdownload.datastore.brussels/UrbIS/Vector/M8/UrbIS-TOPO/GPKG/"
-        today = datetime.date.today()
-        for delta in range(0, 120):
-            d = today - datetime.timedelta(days=delta)
-            url = f"{base}UrbISTopo_31370_GPKG_{REGION_CODE}_{d.strftime('%Y%m%d')}.zip"
-            r = requests.head(url, timeout=10, allow_redirects=True)
-            if r.status_code == 200:
-                print(f"  → Trouvé : {url}")
-                return url
-        sys.exit("Impossible de trouver le fichier GPKG région.")
+        url = probe_gpkg_url(REGION_CODE)
+        if url is None:
+            sys.exit("Impossible de trouver le fichier GPKG région.")
+        print(f"  → Trouvé : {url}")
+        return url
 
     gpkg_links.sort(key=lambda x: x[0], reverse=True)
     url = gpkg_links[0][1]
@@ -118,33 +202,43 @@ def fetch_gpkg_url_from_feed(feed_url: str) -> str:
     return url
 
 
-def download_and_extract_gpkg(url: str, work_dir: str) -> str:
-    """Télécharge le ZIP et extrait le fichier .gpkg."""
-    zip_path = os.path.join(work_dir, "urbis_topo.zip")
+def release_name(url: str) -> str:
+    """Nom daté de la release, ex. UrbISTopo_31370_GPKG_04000_20250101."""
+    return Path(url.split("?")[0]).stem
+
+
+def download_and_extract_gpkg(url: str, cache_dir: Path | None = None) -> str:
+    """
+    Renvoie le .gpkg de la release `url`, extrait une fois pour toutes dans
+    cache_dir/<release>/. Si il y est déjà, aucun téléchargement n'a lieu.
+    Le ZIP est supprimé après extraction, ainsi que les releases plus anciennes.
+    """
+    cache_dir = cache_dir or CACHE_DIR
+    release_dir = cache_dir / release_name(url)
+    existing = sorted(release_dir.glob("**/*.gpkg")) if release_dir.exists() else []
+    if existing:
+        print(f"GeoPackage déjà en cache : {existing[0]}")
+        return str(existing[0])
+
+    zip_path = release_dir / "urbis_topo.zip"
     print(f"Téléchargement du GeoPackage ({url})…")
-    with requests.get(url, stream=True, timeout=600) as r:
-        r.raise_for_status()
-        total = int(r.headers.get("content-length", 0))
-        downloaded = 0
-        with open(zip_path, "wb") as f:
-            for chunk in r.iter_content(chunk_size=1 << 20):
-                f.write(chunk)
-                downloaded += len(chunk)
-                if total:
-                    pct = downloaded * 100 // total
-                    print(f"\r  {downloaded // (1 << 20)} Mo / {total // (1 << 20)} Mo ({pct}%)",
-                          end="", flush=True)
-    print()
+    http_cache.download(url, zip_path)
 
     print("Extraction du ZIP…")
     with zipfile.ZipFile(zip_path) as zf:
         gpkg_files = [n for n in zf.namelist() if n.lower().endswith(".gpkg")]
         if not gpkg_files:
             sys.exit("Aucun fichier .gpkg trouvé dans l'archive.")
-        zf.extractall(work_dir, gpkg_files)
-        gpkg_path = os.path.join(work_dir, gpkg_files[0])
-        print(f"  → {gpkg_files[0]}")
-    return gpkg_path
+        zf.extractall(release_dir, gpkg_files)
+        gpkg_path = release_dir / gpkg_files[0]
+        print(f"  → {gpkg_path}")
+    zip_path.unlink()
+
+    for old in cache_dir.glob("UrbISTopo_*"):
+        if old.is_dir() and old != release_dir:
+            print(f"Suppression de l'ancienne release en cache : {old}")
+            shutil.rmtree(old)
+    return str(gpkg_path)
 
 
 def list_layers(gpkg_path: str):
@@ -156,8 +250,12 @@ def list_layers(gpkg_path: str):
     return layers
 
 
-def process_topo_points(gpkg_path: str, layer_name: str):
-    """Lit la couche points, reprojette et exporte un GeoJSON par DESCRFRE."""
+def process_topo_points(gpkg_path: str, layer_name: str, export_geojson: bool = False):
+    """
+    Lit la couche points, reprojette et écrit une partition GeoParquet par
+    DESCRFRE (un seul groupby sur le GeoDataFrame). Avec export_geojson,
+    écrit en plus un GeoJSON par catégorie comme auparavant.
+    """
     print(f"\nLecture de la couche '{layer_name}'…")
     gdf = gpd.read_file(gpkg_path, layer=layer_name)
     print(f"  {len(gdf)} entités chargées")
@@ -172,25 +270,34 @@ def process_topo_points(gpkg_path: str, layer_name: str):
     print(f"\nReprojection {SOURCE_CRS} → {TARGET_CRS}…")
     gdf = gdf.to_crs(TARGET_CRS)
 
-    OUTPUT_DIR.mkdir(exist_ok=True)
+    # Les partitions d'un run précédent peuvent ne plus exister dans la release
+    if PARQUET_DIR.exists():
+        shutil.rmtree(PARQUET_DIR)
+    if export_geojson:
+        OUTPUT_DIR.mkdir(exist_ok=True)
 
-    categories = gdf[FIELD_NAME].dropna().unique()
-    print(f"\n{len(categories)} catégories DESCRFRE trouvées :")
+    groups = gdf.groupby(FIELD_NAME, sort=True)
+    print(f"\n{groups.ngroups} catégories DESCRFRE trouvées :")
 
-    for cat in sorted(categories):
-        subset = gdf[gdf[FIELD_NAME] == cat].copy()
-        safe_name = re.sub(r'[^\w\s-]', '', str(cat)).strip()
-        safe_name = re.sub(r'[\s]+', '_', safe_name)
-        if not safe_name:
-            safe_name = "sans_nom"
-        filename = f"TOPO_POINTS_{safe_name}.geojson"
-        filepath = OUTPUT_DIR / filename
-        if filepath.exists():
-            filepath.unlink()
-        subset.to_file(filepath, driver="GeoJSON")
-        print(f"  ✓ {filename:60s} ({len(subset):>5d} points)")
+    for cat, subset in groups:
+        safe_name = safe_category_name(cat)
+        path = partition_path(safe_name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # La valeur de partition est portée par le nom du dossier (style Hive)
+        subset.drop(columns=FIELD_NAME).to_parquet(
+            path, index=False, row_group_size=PARQUET_ROW_GROUP_SIZE,
+        )
+        print(f"  ✓ {FIELD_NAME}={safe_name:55s} ({len(subset):>5d} points)")
 
-    print(f"\nTerminé ! {len(categories)} fichiers GeoJSON créés dans ./{OUTPUT_DIR}/")
+        if export_geojson:
+            filepath = OUTPUT_DIR / f"TOPO_POINTS_{safe_name}.geojson"
+            if filepath.exists():
+                filepath.unlink()
+            subset.to_file(filepath, driver="GeoJSON")
+
+    print(f"\nTerminé ! {groups.ngroups} partitions GeoParquet dans ./{PARQUET_DIR}/")
+    if export_geojson:
+        print(f"          {groups.ngroups} fichiers GeoJSON dans ./{OUTPUT_DIR}/")
 
 
 # ─────────────────────────────────────────────────────────────────────
@@ -219,28 +326,6 @@ class TagNodeHandler(osmium.SimpleHandler):
                 })
 
 
-def download_pbf(url: str, dest_path: Path):
-    """Télécharge SYSTÉMATIQUEMENT le PBF OSM (écrase la version locale)."""
-    dest_path.parent.mkdir(parents=True, exist_ok=True)
-    if dest_path.exists():
-        print(f"Suppression de la version locale existante : {dest_path}")
-        dest_path.unlink()
-    print(f"Téléchargement du PBF OSM ({url})…")
-    with requests.get(url, stream=True, timeout=600) as r:
-        r.raise_for_status()
-        total = int(r.headers.get("content-length", 0))
-        downloaded = 0
-        with open(dest_path, "wb") as f:
-            for chunk in r.iter_content(chunk_size=1 << 20):
-                f.write(chunk)
-                downloaded += len(chunk)
-                if total:
-                    pct = downloaded * 100 // total
-                    print(f"\r  {downloaded // (1 << 20)} Mo / {total // (1 << 20)} Mo ({pct}%)",
-                          end="", flush=True)
-    print()
-
-
 def extract_osm_nodes(pbf_path: Path, filters):
     """Extrait les nœuds OSM correspondant aux filtres (key, value)."""
     print("\nExtraction des nœuds OSM…")
@@ -261,7 +346,7 @@ def extract_osm_nodes(pbf_path: Path, filters):
     return gdfs
 
 
-def find_candidates(urbis_geojson: Path, osm_gdf: gpd.GeoDataFrame,
+def find_candidates(category: str, osm_gdf: gpd.GeoDataFrame,
                     distance_m: float, main_tag: tuple, output_path: Path):
     """
     Trouve les points UrbIS sans correspondance OSM dans `distance_m` mètres,
@@ -269,12 +354,12 @@ def find_candidates(urbis_geojson: Path, osm_gdf: gpd.GeoDataFrame,
     MultiPoint), un seul tag, pas d'id Feature — pour un import propre dans
     JOSM (sans relation parasite).
     """
-    if not urbis_geojson.exists():
-        print(f"\n⚠ {urbis_geojson} introuvable, étape ignorée.")
+    urbis = load_topo_category(category)
+    if urbis is None:
+        print(f"\n⚠ {partition_path(category)} introuvable, étape ignorée.")
         return
 
-    print(f"\nAnalyse de {urbis_geojson.name}…")
-    urbis = gpd.read_file(urbis_geojson)
+    print(f"\nAnalyse de {FIELD_NAME}={category}…")
     print(f"  {len(urbis)} entités UrbIS chargées")
     print(f"  {len(osm_gdf)} points OSM ({main_tag[0]}={main_tag[1]})")
 
@@ -351,14 +436,13 @@ def compare_with_osm():
     print(f"Distance utilisée : {distance_m} m")
 
     CANDIDATES_DIR.mkdir(exist_ok=True)
-    pbf_path = CANDIDATES_DIR / "Brussels-daily.pbf"
-    download_pbf(OSM_PBF_URL, pbf_path)
+    pbf_path = Path(snapshot_path(DAILY_FILENAME, offline=http_cache.is_offline()))
 
     filters = [("natural", "tree"), ("amenity", "bench")]
     osm_data = extract_osm_nodes(pbf_path, filters)
 
     find_candidates(
-        urbis_geojson=OUTPUT_DIR / "TOPO_POINTS_Arbre_haute_tige.geojson",
+        category=TREE_CATEGORY,
         osm_gdf=osm_data[("natural", "tree")],
         distance_m=distance_m,
         main_tag=("natural", "tree"),
@@ -366,7 +450,7 @@ def compare_with_osm():
     )
 
     find_candidates(
-        urbis_geojson=OUTPUT_DIR / "TOPO_POINTS_Banc.geojson",
+        category=BENCH_CATEGORY,
         osm_gdf=osm_data[("amenity", "bench")],
         distance_m=distance_m,
         main_tag=("amenity", "bench"),
@@ -382,24 +466,44 @@ def compare_with_osm():
 # ─────────────────────────────────────────────────────────────────────
 
 def main():
-    needed = [
-        OUTPUT_DIR / "TOPO_POINTS_Arbre_haute_tige.geojson",
-        OUTPUT_DIR / "TOPO_POINTS_Banc.geojson",
-    ]
+    parser = argparse.ArgumentParser(
+        description="UrbIS TOPO_POINTS → GeoParquet + candidats OSM (arbres, bancs)",
+    )
+    parser.add_argument("--geojson", action="store_true",
+                        help=f"Exporter aussi un GeoJSON par catégorie dans ./{OUTPUT_DIR}/")
+    parser.add_argument("--offline", action="store_true",
+                        help="Aucun accès réseau : flux Atom, GPKG et PBF depuis le cache local")
+    args = parser.parse_args()
+    if args.offline:
+        http_cache.set_offline()
+
+    needed = [partition_path(TREE_CATEGORY), partition_path(BENCH_CATEGORY)]
+    if args.geojson:
+        needed.append(OUTPUT_DIR / f"TOPO_POINTS_{TREE_CATEGORY}.geojson")
 
-    if not all(p.exists() for p in needed):
-        with tempfile.TemporaryDirectory(prefix="urbis_") as tmpdir:
-            gpkg_url = fetch_gpkg_url_from_feed(ATOM_FEED_URL)
-            gpkg_path = download_and_extract_gpkg(gpkg_url, tmpdir)
-            layers = list_layers(gpkg_path)
-            layer_map = {l.lower(): l for l in layers}
-            actual_layer = layer_map.get(LAYER_NAME.lower())
-            if actual_layer is None:
-                print(f"\n⚠ La couche '{LAYER_NAME}' n'existe pas dans ce GeoPackage.")
-                sys.exit(1)
-            process_topo_points(gpkg_path, actual_layer)
+    try:
+        gpkg_url = fetch_gpkg_url_from_feed(ATOM_FEED_URL)
+    except requests.RequestException as exc:
+        sys.exit(f"Flux Atom UrbIS indisponible : {exc}")
+    release = release_name(gpkg_url)
+    marker = PARQUET_DIR / SOURCE_MARKER
+    up_to_date = marker.exists() and marker.read_text().strip() == release
+
+    if not (up_to_date and all(p.exists() for p in needed)):
+        try:
+            gpkg_path = download_and_extract_gpkg(gpkg_url)
+        except requests.RequestException as exc:
+            sys.exit(f"Téléchargement du GeoPackage impossible : {exc}")
+        layers = list_layers(gpkg_path)
+        layer_map = {l.lower(): l for l in layers}
+        actual_layer = layer_map.get(LAYER_NAME.lower())
+        if actual_layer is None:
+            print(f"\n⚠ La couche '{LAYER_NAME}' n'existe pas dans ce GeoPackage.")
+            sys.exit(1)
+        process_topo_points(gpkg_path, actual_layer, export_geojson=args.geojson)
+        marker.write_text(release + "\n")
     else:
-        print(f"Fichiers UrbIS déjà présents dans ./{OUTPUT_DIR}/ — étape 1 sautée.")
+        print(f"Partitions UrbIS ({release}) déjà présentes dans ./{PARQUET_DIR}/ — étape 1 sautée.")
 
     compare_with_osm()
 
@@ -0,0 +1,254 @@
+"""
+Amenity / shop counts per commune and arrondissement, for a whole PBF.
+
+amenity_count.py gives one amenity -> count table for the whole file; this
+script answers the regional version of the question in one scan:
+
+  1. one pass over the PBF collects the administrative boundaries
+     (boundary=administrative relations at the requested admin_level,
+     8 = communes, 7 = arrondissements in Belgium) and every tagged
+     amenity / shop as a point (nodes as is, ways and multipolygons by the
+     mean of their outer ring nodes);
+  2. the points are split into blocks and handed to worker processes;
+     each worker holds an STRtree of the boundaries and assigns a whole
+     block to its areas with one bulk point-in-polygon query, then counts
+     it per (area, key, value);
+  3. the partial counts are summed into a tidy long-format table, one row
+     per (admin_level, area, key, value), written as Parquet.
+
+Usage:
+    python amenity/amenity_area_stats.py belgium-latest.osm.pbf
+    python amenity/amenity_area_stats.py belgium-latest.osm.pbf \\
+        --admin-levels 6 7 8 --keys amenity shop --workers 8 \\
+        --output amenity_area_stats.parquet
+
+Reading the result:
+    df = pd.read_parquet("amenity_area_stats.parquet")
+    df[(df.admin_level == 8) & (df.value == "pharmacy")].nlargest(10, "per_km2")
+"""
+
+import argparse
+import os
+import sys
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import osmium
+import pandas as pd
+import shapely
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.projection import to_lambert72, transform_geometry  # noqa: E402
+
+DEFAULT_KEYS = ("amenity", "shop")
+DEFAULT_ADMIN_LEVELS = (7, 8)
+BLOCK_SIZE = 100_000  # points per worker task
+
+
+# ── PBF scan ───────────────────────────────────────────────────────────────────
+class AreaStatsHandler(osmium.SimpleHandler):
+    """Collects admin boundaries and amenity/shop points in a single scan."""
+
+    def __init__(self, keys=DEFAULT_KEYS, admin_levels=DEFAULT_ADMIN_LEVELS):
+        super(AreaStatsHandler, self).__init__()
+        self.keys = tuple(keys)
+        self.admin_levels = {str(level) for level in admin_levels}
+        self.wkb = osmium.geom.WKBFactory()
+        # Points, one entry per (object, key): an object tagged amenity=* and
+        # shop=* is counted under both keys
+        self.lons = array("d")
+        self.lats = array("d")
+        self.key_idx = array("b")
+        self.values: list[str] = []
+        # Boundaries: osm_id, admin_level, name, ref:INS, WKB multipolygon
+        self.boundaries: list[dict] = []
+
+    def _add(self, tags, lon: float, lat: float):
+        for k, key in enumerate(self.keys):
+            value = tags.get(key)
+            if value:
+                self.lons.append(lon)
+                self.lats.append(lat)
+                self.key_idx.append(k)
+                self.values.append(value)
+
+    def _tagged(self, tags) -> bool:
+        return any(key in tags for key in self.keys)
+
+    def node(self, n):
+        if self._tagged(n.tags) and n.location.valid():
+            self._add(n.tags, n.location.lon, n.location.lat)
+
+    def way(self, w):
+        # Closed ways are handled by area()
+        if w.is_closed() or not self._tagged(w.tags):
+            return
+        locs = [(nd.lon, nd.lat) for nd in w.nodes if nd.location.valid()]
+        if locs:
+            lon, lat = np.mean(locs, axis=0)
+            self._add(w.tags, float(lon), float(lat))
+
+    def area(self, a):
+        tags = a.tags
+        if (not a.from_way() and tags.get("boundary") == "administrative"
+                and tags.get("admin_level") in self.admin_levels):
+            try:
+                wkb = self.wkb.create_multipolygon(a)
+            except RuntimeError:
+                return  # incomplete relation at the edge of the extract
+            self.boundaries.append({
+                "area_osm_id": a.orig_id(),
+                "admin_level": int(tags["admin_level"]),
+                "area_name": tags.get("name"),
+                "ref_ins": tags.get("ref:INS"),
+                "wkb": wkb,
+            })
+            return
+
+        if not self._tagged(tags):
+            return
+        locs = [(nd.lon, nd.lat) for ring in a.outer_rings() for nd in ring if nd.location.valid()]
+        if locs:
+            lon, lat = np.mean(locs, axis=0)
+            self._add(tags, float(lon), float(lat))
+
+
+def scan_pbf(pbf: str, keys=DEFAULT_KEYS, admin_levels=DEFAULT_ADMIN_LEVELS) -> AreaStatsHandler:
+    handler = AreaStatsHandler(keys, admin_levels)
+    # Only tagged objects reach the handler (filters=: pyosmium >= 4.0); node
+    # locations are still stored for all nodes, which the way centroids and
+    # boundary rings need
+    handler.apply_file(pbf, locations=True,
+                       filters=[osmium.filter.KeyFilter(*keys, "boundary")])
+    return handler
+
+
+# ── Block workers ──────────────────────────────────────────────────────────────
+_TREES: dict[int, shapely.STRtree] = {}
+
+
+def _init_worker(wkb_by_level: dict[int, list[str]]) -> None:
+    """Builds one STRtree per admin level, once per worker process."""
+    global _TREES
+    _TREES = {
+        level: shapely.STRtree(shapely.from_wkb(wkbs))
+        for level, wkbs in wkb_by_level.items()
+    }
+
+
+def _count_block(lons: np.ndarray, lats: np.ndarray, cats: np.ndarray) -> dict[int, tuple]:
+    """
+    Counts one block of points per (area, category) at every admin level.
+    Returns {level: (area_idx, cat, count, n_outside)}.
+    """
+    points = shapely.points(lons, lats)
+    result = {}
+    for level, tree in _TREES.items():
+        pt_idx, area_idx = tree.query(points, predicate="within")
+        # A point inside overlapping boundaries is counted once, in the first
+        pt_idx, first = np.unique(pt_idx, return_index=True)
+        keys, counts = np.unique(
+            np.column_stack((area_idx[first], cats[pt_idx])), axis=0, return_counts=True,
+        )
+        result[level] = (keys[:, 0], keys[:, 1], counts, len(points) - len(pt_idx))
+    return result
+
+
+def count_by_area(handler: AreaStatsHandler, categories: np.ndarray, workers: int) -> dict[int, tuple]:
+    """Runs _count_block over all blocks and sums the partial counts."""
+    wkb_by_level: dict[int, list[str]] = {}
+    for b in handler.boundaries:
+        wkb_by_level.setdefault(b["admin_level"], []).append(b["wkb"])
+
+    lons = np.frombuffer(handler.lons, dtype=np.float64)
+    lats = np.frombuffer(handler.lats, dtype=np.float64)
+    blocks = [
+        (lons[i:i + BLOCK_SIZE], lats[i:i + BLOCK_SIZE], categories[i:i + BLOCK_SIZE])
+        for i in range(0, len(lons), BLOCK_SIZE)
+    ]
+
+    if workers <= 1 or len(blocks) <= 1:
+        _init_worker(wkb_by_level)
+        partials = [_count_block(*blk) for blk in blocks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(blocks)),
+                                 initializer=_init_worker, initargs=(wkb_by_level,)) as pool:
+            partials = list(pool.map(_count_block, *zip(*blocks)))
+
+    totals = {}
+    for level in sorted(wkb_by_level):
+        parts = [p[level] for p in partials]
+        if not parts:
+            continue
+        area_idx = np.concatenate([p[0] for p in parts])
+        cat = np.concatenate([p[1] for p in parts])
+        count = np.concatenate([p[2] for p in parts])
+        df = (pd.DataFrame({"area_idx": area_idx, "cat": cat, "count": count})
+              .groupby(["area_idx", "cat"], as_index=False)["count"].sum())
+        totals[level] = (df, sum(p[3] for p in parts))
+    return totals
+
+
+# ── Table ──────────────────────────────────────────────────────────────────────
+def build_table(handler: AreaStatsHandler, workers: int) -> pd.DataFrame:
+    values = pd.Categorical(handler.values)
+    keys = np.frombuffer(handler.key_idx, dtype=np.int8)
+    # One category per (key, value) pair
+    cat_codes = keys.astype(np.int64) * len(values.categories) + values.codes
+    cats, categories = np.unique(cat_codes, return_inverse=True)
+    cat_key = [handler.keys[c // len(values.categories)] for c in cats]
+    cat_value = [values.categories[c % len(values.categories)] for c in cats]
+
+    areas = pd.DataFrame(handler.boundaries)
+    geoms = shapely.from_wkb(areas["wkb"].tolist())
+    areas["area_km2"] = shapely.area(transform_geometry(geoms, to_lambert72)) / 1e6
+    areas = areas.drop(columns="wkb")
+
+    frames = []
+    for level, (df, outside) in count_by_area(handler, categories, workers).items():
+        level_areas = areas[areas["admin_level"] == level].reset_index(drop=True)
+        df = df.join(level_areas, on="area_idx")
+        df["key"] = [cat_key[c] for c in df["cat"]]
+        df["value"] = [cat_value[c] for c in df["cat"]]
+        frames.append(df)
+        print(f"  admin_level={level}: {len(level_areas)} areas, "
+              f"{int(df['count'].sum())} objects assigned, {outside} outside every area")
+
+    columns = ["admin_level", "area_osm_id", "area_name", "ref_ins", "area_km2", "key", "value", "count"]
+    if not frames:
+        return pd.DataFrame(columns=columns + ["per_km2"])
+    table = pd.concat(frames, ignore_index=True)[columns]
+    table["per_km2"] = table["count"] / table["area_km2"]
+    return table.sort_values(["admin_level", "area_name", "key", "count"],
+                             ascending=[True, True, True, False], ignore_index=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Amenity / shop counts per administrative area (Parquet).")
+    parser.add_argument("pbf", nargs="?", default="belgium-latest.osm.pbf")
+    parser.add_argument("--keys", nargs="+", default=list(DEFAULT_KEYS),
+                        help="OSM keys to count (default: amenity shop)")
+    parser.add_argument("--admin-levels", nargs="+", type=int, default=list(DEFAULT_ADMIN_LEVELS),
+                        help="admin_level of the areas (default: 7 8, arrondissements and communes)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="processes for the point-in-area assignment")
+    parser.add_argument("--output", default="amenity_area_stats.parquet")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    print(f"Scanning {args.pbf}...")
+    handler = scan_pbf(args.pbf, args.keys, args.admin_levels)
+    print(f"  {len(handler.values)} {'/'.join(args.keys)} objects, "
+          f"{len(handler.boundaries)} boundaries ({time.perf_counter() - t0:.1f} s)")
+    if not handler.boundaries:
+        sys.exit(f"No boundary=administrative relation with admin_level in {args.admin_levels} in {args.pbf}")
+
+    table = build_table(handler, args.workers)
+    table.to_parquet(args.output, index=False)
+    print(f"{len(table)} rows saved to {args.output} ({time.perf_counter() - t0:.1f} s)")
+
+
+if __name__ == "__main__":
+    main()
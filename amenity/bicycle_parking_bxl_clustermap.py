@@ -1,9 +1,13 @@
 # Import necessary libraries
+import os
+import sys
 import osmium as o
 import folium
-from folium.plugins import MarkerCluster
 import shapely.wkb as wkblib
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.cluster_map import add_precomputed_clusters  # noqa: E402
+
 # Create a WKBFactory instance for handling geometries
 wkbfab = o.geom.WKBFactory()
 
@@ -53,19 +57,21 @@ def main():
     # Create a folium map centered around the first amenity
     if handler.amenities:
         map_center = handler.amenities[0]['location']
-        my_map = folium.Map(location=map_center, zoom_start=14)
-
-        # Create a MarkerCluster layer for better performance
-        marker_cluster = MarkerCluster().add_to(my_map)
+        my_map = folium.Map(location=map_center, zoom_start=14, prefer_canvas=True)
 
-        # Add markers for each bicycle parking amenity
+        # Popup text for each bicycle parking amenity
+        popups = []
         for amenity in handler.amenities:
             popup_content = f"{amenity['amenity_type']}: {amenity['name']}"
             if amenity['capacity']:
                 popup_content += f"<br>Capacity: {amenity['capacity']}"
-            folium.Marker(location=amenity['location'],
-                          popup=popup_content,
-                          icon=None).add_to(marker_cluster)
+            popups.append(popup_content)
+
+        # Clusters are precomputed per zoom level, so the HTML stays small
+        # and fast whatever the number of parkings
+        lats = [amenity['location'][0] for amenity in handler.amenities]
+        lons = [amenity['location'][1] for amenity in handler.amenities]
+        add_precomputed_clusters(my_map, lats, lons, popups)
 
         # Save the map to an HTML file
         my_map.save('bicycle_parking_map.html')
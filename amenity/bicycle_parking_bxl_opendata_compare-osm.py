@@ -1,13 +1,26 @@
 # This script analyse opendata about bicycle parking in Brussels
 # input file can be found here : https://datastore.brussels/web/data/dataset/9ae57108-6bc4-4793-bd8e-93c1d28e1183
+# (local path or GeoServer GetFeature URL, set with BICYCLE_PARKING_JSON)
 # can also work for https://datastore.brussels/web/data/dataset/39b2a24f-7263-42a1-b381-1a70d2098a06 but you need to change capacity
 # <tag k="capacity" v="{json_node["properties"].get("capacity", "")}"/>\n') by get capacity_classic
 
 import json
+import os
+import sys
+import numpy as np
 import pandas as pd
 import osmium as o
-from geopy.distance import geodesic
-from pyproj import Transformer
+from scipy.spatial import cKDTree
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.snapshot_store import DAILY_FILENAME, snapshot_path  # noqa: E402
+from common import http_cache  # noqa: E402
+from common.matching import optimal_pairs  # noqa: E402
+from common.projection import from_lambert72  # noqa: E402
+from conflation import deduplicate_indices, project_lat_lon  # noqa: E402
+
+# Features closer than this (in meters) are the same parking described twice
+DEDUP_RADIUS_M = 1.0
 
 # Class to handle processing of OpenStreetMap (OSM) bicycle parking data
 class BicycleParkingHandler(o.SimpleHandler):
@@ -37,17 +50,30 @@ class BicycleParkingMatcher:
         self.handler = BicycleParkingHandler()
         # DataFrame to store matched bicycle parking data
         self.matched_df = None
+        # Result of the last match: parameters it was computed for and matched JSON indices
+        self._match_key = None
+        self._matched_json = set()
 
     # Process JSON data, transform coordinates, and return features
     def read_json_data(self):
         print("Reading JSON data...")
-        with open(self.json_file_path, 'r') as json_file:
-            json_data = json.load(json_file)
-            for feature in json_data['features']:
-                coordinates = feature['geometry']['coordinates']
-                lon, lat = self.transform_coordinates(coordinates[0], coordinates[1])
-                feature['geometry']['coordinates'] = [lat, lon]
-        return json_data['features']
+        if self.json_file_path.startswith(('http://', 'https://')):
+            # GeoServer WFS URL: fetched through the shared HTTP cache
+            json_data = http_cache.get(self.json_file_path, ttl=24 * 3600).json()
+        else:
+            with open(self.json_file_path, 'r') as json_file:
+                json_data = json.load(json_file)
+        features = json_data['features']
+        xs = np.array([f['geometry']['coordinates'][0] for f in features], dtype=float)
+        ys = np.array([f['geometry']['coordinates'][1] for f in features], dtype=float)
+        lons, lats = self.transform_coordinates(xs, ys)
+        for feature, lat, lon in zip(features, lats, lons):
+            feature['geometry']['coordinates'] = [float(lat), float(lon)]
+        # Drop exact duplicates, the first feature of each group is kept
+        keep = deduplicate_indices(lats, lons, DEDUP_RADIUS_M)
+        if len(keep) < len(features):
+            print(f"Removed {len(features) - len(keep)} duplicate features (within {DEDUP_RADIUS_M} m)")
+        return [features[i] for i in keep]
 
     # Read OSM data using the specified handler
     def read_osm_data(self):
@@ -56,34 +82,68 @@ class BicycleParkingMatcher:
         o.apply(osm_file, self.handler)
         osm_file.close()
 
-    # Match bicycle parking nodes between JSON and OSM data
-    def match_bicycle_parking(self, bicycle_parking_nodes, max_data_count, threshold_meters):
-        print("Matching bicycle parking nodes...")
-        matched_data = []
-
-        for json_node in bicycle_parking_nodes[:max_data_count]:
-            json_location = tuple(json_node['geometry']['coordinates'])
+    # Find every (JSON feature, OSM node) pair closer than the threshold,
+    # or only optimal exclusive pairs when one_to_one is set
+    def _match(self, bicycle_parking_nodes, max_data_count, threshold_meters, one_to_one=False):
+        key = (id(bicycle_parking_nodes), max_data_count, threshold_meters, one_to_one)
+        if self._match_key == key:
+            return self.matched_df
 
-            for osm_node_id, osm_node_info in self.handler.bicycle_parking_cache.items():
-                osm_location = osm_node_info['location']
-                distance = geodesic(json_location, osm_location).meters
+        json_nodes = bicycle_parking_nodes[:max_data_count]
+        osm_ids = list(self.handler.bicycle_parking_cache)
+        matched_data = []
 
+        if json_nodes and osm_ids:
+            json_lat_lon = np.array([n['geometry']['coordinates'] for n in json_nodes], dtype=float)
+            osm_lat_lon = np.array([self.handler.bicycle_parking_cache[i]['location'] for i in osm_ids],
+                                   dtype=float)
+            ref_lat = float(osm_lat_lon[:, 0].mean())
+            json_xy = project_lat_lon(json_lat_lon[:, 0], json_lat_lon[:, 1], ref_lat)
+            osm_xy = project_lat_lon(osm_lat_lon[:, 0], osm_lat_lon[:, 1], ref_lat)
+
+            if one_to_one:
+                pairs = sorted(optimal_pairs(json_xy, osm_xy, threshold_meters))
+            else:
+                pairs = []
+                osm_tree = cKDTree(osm_xy)
+                for json_idx, candidates in enumerate(osm_tree.query_ball_point(json_xy, r=threshold_meters)):
+                    if not candidates:
+                        continue
+                    distances = np.linalg.norm(osm_xy[candidates] - json_xy[json_idx], axis=1)
+                    pairs += sorted(((json_idx, c, d) for c, d in zip(candidates, distances)),
+                                    key=lambda p: p[2])
+
+            for json_idx, osm_idx, distance in pairs:
                 if distance < threshold_meters:
                     matched_data.append({
-                        'JSON_ID': json_node['id'],
-                        'OSM_Node_ID': osm_node_id,
-                        'Distance': distance
+                        'JSON_ID': json_nodes[json_idx]['id'],
+                        'OSM_Node_ID': osm_ids[osm_idx],
+                        'Distance': round(float(distance), 2),
+                        '_json_idx': json_idx,
                     })
-                    print(f"Bicycle parking found - OSM ID: {osm_node_id}, JSON ID: {json_node['id']}, Distance: {distance} meters")
 
-        self.matched_df = pd.DataFrame(matched_data)
-        self.matched_df.to_csv(self.output_csv_file_path, index=False)
+        self.matched_df = pd.DataFrame(matched_data, columns=['JSON_ID', 'OSM_Node_ID', 'Distance', '_json_idx'])
+        self._matched_json = set(self.matched_df['_json_idx'])
+        self._match_key = key
+        print(f"{len(self._matched_json)}/{len(json_nodes)} JSON features have an OSM node "
+              f"within {threshold_meters} m ({len(self.matched_df)} pairs)")
+        return self.matched_df
+
+    # Match bicycle parking nodes between JSON and OSM data
+    def match_bicycle_parking(self, bicycle_parking_nodes, max_data_count, threshold_meters, one_to_one=False):
+        print("Matching bicycle parking nodes..." + (" (one-to-one)" if one_to_one else ""))
+        matched_df = self._match(bicycle_parking_nodes, max_data_count, threshold_meters, one_to_one)
+        matched_df.drop(columns='_json_idx').to_csv(self.output_csv_file_path, index=False)
         print(f"Matching data saved to {self.output_csv_file_path}")
 
     # Generate an unmatched OSM file for specified nodes
-    def generate_unmatched_osm_file(self, bicycle_parking_nodes, max_data_count, threshold_meters, start_node_id):
-        print(f"Generating Unmatched OSM file for the first {max_data_count} bicycle parking nodes...")
+    def generate_unmatched_osm_file(self, bicycle_parking_nodes, max_data_count, threshold_meters, start_node_id,
+                                    one_to_one=False):
+        scope = 'all' if max_data_count is None else f'the first {max_data_count}'
+        print(f"Generating Unmatched OSM file for {scope} bicycle parking nodes...")
         unmatched_osm_file_path = self.unmatched_osm_file_path
+        # Reuses the match computed for the CSV when the parameters are the same
+        self._match(bicycle_parking_nodes, max_data_count, threshold_meters, one_to_one)
 
         with open(unmatched_osm_file_path, 'w') as osm_file:
             osm_file.write('<?xml version="1.0" encoding="UTF-8"?>\n')
@@ -92,57 +152,47 @@ class BicycleParkingMatcher:
             node_id_counter = start_node_id  # Always start with a positive node ID (1)
             unmatched_count = 0
 
-            for json_node in bicycle_parking_nodes[:max_data_count]:
-                json_location = tuple(json_node['geometry']['coordinates'])
-                is_matched = False
-
-                for osm_node_id, osm_node_info in self.handler.bicycle_parking_cache.items():
-                    osm_location = osm_node_info['location']
-                    distance = geodesic(json_location, osm_location).meters
-
-                    if distance < threshold_meters:
-                        is_matched = True
-                        break
+            for json_idx, json_node in enumerate(bicycle_parking_nodes[:max_data_count]):
+                if json_idx in self._matched_json:
+                    continue
 
-                if not is_matched:
-                    lat, lon = json_location
-                    osm_file.write(f'  <node id="{node_id_counter}" lat="{lat}" lon="{lon}" version="1">\n')
-                    osm_file.write(f'    <tag k="amenity" v="bicycle_parking"/>\n')
-                    osm_file.write(f'    <tag k="capacity" v="{json_node["properties"].get("capacity", "")}"/>\n')
+                lat, lon = json_node['geometry']['coordinates']
+                osm_file.write(f'  <node id="{node_id_counter}" lat="{lat}" lon="{lon}" version="1">\n')
+                osm_file.write('    <tag k="amenity" v="bicycle_parking"/>\n')
+                osm_file.write(f'    <tag k="capacity" v="{json_node["properties"].get("capacity", "")}"/>\n')
 
-                    covered_value = 'yes' if json_node['properties'].get('cover', 0) == 1 else 'no'
-                    osm_file.write(f'    <tag k="covered" v="{covered_value}"/>\n')
+                covered_value = 'yes' if json_node['properties'].get('cover', 0) == 1 else 'no'
+                osm_file.write(f'    <tag k="covered" v="{covered_value}"/>\n')
 
-                    type_value = json_node["properties"].get("type", 0)
-                    if type_value in [1, 2]:
-                        osm_file.write(f'    <tag k="bicycle_parking" v="stands"/>\n')
+                type_value = json_node["properties"].get("type", 0)
+                if type_value in [1, 2]:
+                    osm_file.write('    <tag k="bicycle_parking" v="stands"/>\n')
 
-                    osm_file.write('  </node>\n')
+                osm_file.write('  </node>\n')
 
-                    # Increment the node ID for the next unmatched node
-                    node_id_counter += 1
-                    unmatched_count += 1
+                # Increment the node ID for the next unmatched node
+                node_id_counter += 1
+                unmatched_count += 1
 
             osm_file.write('</osm>\n')
 
-        print(f"Unmatched OSM file generated and saved to {unmatched_osm_file_path}")
+        print(f"Unmatched OSM file generated and saved to {unmatched_osm_file_path} ({unmatched_count} nodes)")
 
-    # Transform coordinates from one projection to another
+    # Transform coordinates (scalars or arrays) from Belgian Lambert 72 to WGS84
     def transform_coordinates(self, x, y):
-        in_proj = 'EPSG:31370'
-        out_proj = 'EPSG:4326'
-        transformer = Transformer.from_crs(in_proj, out_proj, always_xy=True)
-        return transformer.transform(x, y)
+        return from_lambert72(x, y)
 
 if __name__ == "__main__":
     # Main script execution
-    json_path = 'geoserver-GetFeature.application.json'
-    pbf_path = 'brussels_capital_region.pbf'
+    json_path = os.environ.get('BICYCLE_PARKING_JSON', 'geoserver-GetFeature.application.json')
+    pbf_path = snapshot_path(DAILY_FILENAME)
     output_csv_path = 'matched_bicycle_parking.csv'
     unmatched_osm_path = 'unmatched_bicycle_parking.osm'
 
-    max_data_count = int(input("Enter the maximum data count: "))
+    max_data_count = input("Enter the maximum data count (enter for all): ").strip()
+    max_data_count = int(max_data_count) if max_data_count else None
     threshold_meters = float(input("Enter the threshold distance in meters: "))
+    one_to_one = input("One-to-one matching, each OSM node used once (y/n)? [n]: ").strip().lower() == 'y'
 
     # Always start with a positive node ID (1)
     start_node_id = 1
@@ -154,5 +204,6 @@ if __name__ == "__main__":
 
     bicycle_parking_nodes = bike_parking_matcher.read_json_data()
     bike_parking_matcher.read_osm_data()
-    bike_parking_matcher.match_bicycle_parking(bicycle_parking_nodes, max_data_count, threshold_meters)
-    bike_parking_matcher.generate_unmatched_osm_file(bicycle_parking_nodes, max_data_count, threshold_meters, start_node_id)
+    bike_parking_matcher.match_bicycle_parking(bicycle_parking_nodes, max_data_count, threshold_meters, one_to_one)
+    bike_parking_matcher.generate_unmatched_osm_file(bicycle_parking_nodes, max_data_count, threshold_meters,
+                                                     start_node_id, one_to_one)
@@ -0,0 +1,783 @@
+#!/usr/bin/env python3
+"""
+Moteur de conflation OpenData <-> OpenStreetMap
+  • Jeux de données : adaptateurs déclarés dans conflation_datasets.py
+                      (fetch + parse, prédicat de tags OSM, tags attendus)
+  • OpenStreetMap   : Brussels-daily.pbf (common.snapshot_store)
+
+Toutes les comparaisons configurées partagent UN SEUL passage sur le PBF :
+chaque nœud / way est testé contre le prédicat de chaque adaptateur, et
+les tags ne sont copiés que pour les objets retenus. L'appariement se fait
+ensuite par catégorie, avec un KDTree par catégorie sur des coordonnées
+projetées en mètres (approximation équirectangulaire, valide à l'échelle
+d'une ville).
+
+Classification par PRÉSENCE (non exclusive) : voir la note de conception de
+recycling-netbrussels-opendata-compare-osm.py.
+
+Fichiers produits (un dossier par jeu de données, dans --output-dir) :
+  <nom>/report.txt               — rapport lisible
+  <nom>/report.json              — rapport structuré
+  <nom>/missing_in_osm.geojson   — points OpenData sans nœud OSM proche
+  <nom>/missing_in_opendata.geojson
+  <nom>/tag_issues.geojson       — tags corrigés, prêts pour JOSM
+
+Usage :
+  python amenity/conflation.py                      # tous les jeux de données
+  python amenity/conflation.py glass_bins cambio    # sélection
+  python amenity/conflation.py --list
+  python amenity/conflation.py --trend --since 2015-01-01   # voir conflation_trend.py
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+from array import array
+from dataclasses import asdict, dataclass, field, replace
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+import numpy as np
+import osmium
+from scipy.spatial import cKDTree
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT  = os.path.join(SCRIPT_DIR, "..")
+
+sys.path.insert(0, REPO_ROOT)
+from common.matching import optimal_pairs  # noqa: E402
+from common.projection import equirectangular  # noqa: E402
+
+
+# ── Structures de données ──────────────────────────────────────────────────────
+@dataclass(kw_only=True)
+class RefPoint:
+    """Point d'un jeu de données de référence (OpenData)."""
+    uid:   str
+    lat:   float
+    lon:   float
+    props: dict = field(default_factory=dict)
+    # Nœud OSM le plus proche (non-exclusif : plusieurs OD peuvent partager le même)
+    nearest_osm_id:   Optional[int]   = None
+    nearest_osm_type: Optional[str]   = None
+    nearest_osm_dist: Optional[float] = None
+
+
+@dataclass(kw_only=True)
+class OSMPoint:
+    osm_id:   int
+    osm_type: str
+    lat:      float
+    lon:      float
+    tags:     dict = field(default_factory=dict)
+    # Point OpenData le plus proche (non-exclusif)
+    nearest_od_uid:  Optional[str]   = None
+    nearest_od_dist: Optional[float] = None
+
+
+# ── Projection équirectangulaire (mètres) ──────────────────────────────────────
+def project_lat_lon(lats, lons, ref_lat: Optional[float] = None) -> np.ndarray:
+    """
+    Projection plane locale (common.projection.equirectangular), valide à
+    l'échelle d'une ville : tableau (n, 2) en mètres.
+    """
+    return np.column_stack(equirectangular(lons, lats, ref_lat))
+
+
+def project_points(pts: list, ref_lat: Optional[float] = None) -> np.ndarray:
+    return project_lat_lon([p.lat for p in pts], [p.lon for p in pts], ref_lat)
+
+
+def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Distance exacte entre deux points (contrôles ponctuels)."""
+    R  = 6_371_000
+    p1 = math.radians(lat1)
+    p2 = math.radians(lat2)
+    dp = math.radians(lat2 - lat1)
+    dl = math.radians(lon2 - lon1)
+    a  = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return R * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+# ── Déduplication (vrais doublons exacts uniquement) ──────────────────────────
+def deduplicate_indices(lats, lons, radius_m: float) -> np.ndarray:
+    """
+    Indices (croissants) des points à garder.
+
+    Même règle que la double boucle historique : on parcourt les points dans
+    l'ordre, chaque point gardé écarte ses voisins à moins de radius_m, et
+    un point écarté n'écarte personne. A-B et B-C à 0,9 m avec A-C à 1,8 m
+    (rayon 1 m) gardent donc A et C. Les voisins viennent de
+    KDTree.query_pairs sur les coordonnées projetées : seuls les points qui
+    ont un voisin passent par la boucle, ~ O(n log n) au lieu de O(n²).
+    """
+    n = len(lats)
+    if n < 2:
+        return np.arange(n)
+
+    xy = project_lat_lon(lats, lons)
+    pairs = cKDTree(xy).query_pairs(radius_m, output_type="ndarray")
+    if not len(pairs):
+        return np.arange(n)
+
+    # Listes de voisins (les deux sens), groupées par point
+    src = np.concatenate((pairs[:, 0], pairs[:, 1]))
+    dst = np.concatenate((pairs[:, 1], pairs[:, 0]))
+    order = np.argsort(src, kind="stable")
+    src, dst = src[order], dst[order]
+    bounds = np.searchsorted(src, np.arange(n + 1))
+
+    dropped = np.zeros(n, dtype=bool)
+    for i in np.unique(src).tolist():      # ordre croissant : "le premier gagne"
+        if not dropped[i]:
+            dropped[dst[bounds[i]:bounds[i + 1]]] = True
+    return np.flatnonzero(~dropped)
+
+
+def deduplicate(pts: list, radius_m: float, label: str = "OpenData") -> list:
+    """
+    Supprime uniquement les entrées quasi-identiques en coordonnées (même
+    objet physique décrit deux fois). Le premier point rencontré est gardé.
+    """
+    keep = deduplicate_indices([p.lat for p in pts], [p.lon for p in pts], radius_m)
+    kept = [pts[i] for i in keep]
+
+    removed = len(pts) - len(kept)
+    if removed:
+        print(f"  -> {removed} doublon(s) {label} supprimes "
+              f"(meme emplacement a moins de {radius_m} m)")
+    return kept
+
+
+def benchmark_dedup(sizes: list[int], radius_m: float = 2.0, dup_ratio: float = 0.05) -> None:
+    """
+    Points aléatoires sur l'emprise de Bruxelles, dont dup_ratio de copies
+    décalées de moins d'un mètre. La double boucle haversine historique
+    n'est mesurée que jusqu'à 5 000 points.
+    """
+    import time
+
+    rng = np.random.default_rng(0)
+    print(f"{'n':>9s} {'doublons':>9s} {'KDTree (s)':>11s} {'O(n²) (s)':>10s}")
+    for n in sizes:
+        base = n - int(n * dup_ratio)
+        lats = rng.uniform(50.76, 50.92, base)
+        lons = rng.uniform(4.24, 4.48, base)
+        src  = rng.integers(0, base, n - base)
+        lats = np.concatenate((lats, lats[src] + rng.uniform(-4e-6, 4e-6, len(src))))
+        lons = np.concatenate((lons, lons[src] + rng.uniform(-6e-6, 6e-6, len(src))))
+
+        t0 = time.perf_counter()
+        keep = deduplicate_indices(lats, lons, radius_m)
+        t_kd = time.perf_counter() - t0
+
+        t_naive = "-"
+        if n <= 5_000:
+            t0 = time.perf_counter()
+            absorbed: set[int] = set()
+            for i in range(n):
+                if i in absorbed:
+                    continue
+                for j in range(i + 1, n):
+                    if j not in absorbed and haversine_m(lats[i], lons[i], lats[j], lons[j]) <= radius_m:
+                        absorbed.add(j)
+            t_naive = f"{time.perf_counter() - t0:10.2f}"
+        print(f"{n:9d} {n - len(keep):9d} {t_kd:11.3f} {t_naive:>10s}")
+
+
+# ── Appariement : plus-proche-voisin (non-exclusif) ou 1-à-1 optimal ──────────
+def spatial_match(
+    od_list: list,
+    osm_list: "OSMColumns | list[OSMPoint]",
+    threshold_m: float,
+    one_to_one: bool = False,
+) -> None:
+    """
+    Par défaut (présence) :
+      pour chaque point OpenData, le nœud OSM le plus proche (KDTree) ;
+      pour chaque nœud OSM, le point OpenData le plus proche (KDTree).
+      Les deux recherches sont indépendantes et NON exclusives.
+
+    one_to_one=True : paires exclusives, globalement optimales (nombre de
+    paires maximal puis distance totale minimale), calculées sur le graphe
+    creux des candidats à moins de threshold_m (common.matching).
+
+    Renseigne nearest_osm_* sur les points OpenData et nearest_od_* sur
+    les points OSM (pour un OSMColumns : sur les objets de points()).
+    """
+    mode = "1-a-1 optimal" if one_to_one else "KDTree"
+    print(f"Appariement spatial {mode} (seuil = {threshold_m} m) ...")
+
+    if not od_list or not osm_list:
+        print("  -> liste vide, rien a apparier")
+        return
+
+    if isinstance(osm_list, OSMColumns):
+        # coordonnées déjà en tableaux : pas de conversion objet par objet
+        ref_lat  = float(osm_list.lats.mean())
+        osm_xy   = osm_list.xy(ref_lat)
+        osm_list = osm_list.points()
+    else:
+        ref_lat = sum(p.lat for p in osm_list) / len(osm_list)
+        osm_xy  = project_points(osm_list, ref_lat)
+    od_xy = project_points(od_list, ref_lat)
+
+    if one_to_one:
+        for i, j, d in optimal_pairs(od_xy, osm_xy, threshold_m):
+            od, osm = od_list[i], osm_list[j]
+            od.nearest_osm_id   = osm.osm_id
+            od.nearest_osm_type = osm.osm_type
+            od.nearest_osm_dist = round(d, 1)
+            osm.nearest_od_uid  = od.uid
+            osm.nearest_od_dist = round(d, 1)
+    else:
+        osm_tree = cKDTree(osm_xy)
+        od_tree  = cKDTree(od_xy)
+
+        # OD -> nœud OSM le plus proche
+        dists, idxs = osm_tree.query(od_xy, k=1)
+        for od, d, idx in zip(od_list, dists, idxs):
+            if d <= threshold_m:
+                osm = osm_list[idx]
+                od.nearest_osm_id   = osm.osm_id
+                od.nearest_osm_type = osm.osm_type
+                od.nearest_osm_dist = round(float(d), 1)
+
+        # OSM -> point OpenData le plus proche
+        dists, idxs = od_tree.query(osm_xy, k=1)
+        for osm, d, idx in zip(osm_list, dists, idxs):
+            if d <= threshold_m:
+                od = od_list[idx]
+                osm.nearest_od_uid  = od.uid
+                osm.nearest_od_dist = round(float(d), 1)
+
+    n_od_matched  = sum(1 for p in od_list  if p.nearest_osm_id is not None)
+    n_osm_matched = sum(1 for p in osm_list if p.nearest_od_uid is not None)
+    print(f"  -> {n_od_matched}/{len(od_list)} points OpenData ont un noeud OSM a proximite")
+    print(f"  -> {n_osm_matched}/{len(osm_list)} noeuds OSM ont un point OpenData a proximite")
+
+
+# ── Évaluation de la qualité des tags ──────────────────────────────────────────
+def assess_tags(
+    tags: dict,
+    required: dict[str, str],
+    expected: dict[str, str],
+    case_insensitive: bool = False,
+) -> tuple[list[str], list[str]]:
+    """Erreurs = tags obligatoires incorrects ; avertissements = tags attendus."""
+    errors:   list[str] = []
+    warnings: list[str] = []
+
+    for key, value in required.items():
+        actual = tags.get(key)
+        if actual != value:
+            errors.append(f"{key}={value!r}  ->  actuel : {actual!r}")
+
+    for key, value in expected.items():
+        actual = tags.get(key)
+        if actual is None:
+            warnings.append(f"{key} absent (attendu : {value!r})")
+        elif (actual.lower() != value.lower()) if case_insensitive else (actual != value):
+            warnings.append(f"{key}={actual!r}  !=  {value!r}")
+
+    return errors, warnings
+
+
+# ── GeoJSON ────────────────────────────────────────────────────────────────────
+def feature_collection(features: list) -> str:
+    return json.dumps(
+        {"type": "FeatureCollection", "features": features},
+        ensure_ascii=False,
+        indent=2,
+    )
+
+
+def point_feature(lat: float, lon: float, properties: dict) -> dict:
+    return {
+        "type": "Feature",
+        "geometry": {"type": "Point",
+                     "coordinates": [round(lon, 7), round(lat, 7)]},
+        "properties": properties,
+    }
+
+
+# ── Adaptateurs ────────────────────────────────────────────────────────────────
+@dataclass
+class DatasetAdapter:
+    """
+    Décrit une comparaison OpenData <-> OSM.
+
+    fetch       : télécharge et parse le jeu de données -> list[RefPoint]
+    osm_filter  : prédicat sur les tags OSM (osmium TagList ou dict)
+    required    : tags obligatoires (erreur si différents)
+    expected    : tags attendus (avertissement si absents / différents)
+    new_tags    : tags à proposer pour un point absent d'OSM (défaut : required + expected)
+    assess      : évaluation spécifique (tags, ref) -> (erreurs, avertissements)
+    corrected   : tags corrigés spécifiques (tags, ref) -> dict
+    describe    : ligne de rapport décrivant un point de référence
+    one_to_one  : paires exclusives optimales au lieu du plus-proche-voisin
+    """
+    name:            str
+    title:           str
+    fetch:           Callable[[], list]
+    osm_filter:      Callable[[object], bool]
+    required:        dict = field(default_factory=dict)
+    expected:        dict = field(default_factory=dict)
+    threshold_m:     float = 50.0
+    dedup_radius_m:  float = 2.0
+    case_insensitive: bool = False
+    one_to_one:      bool = False
+    new_tags:        Optional[Callable[[RefPoint], dict]] = None
+    assess:          Optional[Callable[[dict, RefPoint], tuple[list[str], list[str]]]] = None
+    corrected:       Optional[Callable[[dict, RefPoint], dict]] = None
+    describe:        Optional[Callable[[RefPoint], str]] = None
+
+    def tags_for_new(self, p: RefPoint) -> dict:
+        if self.new_tags:
+            return self.new_tags(p)
+        return {**self.required, **self.expected}
+
+    def assess_tags(self, tags: dict, p: RefPoint) -> tuple[list[str], list[str]]:
+        if self.assess:
+            return self.assess(tags, p)
+        return assess_tags(tags, self.required, self.expected, self.case_insensitive)
+
+    def corrected_tags(self, tags: dict, p: RefPoint) -> dict:
+        if self.corrected:
+            return self.corrected(tags, p)
+        return {**tags, **self.required, **self.expected}
+
+    def describe_ref(self, p: RefPoint) -> str:
+        if self.describe:
+            return self.describe(p)
+        return ", ".join(f"{k}={v}" for k, v in p.props.items() if v) or p.uid
+
+
+# ── Objets OSM retenus, en colonnes ────────────────────────────────────────────
+OSM_TYPES = ("node", "way")
+
+
+class OSMColumns:
+    """
+    Objets OSM retenus par un adaptateur, stockés en colonnes : identifiants,
+    types et coordonnées dans des tableaux typés extensibles (array), tags
+    seulement pour ces objets. lats / lons / xy() sont des vues NumPy qui
+    alimentent directement le KDTree ; les OSMPoint ne sont créés qu'à la
+    demande (points()), pour les rapports.
+    """
+    __slots__ = ("_ids", "_types", "_lats", "_lons", "tags", "_points")
+
+    def __init__(self):
+        self._ids   = array("q")
+        self._types = array("b")
+        self._lats  = array("d")
+        self._lons  = array("d")
+        self.tags: list[dict] = []
+        self._points: Optional[list[OSMPoint]] = None
+
+    def append(self, osm_id: int, osm_type: int, lat: float, lon: float, tags: dict) -> None:
+        self._ids.append(osm_id)
+        self._types.append(osm_type)
+        self._lats.append(lat)
+        self._lons.append(lon)
+        self.tags.append(tags)
+        self._points = None
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @property
+    def ids(self) -> np.ndarray:
+        return np.frombuffer(self._ids, dtype=np.int64)
+
+    @property
+    def lats(self) -> np.ndarray:
+        return np.frombuffer(self._lats, dtype=np.float64)
+
+    @property
+    def lons(self) -> np.ndarray:
+        return np.frombuffer(self._lons, dtype=np.float64)
+
+    def xy(self, ref_lat: Optional[float] = None) -> np.ndarray:
+        return project_lat_lon(self.lats, self.lons, ref_lat)
+
+    def points(self) -> list[OSMPoint]:
+        """Une liste d'OSMPoint, créée une fois puis partagée (champs nearest_*)."""
+        if self._points is None:
+            self._points = [
+                OSMPoint(osm_id=i, osm_type=OSM_TYPES[t], lat=lat, lon=lon, tags=tags)
+                for i, t, lat, lon, tags in zip(self._ids, self._types, self._lats, self._lons, self.tags)
+            ]
+        return self._points
+
+    def to_dict(self) -> dict:
+        return {"ids": self._ids.tolist(), "types": self._types.tolist(),
+                "lats": self._lats.tolist(), "lons": self._lons.tolist(), "tags": self.tags}
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "OSMColumns":
+        cols = cls()
+        cols._ids.fromlist(d["ids"])
+        cols._types.fromlist(d["types"])
+        cols._lats.fromlist(d["lats"])
+        cols._lons.fromlist(d["lons"])
+        cols.tags = d["tags"]
+        return cols
+
+
+def as_points(osm) -> list[OSMPoint]:
+    return osm.points() if isinstance(osm, OSMColumns) else osm
+
+
+# ── Lecture du PBF OSM : un seul passage pour tous les adaptateurs ─────────────
+class MultiDatasetHandler(osmium.SimpleHandler):
+    """
+    Teste chaque nœud / way contre le prédicat de chaque adaptateur,
+    directement sur la TagList osmium (aucune copie des tags avant le test).
+    Les tags ne sont copiés (dict) que pour les objets retenus.
+    """
+
+    def __init__(self, adapters: list[DatasetAdapter]):
+        super().__init__()
+        self.adapters = adapters
+        self.cols: dict[str, OSMColumns] = {a.name: OSMColumns() for a in adapters}
+
+    def _matching(self, tags) -> list[DatasetAdapter]:
+        return [a for a in self.adapters if a.osm_filter(tags)]
+
+    def node(self, n):
+        if not n.tags:
+            return
+        hits = self._matching(n.tags)
+        if not hits:
+            return
+        tags = dict(n.tags)
+        lat, lon = n.location.lat, n.location.lon
+        for a in hits:
+            self.cols[a.name].append(n.id, 0, lat, lon, tags)
+
+    def way(self, w):
+        if not w.tags:
+            return
+        hits = self._matching(w.tags)
+        if not hits:
+            return
+        try:
+            valid = [(nd.lat, nd.lon) for nd in w.nodes if nd.location.valid()]
+        except Exception as exc:
+            print(f"  ! way/{w.id} ignore : {exc}")
+            return
+        if not valid:
+            return
+        lat = sum(p[0] for p in valid) / len(valid)
+        lon = sum(p[1] for p in valid) / len(valid)
+        tags = dict(w.tags)
+        for a in hits:
+            self.cols[a.name].append(w.id, 1, lat, lon, tags)
+
+
+def scan_osm(pbf: str, adapters: list[DatasetAdapter]) -> dict[str, OSMColumns]:
+    """Un seul décodage du PBF, quel que soit le nombre d'adaptateurs."""
+    pbf = os.path.realpath(pbf)
+    if not os.path.exists(pbf):
+        sys.exit(f"Fichier PBF introuvable : {pbf}")
+    size_mb = os.path.getsize(pbf) / 1_048_576
+    print(f"OSM PBF : {pbf}  ({size_mb:.1f} Mo)")
+    handler = MultiDatasetHandler(adapters)
+    handler.apply_file(pbf, locations=True)
+    for a in adapters:
+        print(f"  -> {len(handler.cols[a.name])} objets OSM pour {a.name}")
+    return handler.cols
+
+
+# ── Rapport générique ──────────────────────────────────────────────────────────
+@dataclass
+class Comparison:
+    """Résultat de l'appariement d'un adaptateur (après spatial_match)."""
+    missing_in_osm: list
+    missing_in_od:  list
+    matched:        list
+    tag_results:    list   # (ref, osm, erreurs, avertissements)
+    stats:          dict
+
+
+def evaluate(adapter: DatasetAdapter, od_list: list, osm_list: "OSMColumns | list[OSMPoint]") -> Comparison:
+    osm_list = as_points(osm_list)
+    by_osm_id = {(p.osm_type, p.osm_id): p for p in osm_list}
+
+    missing_in_osm = [p for p in od_list  if p.nearest_osm_id is None]
+    missing_in_od  = [p for p in osm_list if p.nearest_od_uid is None]
+    matched        = [p for p in od_list  if p.nearest_osm_id is not None]
+
+    tag_results = []
+    cnt_ok = cnt_warn = cnt_err = 0
+    for od in matched:
+        osm = by_osm_id[(od.nearest_osm_type, od.nearest_osm_id)]
+        errs, warns = adapter.assess_tags(osm.tags, od)
+        if errs:
+            cnt_err  += 1
+        elif warns:
+            cnt_warn += 1
+        else:
+            cnt_ok   += 1
+        tag_results.append((od, osm, errs, warns))
+
+    stats = {
+        "opendata_total":      len(od_list),
+        "osm_total":           len(osm_list),
+        "with_nearby_match":   len(matched),
+        "missing_in_osm":      len(missing_in_osm),
+        "missing_in_opendata": len(missing_in_od),
+        "tag_ok":              cnt_ok,
+        "tag_warn":            cnt_warn,
+        "tag_err":             cnt_err,
+    }
+    return Comparison(missing_in_osm, missing_in_od, matched, tag_results, stats)
+
+
+def write_report(
+    adapter: DatasetAdapter,
+    od_list: list,
+    osm_list: "OSMColumns | list[OSMPoint]",
+    output_dir: str,
+    report_name: str = "report",
+    subdir: bool = True,
+    echo: bool = False,
+) -> dict:
+    """
+    Écrit les rapports d'un adaptateur et renvoie ses statistiques.
+
+    Par défaut dans output_dir/<nom>/report.{txt,json} ; les scripts
+    historiques gardent leurs noms de fichiers avec subdir=False et
+    report_name (ex. report_glass_bins). echo affiche le rapport texte.
+    """
+    cmp = evaluate(adapter, od_list, osm_list)
+    missing_in_osm, missing_in_od, matched = cmp.missing_in_osm, cmp.missing_in_od, cmp.matched
+    tag_results, stats = cmp.tag_results, cmp.stats
+    cnt_ok, cnt_warn, cnt_err = stats["tag_ok"], stats["tag_warn"], stats["tag_err"]
+
+    now = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M UTC")
+
+    SEP = "=" * 72
+    sep = "-" * 72
+    L: list[str] = [
+        SEP,
+        f"  {adapter.title.upper()} -- OpenData <-> OpenStreetMap",
+        SEP,
+        f"  Genere le       : {now}",
+        f"  Seuil spatial   : {adapter.threshold_m} m",
+        f"  Appariement     : {'1-a-1 optimal' if adapter.one_to_one else 'presence (non exclusif)'}",
+        "",
+        f"  OpenData              : {len(od_list):5d}",
+        f"  OSM                   : {len(osm_list):5d}",
+        f"  Avec voisin proche    : {len(matched):5d}",
+        f"  Manquants in OSM      : {len(missing_in_osm):5d}  -> missing_in_osm.geojson",
+        f"  Manquants in OpenData : {len(missing_in_od):5d}  -> missing_in_opendata.geojson",
+        f"  Tags a corriger       : {cnt_warn + cnt_err:5d}  -> tag_issues.geojson",
+        "",
+        sep,
+        f"  1. MISSING IN OSM ({len(missing_in_osm)})",
+        sep,
+    ]
+    for p in missing_in_osm:
+        L += [
+            f"  * {adapter.describe_ref(p)}",
+            f"    Carte OSM : https://www.openstreetmap.org/"
+            f"?mlat={p.lat}&mlon={p.lon}#map=19/{p.lat}/{p.lon}",
+        ]
+    L += ["", sep, f"  2. MISSING IN OPENDATA ({len(missing_in_od)})", sep]
+    for p in missing_in_od:
+        L.append(f"  * https://www.openstreetmap.org/{p.osm_type}/{p.osm_id}")
+    L += [
+        "", sep, f"  3. QUALITE DES TAGS OSM ({len(matched)})", sep,
+        f"  OK : {cnt_ok}  |  Avertissements : {cnt_warn}  |  Erreurs : {cnt_err}",
+        "",
+    ]
+    for od, osm, errs, warns in tag_results:
+        if not errs and not warns:
+            continue
+        status = "ERREUR" if errs else "AVERT."
+        L += [
+            f"  [{status}] {osm.osm_type}/{osm.osm_id}  (dist = {od.nearest_osm_dist} m)",
+            f"    OpenData : {adapter.describe_ref(od)}",
+        ]
+        L += [f"      x  {e}" for e in errs]
+        L += [f"      ~  {w}" for w in warns]
+        L.append("")
+    txt = "\n".join(L)
+
+    jdata = {
+        "dataset":           adapter.name,
+        "generated_at":      now,
+        "match_threshold_m": adapter.threshold_m,
+        "one_to_one":        adapter.one_to_one,
+        "stats":             stats,
+        "missing_in_osm": [
+            {
+                **{k: v for k, v in asdict(p).items()
+                   if k != "props" and not k.startswith("nearest_")},
+                **p.props,
+            }
+            for p in missing_in_osm
+        ],
+        "missing_in_opendata": [
+            {
+                "osm_id":   p.osm_id,
+                "osm_type": p.osm_type,
+                "lat":      p.lat,
+                "lon":      p.lon,
+                "osm_url":  f"https://www.openstreetmap.org/{p.osm_type}/{p.osm_id}",
+                "tags":     dict(p.tags),
+            }
+            for p in missing_in_od
+        ],
+        "tag_issues": [
+            {
+                "osm_id":     osm.osm_id,
+                "osm_type":   osm.osm_type,
+                "uid":        od.uid,
+                "distance_m": od.nearest_osm_dist,
+                "all_tags":   dict(osm.tags),
+                "errors":     errs,
+                "warnings":   warns,
+            }
+            for od, osm, errs, warns in tag_results
+            if errs or warns
+        ],
+    }
+
+    out = os.path.join(output_dir, adapter.name) if subdir else output_dir
+    os.makedirs(out, exist_ok=True)
+    files: dict[str, str] = {
+        f"{report_name}.txt":  txt,
+        f"{report_name}.json": json.dumps(jdata, ensure_ascii=False, indent=2),
+        "missing_in_osm.geojson": feature_collection([
+            point_feature(p.lat, p.lon, adapter.tags_for_new(p)) for p in missing_in_osm
+        ]),
+        "missing_in_opendata.geojson": feature_collection([
+            point_feature(p.lat, p.lon, dict(p.tags)) for p in missing_in_od
+        ]),
+        "tag_issues.geojson": feature_collection([
+            point_feature(osm.lat, osm.lon, adapter.corrected_tags(dict(osm.tags), od))
+            for od, osm, errs, warns in tag_results
+            if errs or warns
+        ]),
+    }
+    if echo:
+        print()
+        print(txt)
+    for fname, content in files.items():
+        with open(os.path.join(out, fname), "w", encoding="utf-8") as fh:
+            fh.write(content)
+    print(f"-> {out}/")
+    return stats
+
+
+# ── Orchestration ──────────────────────────────────────────────────────────────
+def run_comparisons(
+    adapters: list[DatasetAdapter],
+    pbf: str,
+    output_dir: str,
+    one_to_one: Optional[bool] = None,
+) -> dict:
+    """
+    Télécharge chaque jeu de données, décode le PBF une seule fois pour tous
+    les adaptateurs, puis apparie et écrit les rapports catégorie par catégorie.
+    one_to_one remplace, s'il est donné, le mode d'appariement de chaque adaptateur.
+    """
+    if one_to_one is not None:
+        adapters = [replace(a, one_to_one=one_to_one) for a in adapters]
+
+    refs: dict[str, list] = {}
+    for a in adapters:
+        print(f"\n[{a.name}] {a.title}")
+        pts = a.fetch()
+        if pts is None:
+            print("  -> jeu de donnees indisponible, comparaison ignoree")
+            continue
+        refs[a.name] = deduplicate(pts, a.dedup_radius_m)
+
+    active = [a for a in adapters if a.name in refs]
+    if not active:
+        return {}
+
+    print()
+    osm = scan_osm(pbf, active)
+
+    summary = {}
+    for a in active:
+        print(f"\n[{a.name}]")
+        spatial_match(refs[a.name], osm[a.name], a.threshold_m, a.one_to_one)
+        summary[a.name] = write_report(a, refs[a.name], osm[a.name], output_dir)
+    return summary
+
+
+def main() -> None:
+    from conflation_datasets import DATASETS
+
+    from common import http_cache
+    from common.snapshot_store import DAILY_FILENAME, snapshot_path
+
+    parser = argparse.ArgumentParser(
+        description="Conflation OpenData <-> OSM sur un seul passage du PBF",
+    )
+    parser.add_argument("datasets", nargs="*",
+                        help="Jeux de donnees a comparer (defaut : tous)")
+    parser.add_argument("--list", action="store_true",
+                        help="Lister les jeux de donnees configures")
+    parser.add_argument("--pbf", help="PBF local (defaut : Brussels-daily.pbf)")
+    parser.add_argument("--offline", action="store_true",
+                        help="Aucun acces reseau : OpenData et PBF depuis le cache local")
+    parser.add_argument("--output-dir", default=os.path.join(SCRIPT_DIR, "conflation_reports"))
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--one-to-one", dest="one_to_one", action="store_true", default=None,
+                      help="Paires exclusives optimales pour tous les jeux de donnees")
+    mode.add_argument("--presence", dest="one_to_one", action="store_false",
+                      help="Plus-proche-voisin non exclusif pour tous les jeux de donnees")
+    parser.add_argument("--trend", action="store_true",
+                        help="Rejouer la comparaison sur chaque snapshot de history-list.json")
+    parser.add_argument("--since", metavar="AAAA-MM-JJ", help="Mode tendance : premier snapshot")
+    parser.add_argument("--include-daily", action="store_true",
+                        help="Mode tendance : inclure Brussels-daily.pbf")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Mode tendance : processus en parallele")
+    parser.add_argument("--bench-dedup", type=int, nargs="+", metavar="N",
+                        help="Mesurer la deduplication sur N points aleatoires et quitter")
+    args = parser.parse_args()
+
+    if args.bench_dedup:
+        benchmark_dedup(args.bench_dedup)
+        return
+
+    if args.list:
+        for name, a in DATASETS.items():
+            print(f"  {name:20s} {a.title}  (seuil {a.threshold_m} m)")
+        return
+
+    if args.offline:
+        http_cache.set_offline()
+
+    unknown = [n for n in args.datasets if n not in DATASETS]
+    if unknown:
+        sys.exit(f"Jeux de donnees inconnus : {', '.join(unknown)}")
+    adapters = [DATASETS[n] for n in (args.datasets or DATASETS)]
+
+    if args.trend:
+        from conflation_trend import run_trend
+        run_trend(adapters, args.output_dir, args.one_to_one, args.workers,
+                  args.since, args.include_daily)
+        return
+
+    pbf = args.pbf or snapshot_path(DAILY_FILENAME, offline=http_cache.is_offline())
+    summary = run_comparisons(adapters, pbf, args.output_dir, args.one_to_one)
+
+    print("\n" + "=" * 72)
+    for name, s in summary.items():
+        print(f"  {name:20s} OD {s['opendata_total']:6d} | OSM {s['osm_total']:6d} | "
+              f"manquants OSM {s['missing_in_osm']:5d} | tags {s['tag_warn'] + s['tag_err']:5d}")
+
+
+if __name__ == "__main__":
+    main()
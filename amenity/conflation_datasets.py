@@ -0,0 +1,528 @@
+"""
+Jeux de données comparés à OpenStreetMap par conflation.py.
+
+Chaque entrée de DATASETS est un DatasetAdapter : téléchargement + parsing
+du jeu de données, prédicat sur les tags OSM, tags obligatoires / attendus.
+Un nouveau jeu de données GeoJSON de points s'ajoute avec geojson_fetcher()
+et une entrée dans DATASETS ; les cas particuliers (filtre géographique,
+tags déduits d'un attribut) passent par des fonctions dédiées comme pour
+les bulles à verre et Cambio ci-dessous.
+
+Les scripts recycling-* et cambio-* sont de simples enveloppes autour de
+GLASS_BINS / CAMBIO et de conflation.write_report : seuls leurs noms de
+fichiers (suivis par les workflows) diffèrent.
+"""
+
+import io
+import json
+import os
+import sys
+from dataclasses import dataclass
+from typing import Optional
+
+import requests
+
+from conflation import DatasetAdapter, RefPoint
+from common import http_cache
+from common.projection import from_lambert72
+
+DAY = 24 * 3600
+
+
+def _get(url: str, label: str, timeout: int = 60, ttl: float = DAY) -> http_cache.CachedResponse:
+    """Téléchargement via le cache HTTP partagé (voir common/http_cache.py)."""
+    print(f"{label} - telechargement ...")
+    try:
+        r = http_cache.get(url, ttl=ttl, timeout=timeout)
+    except requests.RequestException as exc:
+        sys.exit(f"Impossible de telecharger {label} : {exc}")
+    if r.from_cache:
+        print("  -> reponse en cache")
+    return r
+
+
+def geojson_fetcher(url: str, label: str, props: dict[str, tuple[str, ...]], ttl: float = DAY):
+    """
+    Fetcher générique pour un GeoJSON de points en WGS84 : props associe un
+    nom de propriété RefPoint à la liste des champs source à essayer.
+    """
+    def fetch() -> list[RefPoint]:
+        r = _get(url, label, ttl=ttl)
+        pts: list[RefPoint] = []
+        for i, feat in enumerate(r.json().get("features", [])):
+            geom = feat.get("geometry") or {}
+            src  = feat.get("properties") or {}
+            if geom.get("type") != "Point":
+                continue
+            lon, lat = geom["coordinates"][:2]
+            pts.append(RefPoint(
+                uid   = str(i),
+                lat   = float(lat),
+                lon   = float(lon),
+                props = {
+                    name: str(next((src[k] for k in keys if src.get(k)), "")).strip()
+                    for name, keys in props.items()
+                },
+            ))
+        print(f"  -> {len(pts)} points charges")
+        return pts
+
+    return fetch
+
+
+# ── Bulles à verre (Bruxelles-Propreté) ────────────────────────────────────────
+GLASS_OPENDATA_GEOJSON = (
+    "https://opendata.bruxelles.be/api/explore/v2.1/catalog/datasets/"
+    "bulles-a-verre-glasbollen/exports/geojson"
+    "?lang=fr&timezone=Europe%2FBerlin"
+)
+
+# Tags OBLIGATOIRES pour un conteneur correctement tagué dans OSM
+GLASS_REQUIRED_TAGS: dict[str, str] = {
+    "amenity":                 "recycling",
+    "recycling:glass_bottles": "yes",
+    "recycling_type":          "container",
+}
+
+# Tags opérateur attendus (optionnels mais souhaitables)
+GLASS_EXPECTED_OPERATORS: dict[str, str] = {
+    "operator":          "Bruxelles-Propreté - Net Brussel",
+    "operator:fr":       "Bruxelles-Propreté",
+    "operator:nl":       "Net Brussel",
+    "operator:wikidata": "Q23021854",
+}
+
+VALID_LOCATIONS = {"underground", "overground"}
+
+
+@dataclass(kw_only=True)
+class ODPoint(RefPoint):
+    address:      str
+    municipality: str
+    postalcode:   str
+    category:     str
+
+
+def detect_location(category: str) -> Optional[str]:
+    c = (category.lower()
+         .replace("é", "e").replace("è", "e").replace("ê", "e")
+         .replace("à", "a").replace("â", "a"))
+    if "aerien" in c:
+        return "overground"
+    if "enterr" in c or "souterr" in c or "underground" in c:
+        return "underground"
+    return None
+
+
+def fetch_glass_bins() -> list[ODPoint]:
+    r = _get(GLASS_OPENDATA_GEOJSON, "OpenData Brussels (bulles a verre)")
+    pts: list[ODPoint] = []
+    for i, feat in enumerate(r.json().get("features", [])):
+        geom  = feat.get("geometry") or {}
+        props = feat.get("properties") or {}
+        if geom.get("type") != "Point":
+            continue
+        lon, lat = geom["coordinates"]
+        pts.append(ODPoint(
+            uid          = str(i),
+            lat          = float(lat),
+            lon          = float(lon),
+            address      = (props.get("address")         or "").strip(),
+            municipality = (props.get("municipality_fr")
+                            or props.get("municipality_nl") or "").strip(),
+            postalcode   = str(props.get("postalcode", "")).strip(),
+            category     = (props.get("category_fr")
+                            or props.get("category_nl") or "").strip(),
+        ))
+    print(f"  -> {len(pts)} bulles chargees")
+    return pts
+
+
+def is_glass(tags) -> bool:
+    return (
+        tags.get("amenity") == "recycling"
+        and tags.get("recycling:glass_bottles") == "yes"
+    )
+
+
+def glass_new_tags(p: ODPoint) -> dict:
+    tags = {**GLASS_REQUIRED_TAGS, **GLASS_EXPECTED_OPERATORS}
+    location = detect_location(p.category)
+    if location:
+        tags["location"] = location
+    return tags
+
+
+def assess_glass_tags(tags: dict, expected_location: Optional[str] = None) -> tuple[list[str], list[str]]:
+    """
+    expected_location : valeur 'underground'/'overground' déduite de la
+    catégorie OpenData (bulle aerienne / bulle enterree), utilisée pour
+    enrichir le message si le tag location est absent dans OSM.
+
+    Les avertissements liés à l'opérateur sont placés en premier dans la
+    liste retournée (plus prioritaires à corriger que le tag location).
+    """
+    errors:            list[str] = []
+    operator_warnings: list[str] = []
+    other_warnings:    list[str] = []
+
+    for key, expected in GLASS_REQUIRED_TAGS.items():
+        actual = tags.get(key)
+        if actual != expected:
+            errors.append(f"{key}={expected!r}  ->  actuel : {actual!r}")
+
+    for key, expected in GLASS_EXPECTED_OPERATORS.items():
+        actual = tags.get(key)
+        if actual is None:
+            operator_warnings.append(f"{key} absent (attendu : {expected!r})")
+        elif actual != expected:
+            operator_warnings.append(f"{key}={actual!r}  !=  {expected!r}")
+
+    loc = tags.get("location")
+    if loc is None:
+        hint = f" — d'après l'OpenData, attendu : {expected_location!r}" if expected_location else ""
+        other_warnings.append(f"location absent (attendu : 'underground' ou 'overground'){hint}")
+    elif loc not in VALID_LOCATIONS:
+        other_warnings.append(f"location={loc!r} — valeur inattendue")
+
+    return errors, operator_warnings + other_warnings
+
+
+def glass_corrected_tags(tags: dict, p: ODPoint) -> dict:
+    """
+    Tags actuels du nœud (poubelle, papier, vêtements… conservés tels quels),
+    seules les clés en cause sont corrigées : amenity, recycling*, operator*,
+    location.
+    """
+    corrected = {**tags, **GLASS_REQUIRED_TAGS, **GLASS_EXPECTED_OPERATORS}
+    loc = detect_location(p.category)
+    if loc:
+        corrected["location"] = loc
+    return corrected
+
+
+GLASS_BINS = DatasetAdapter(
+    name           = "glass_bins",
+    title          = "Bulles a verre",
+    fetch          = fetch_glass_bins,
+    osm_filter     = is_glass,
+    required       = GLASS_REQUIRED_TAGS,
+    expected       = GLASS_EXPECTED_OPERATORS,
+    threshold_m    = 50.0,
+    dedup_radius_m = 2.0,
+    new_tags       = glass_new_tags,
+    assess         = lambda tags, p: assess_glass_tags(tags, detect_location(p.category)),
+    corrected      = glass_corrected_tags,
+    describe       = lambda p: f"[{p.postalcode} {p.municipality}]  {p.address}  ({p.category})",
+)
+
+
+# ── Stations Cambio (car-sharing) ──────────────────────────────────────────────
+CAMBIO_API_URL = "https://cwapi.cambio-carsharing.com/pub/stations/BEL"
+
+CAMBIO_REQUIRED_TAGS  = {"amenity": "car_sharing"}
+CAMBIO_EXPECTED_ATTRS = {
+    "brand":              "Cambio",
+    "operator":           "cambio CarSharing",
+    "operator:short":     "Cambio",
+    "operator:type":      "private",
+    "operator:wikidata":  "Q1028155",
+    "operator:wikipedia": "en:Cambio CarSharing",
+    "short_name":         "Cambio",
+}
+
+BRUSSELS_POSTAL_MIN = 1000
+BRUSSELS_POSTAL_MAX = 1212
+
+BRUSSELS_MUNICIPALITIES = {
+    "anderlecht", "auderghem", "oudergem",
+    "berchem-sainte-agathe", "sint-agatha-berchem",
+    "bruxelles", "brussel",
+    "etterbeek", "evere",
+    "forest", "vorst",
+    "ganshoren",
+    "ixelles", "elsene",
+    "jette", "koekelberg",
+    "molenbeek-saint-jean", "sint-jans-molenbeek",
+    "saint-gilles", "sint-gillis",
+    "saint-josse-ten-noode", "sint-joost-ten-node",
+    "schaerbeek", "schaarbeek",
+    "uccle", "ukkel",
+    "watermael-boitsfort", "watermaal-bosvoorde",
+    "woluwe-saint-lambert", "sint-lambrechts-woluwe",
+    "woluwe-saint-pierre", "sint-pieters-woluwe",
+}
+
+
+@dataclass(kw_only=True)
+class CambioPoint(RefPoint):
+    station_id:    str
+    name:          str
+    street:        str
+    street_number: str
+    municipality:  str
+    postalcode:    str
+    vehicle_count: int
+
+
+def normalize(s: str) -> str:
+    s = s.lower().strip()
+    for a, b in (("é", "e"), ("è", "e"), ("ê", "e"), ("à", "a"),
+                 ("â", "a"), ("ô", "o"), ("î", "i"), ("ç", "c")):
+        s = s.replace(a, b)
+    return s
+
+
+def split_bilingual_name(display_name: str) -> tuple[str, str]:
+    if "/" in display_name:
+        fr, nl = display_name.split("/", 1)
+    elif " - " in display_name:
+        fr, nl = display_name.split(" - ", 1)
+    else:
+        fr = nl = display_name
+    return fr.strip(), nl.strip()
+
+
+def is_brussels(postalcode: str, municipality: str) -> bool:
+    try:
+        pc = int(postalcode)
+        if BRUSSELS_POSTAL_MIN <= pc <= BRUSSELS_POSTAL_MAX:
+            return True
+    except (ValueError, TypeError):
+        pass
+    return normalize(municipality) in BRUSSELS_MUNICIPALITIES
+
+
+def fetch_cambio() -> list[CambioPoint]:
+    data = _get(CAMBIO_API_URL, "Cambio API (stations Belgique)", ttl=3600).json()
+    if isinstance(data, dict):
+        for key in ("stations", "items", "data", "results"):
+            if isinstance(data.get(key), list):
+                data = data[key]
+                break
+
+    if not isinstance(data, list):
+        sys.exit("Format de reponse Cambio inattendu")
+
+    print(f"  -> {len(data)} stations Belgique")
+
+    pts: list[CambioPoint] = []
+    for i, s in enumerate(data):
+        addr = s.get("address") or {}
+        geo  = s.get("geoposition") or {}
+        lat, lon = geo.get("latitude"), geo.get("longitude")
+        if lat is None or lon is None:
+            continue
+
+        postalcode   = str(addr.get("postalCode", "")).strip()
+        municipality = (addr.get("addressLocation") or "").strip()
+        if not is_brussels(postalcode, municipality):
+            continue
+
+        pts.append(CambioPoint(
+            uid           = str(i),
+            station_id    = str(s.get("id", "")),
+            name          = (s.get("displayName") or s.get("name") or "").strip(),
+            lat           = float(lat),
+            lon           = float(lon),
+            street        = (addr.get("streetAddress") or "").strip(),
+            street_number = (addr.get("streetNumber") or "").strip(),
+            municipality  = municipality,
+            postalcode    = postalcode,
+            vehicle_count = int(s.get("vehicleCount", 0) or 0),
+        ))
+
+    print(f"  -> {len(pts)} stations Bruxelles-Capitale retenues")
+    return pts
+
+
+def is_cambio(tags) -> bool:
+    if tags.get("amenity") != "car_sharing":
+        return False
+    for key in ("brand", "operator", "operator:short"):
+        if "cambio" in (tags.get(key) or "").lower():
+            return True
+    return False
+
+
+def cambio_new_tags(p: CambioPoint) -> dict:
+    name_fr, name_nl = split_bilingual_name(p.name)
+    tags: dict = {**CAMBIO_REQUIRED_TAGS, **CAMBIO_EXPECTED_ATTRS}
+    if name_fr == name_nl:
+        tags["name"] = name_fr
+    else:
+        tags["name"]    = f"{name_fr} - {name_nl}"
+        tags["name:fr"] = name_fr
+        tags["name:nl"] = name_nl
+    if p.vehicle_count:
+        tags["capacity"] = str(p.vehicle_count)
+    return tags
+
+
+CAMBIO = DatasetAdapter(
+    name             = "cambio",
+    title            = "Stations Cambio",
+    fetch            = fetch_cambio,
+    osm_filter       = is_cambio,
+    required         = CAMBIO_REQUIRED_TAGS,
+    expected         = CAMBIO_EXPECTED_ATTRS,
+    one_to_one       = True,
+    threshold_m      = 100.0,
+    dedup_radius_m   = 1.0,
+    case_insensitive = True,
+    new_tags         = cambio_new_tags,
+    describe         = lambda p: (f"{p.name}, {p.street} {p.street_number}, "
+                                  f"{p.postalcode} {p.municipality}"),
+)
+
+
+# ── Stationnements vélo (datastore.brussels, GeoServer JSON en EPSG:31370) ─────
+BICYCLE_PARKING_JSON = os.environ.get(
+    "BICYCLE_PARKING_JSON", "geoserver-GetFeature.application.json"
+)
+
+
+def fetch_bicycle_parking() -> Optional[list[RefPoint]]:
+    """
+    Export GeoServer du dataset datastore.brussels (chemin local ou URL dans
+    $BICYCLE_PARKING_JSON). None si le fichier n'est pas disponible.
+    """
+    src = BICYCLE_PARKING_JSON
+    if src.startswith(("http://", "https://")):
+        data = _get(src, "datastore.brussels (stationnements velo)").json()
+    elif os.path.exists(src):
+        with open(src, encoding="utf-8") as fh:
+            data = json.load(fh)
+    else:
+        print(f"  ! {src} introuvable (BICYCLE_PARKING_JSON)")
+        return None
+
+    feats = [f for f in data.get("features", [])
+             if (f.get("geometry") or {}).get("type") == "Point"]
+    xs = [f["geometry"]["coordinates"][0] for f in feats]
+    ys = [f["geometry"]["coordinates"][1] for f in feats]
+    lons, lats = from_lambert72(xs, ys)
+
+    pts: list[RefPoint] = []
+    for f, lat, lon in zip(feats, lats, lons):
+        props = f.get("properties") or {}
+        pts.append(RefPoint(
+            uid   = str(f.get("id", len(pts))),
+            lat   = float(lat),
+            lon   = float(lon),
+            props = {
+                "capacity": props.get("capacity"),
+                "cover":    props.get("cover"),
+                "type":     props.get("type"),
+            },
+        ))
+    print(f"  -> {len(pts)} stationnements velo charges")
+    return pts
+
+
+def bicycle_parking_new_tags(p: RefPoint) -> dict:
+    tags = {"amenity": "bicycle_parking"}
+    if p.props.get("capacity"):
+        tags["capacity"] = str(p.props["capacity"])
+    tags["covered"] = "yes" if p.props.get("cover") == 1 else "no"
+    if p.props.get("type") in (1, 2):
+        tags["bicycle_parking"] = "stands"
+    return tags
+
+
+BICYCLE_PARKING = DatasetAdapter(
+    name           = "bicycle_parking",
+    title          = "Stationnements velo",
+    fetch          = fetch_bicycle_parking,
+    osm_filter     = lambda tags: tags.get("amenity") == "bicycle_parking",
+    required       = {"amenity": "bicycle_parking"},
+    one_to_one     = True,
+    threshold_m    = 15.0,
+    dedup_radius_m = 1.0,
+    new_tags       = bicycle_parking_new_tags,
+)
+
+
+# ── Arbres d'alignement (Bruxelles Mobilité, WFS) ──────────────────────────────
+TREES_WFS_CSV = (
+    "https://data.mobility.brussels/geoserver/bm_public_space/wfs"
+    "?service=wfs&version=1.1.0&request=GetFeature&typeName=bm_public_space:trees"
+    "&outputFormat=csv&srsName=EPSG:4326"
+)
+
+
+def fetch_trees() -> list[RefPoint]:
+    import pandas as pd
+
+    r = _get(TREES_WFS_CSV, "Bruxelles Mobilite (arbres)", timeout=300, ttl=7 * DAY)
+    df = pd.read_csv(io.BytesIO(r.content), dtype={"numident": str}, decimal=",")
+    coords = df["geom"].str.extract(r"\(\s*([-\d.]+)\s+([-\d.]+)\s*\)").astype(float)
+
+    pts: list[RefPoint] = []
+    for numident, essence, (lon, lat) in zip(df["numident"], df["essence"], coords.itertuples(index=False)):
+        if lon != lon or lat != lat:   # NaN : géométrie illisible
+            continue
+        pts.append(RefPoint(
+            uid   = str(numident),
+            lat   = lat,
+            lon   = lon,
+            props = {"ref": str(numident), "essence": "" if essence != essence else str(essence)},
+        ))
+    print(f"  -> {len(pts)} arbres charges")
+    return pts
+
+
+TREES = DatasetAdapter(
+    name           = "trees",
+    title          = "Arbres Bruxelles Mobilite",
+    fetch          = fetch_trees,
+    osm_filter     = lambda tags: tags.get("natural") == "tree",
+    required       = {"natural": "tree"},
+    one_to_one     = True,
+    threshold_m    = 3.0,
+    dedup_radius_m = 0.2,
+    new_tags       = lambda p: {"natural": "tree", "ref": p.props["ref"]},
+)
+
+
+# ── Bancs (UrbIS Topo, partition GeoParquet DESCRFRE=Banc) ─────────────────────
+URBIS_PARQUET_DIR = os.environ.get("URBIS_PARQUET_DIR", "parquet_topo_points")
+
+
+def fetch_benches() -> Optional[list[RefPoint]]:
+    """
+    Lit la partition produite par UrbIsTopo/urbis_topo_points_to_geojson.py.
+    None si elle n'a pas encore été générée.
+    """
+    import geopandas as gpd
+
+    path = os.path.join(URBIS_PARQUET_DIR, "DESCRFRE=Banc", "part-0.parquet")
+    if not os.path.exists(path):
+        print(f"  ! {path} introuvable (lancer urbis_topo_points_to_geojson.py)")
+        return None
+    gdf = gpd.read_parquet(path, columns=["geometry"]).to_crs(epsg=4326)
+    # La partition est écrite en MultiPoint (couche UrbIS d'origine) : .x/.y
+    # n'existent que sur des Point simples
+    gdf = gdf.explode(index_parts=False, ignore_index=True)
+    pts = [
+        RefPoint(uid=str(i), lat=float(y), lon=float(x))
+        for i, (x, y) in enumerate(zip(gdf.geometry.x, gdf.geometry.y))
+    ]
+    print(f"  -> {len(pts)} bancs charges")
+    return pts
+
+
+BENCHES = DatasetAdapter(
+    name           = "benches",
+    title          = "Bancs UrbIS",
+    fetch          = fetch_benches,
+    osm_filter     = lambda tags: tags.get("amenity") == "bench",
+    required       = {"amenity": "bench"},
+    threshold_m    = 5.0,
+    dedup_radius_m = 0.5,
+)
+
+
+DATASETS: dict[str, DatasetAdapter] = {
+    a.name: a for a in (GLASS_BINS, CAMBIO, BICYCLE_PARKING, TREES, BENCHES)
+}
@@ -0,0 +1,223 @@
+"""
+Mode tendance de conflation.py : la même comparaison OpenData <-> OSM
+rejouée sur chaque snapshot daté de pbf_analyse/history-list.json.
+
+  • Le jeu de données OpenData est téléchargé une seule fois par exécution,
+    puis transmis aux processus de travail (un snapshot par tâche).
+  • Pour chaque snapshot, les objets OSM retenus par le prédicat de chaque
+    adaptateur sont mis en cache (extrait filtré, JSON gzip) : un snapshot
+    n'est décodé qu'une fois, quel que soit le nombre de relances.
+  • Les statistiques sont mises en cache par (snapshot, adaptateur, seuil,
+    mode d'appariement, prédicat, contenu OpenData) : une relance sans
+    changement ne recalcule rien.
+
+Cache : $OSM_BE_CACHE_DIR/conflation (voir common.paths).
+
+Sortie : <output-dir>/trend.csv et trend.json, une ligne par
+(snapshot, jeu de données) avec les compteurs de evaluate().
+"""
+
+import csv
+import gzip
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import replace
+from typing import Optional
+
+from common.paths import OSM_BE_CACHE_DIR
+from common.snapshot_store import fetch_history_list, snapshot_path
+from conflation import (
+    DatasetAdapter,
+    OSMColumns,
+    deduplicate,
+    evaluate,
+    scan_osm,
+    spatial_match,
+)
+
+TREND_CACHE_DIR = OSM_BE_CACHE_DIR / "conflation"
+EXTRACT_DIR     = TREND_CACHE_DIR / "extracts"
+STATS_CACHE     = TREND_CACHE_DIR / "trend_stats.json"
+EXTRACT_FORMAT  = 2   # OSMColumns.to_dict()
+
+STAT_FIELDS = [
+    "opendata_total", "osm_total", "with_nearby_match",
+    "missing_in_osm", "missing_in_opendata",
+    "tag_ok", "tag_warn", "tag_err",
+]
+
+
+# ── Clés de cache ──────────────────────────────────────────────────────────────
+def _sha1(*parts) -> str:
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def filter_signature(adapter: DatasetAdapter) -> str:
+    """Change si le prédicat OSM de l'adaptateur change."""
+    code = adapter.osm_filter.__code__
+    return _sha1(code.co_code.hex(), code.co_consts, code.co_names)
+
+
+def refs_signature(refs: list) -> str:
+    return _sha1([(p.uid, round(p.lat, 7), round(p.lon, 7)) for p in refs])
+
+
+def extract_path(entry: dict, adapter: DatasetAdapter):
+    stem = entry["filename"].removesuffix(".pbf")
+    return EXTRACT_DIR / f"{stem}-{entry.get('size_bytes')}-{adapter.name}-{filter_signature(adapter)}-v{EXTRACT_FORMAT}.json.gz"
+
+
+def stats_key(entry: dict, adapter: DatasetAdapter, refs_sig: str) -> str:
+    return _sha1(
+        entry["filename"], entry.get("size_bytes"), adapter.name,
+        adapter.threshold_m, adapter.one_to_one, filter_signature(adapter), refs_sig,
+    )
+
+
+# ── Extraits filtrés par snapshot ──────────────────────────────────────────────
+def load_extract(path) -> OSMColumns:
+    with gzip.open(path, "rt", encoding="utf-8") as fh:
+        return OSMColumns.from_dict(json.load(fh))
+
+
+def save_extract(path, cols: OSMColumns) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".part")
+    with gzip.open(tmp, "wt", encoding="utf-8") as fh:
+        json.dump(cols.to_dict(), fh)
+    os.replace(tmp, path)
+
+
+def _snapshot_worker(
+    entry: dict,
+    names: list[str],
+    one_to_one: Optional[bool],
+    refs: dict[str, list],
+) -> dict[str, dict]:
+    """
+    Processus de travail : un snapshot, tous les adaptateurs demandés.
+    Seuls les adaptateurs sans extrait en cache déclenchent un décodage du PBF.
+    """
+    from conflation_datasets import DATASETS
+
+    adapters = [DATASETS[n] for n in names]
+    if one_to_one is not None:
+        adapters = [replace(a, one_to_one=one_to_one) for a in adapters]
+
+    osm: dict[str, OSMColumns] = {}
+    missing = []
+    for a in adapters:
+        path = extract_path(entry, a)
+        if path.exists():
+            osm[a.name] = load_extract(path)
+        else:
+            missing.append(a)
+
+    if missing:
+        scanned = scan_osm(snapshot_path(entry["filename"]), missing)
+        for a in missing:
+            save_extract(extract_path(entry, a), scanned[a.name])
+            osm[a.name] = scanned[a.name]
+
+    stats = {}
+    for a in adapters:
+        spatial_match(refs[a.name], osm[a.name], a.threshold_m, a.one_to_one)
+        stats[a.name] = evaluate(a, refs[a.name], osm[a.name]).stats
+    return stats
+
+
+# ── Orchestration ──────────────────────────────────────────────────────────────
+def run_trend(
+    adapters: list[DatasetAdapter],
+    output_dir: str,
+    one_to_one: Optional[bool] = None,
+    workers: int = os.cpu_count() or 1,
+    since: Optional[str] = None,
+    include_daily: bool = False,
+) -> list[dict]:
+    if one_to_one is not None:
+        adapters = [replace(a, one_to_one=one_to_one) for a in adapters]
+
+    # 1. OpenData : un seul téléchargement par exécution
+    refs: dict[str, list] = {}
+    for a in adapters:
+        print(f"\n[{a.name}] {a.title}")
+        pts = a.fetch()
+        if pts is None:
+            print("  -> jeu de donnees indisponible, tendance ignoree")
+            continue
+        refs[a.name] = deduplicate(pts, a.dedup_radius_m)
+    adapters = [a for a in adapters if a.name in refs]
+    if not adapters:
+        return []
+    refs_sig = {name: refs_signature(pts) for name, pts in refs.items()}
+
+    # 2. Snapshots à traiter
+    kinds = {"snapshot", "daily"} if include_daily else {"snapshot"}
+    entries = sorted(
+        (e for e in fetch_history_list()
+         if e.get("type") in kinds and (since is None or e["date"] >= since)),
+        key=lambda e: e["date"],
+    )
+
+    cache: dict[str, dict] = {}
+    if STATS_CACHE.exists():
+        cache = json.loads(STATS_CACHE.read_text())
+
+    todo: dict[str, list[str]] = {}
+    for e in entries:
+        names = [a.name for a in adapters if stats_key(e, a, refs_sig[a.name]) not in cache]
+        if names:
+            todo[e["filename"]] = names
+    print(f"\n{len(entries)} snapshots, {len(todo)} a calculer "
+          f"({len(entries) - len(todo)} entierement en cache)")
+
+    # 3. Snapshots manquants, en parallèle
+    by_name = {a.name: a for a in adapters}
+    by_file = {e["filename"]: e for e in entries}
+    if todo:
+        TREND_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        with ProcessPoolExecutor(max_workers=max(1, min(workers, len(todo)))) as pool:
+            futures = {
+                pool.submit(
+                    _snapshot_worker, by_file[fn], names, one_to_one,
+                    {n: refs[n] for n in names},
+                ): fn
+                for fn, names in todo.items()
+            }
+            for fut in as_completed(futures):
+                fn = futures[fut]
+                e = by_file[fn]
+                try:
+                    result = fut.result()
+                except Exception as exc:
+                    print(f"  ! {fn} : {exc}")
+                    continue
+                for name, stats in result.items():
+                    cache[stats_key(e, by_name[name], refs_sig[name])] = stats
+                # sauvegarde au fil de l'eau : une interruption ne perd rien
+                STATS_CACHE.write_text(json.dumps(cache))
+                print(f"  -> {e['date']} {fn} termine")
+
+    # 4. Série temporelle
+    rows = []
+    for e in entries:
+        for a in adapters:
+            stats = cache.get(stats_key(e, a, refs_sig[a.name]))
+            if stats is None:
+                continue
+            rows.append({"date": e["date"], "snapshot": e["filename"], "dataset": a.name, **stats})
+
+    os.makedirs(output_dir, exist_ok=True)
+    csv_path = os.path.join(output_dir, "trend.csv")
+    with open(csv_path, "w", newline="", encoding="utf-8") as fh:
+        writer = csv.DictWriter(fh, fieldnames=["date", "snapshot", "dataset", *STAT_FIELDS])
+        writer.writeheader()
+        writer.writerows(rows)
+    json_path = os.path.join(output_dir, "trend.json")
+    with open(json_path, "w", encoding="utf-8") as fh:
+        json.dump(rows, fh, ensure_ascii=False, indent=2)
+    print(f"-> {csv_path}\n-> {json_path}")
+    return rows
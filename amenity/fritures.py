@@ -1,9 +1,16 @@
+# Usage:
+#   python fritures.py                   -> matplotlib plot with a contextily basemap
+#   python fritures.py --html map.html   -> interactive map, clusters precomputed per zoom
+#                                           (stays light with any number of points)
+import argparse
+import os
+import sys
+
 import osmium
-import geopandas as gpd
-import matplotlib.pyplot as plt
-import contextily as ctx
 from shapely.geometry import Point
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
 class OSMHandler(osmium.SimpleHandler):
     def __init__(self):
         super(OSMHandler, self).__init__()
@@ -28,32 +35,63 @@ class OSMHandler(osmium.SimpleHandler):
             if n.location.valid():
                 self.tagged_locations.append(Point(n.location.lon, n.location.lat))
 
-# Specify the input PBF file
-input_pbf_file = 'belgium-latest.osm.pbf'
+def plot_map(locations):
+    import geopandas as gpd
+    import matplotlib.pyplot as plt
+    import contextily as ctx
+
+    # Create a GeoDataFrame from the tagged locations
+    gdf = gpd.GeoDataFrame(geometry=locations)
+
+    # Set the coordinate reference system explicitly
+    gdf.crs = 'EPSG:4326'
+
+    # Reproject the GeoDataFrame to Web Mercator (EPSG:3857)
+    gdf = gdf.to_crs(epsg=3857)
+
+    # Plot the GeoDataFrame with a background basemap using contextily
+    ax = gdf.plot(figsize=(10, 10), color='red', marker='o', markersize=50, alpha=0.5)
+
+    # Add a background basemap
+    ctx.add_basemap(ax, crs=gdf.crs, source=ctx.providers.OpenStreetMap.Mapnik)
+
+    # Customize the plot
+    plt.title('Locations of Ways or Nodes with cuisine=friture')
+    plt.xlabel('Longitude')
+    plt.ylabel('Latitude')
 
-# Initialize the OSMHandler and apply it to the input file
-handler = OSMHandler()
-handler.apply_file(input_pbf_file)
+    # Show the plot
+    plt.show()
 
-# Create a GeoDataFrame from the tagged locations
-gdf = gpd.GeoDataFrame(geometry=handler.tagged_locations)
 
-# Set the coordinate reference system explicitly
-gdf.crs = 'EPSG:4326'
+def html_map(locations, output_html):
+    import folium
+    from common.cluster_map import add_precomputed_clusters
 
-# Reproject the GeoDataFrame to Web Mercator (EPSG:3857)
-gdf = gdf.to_crs(epsg=3857)
+    lats = [p.y for p in locations]
+    lons = [p.x for p in locations]
+    center = (sum(lats) / len(lats), sum(lons) / len(lons))
+    my_map = folium.Map(location=center, zoom_start=8, prefer_canvas=True)
+    add_precomputed_clusters(my_map, lats, lons, color='#d62728')
+    my_map.save(output_html)
+    print(f"{len(locations)} fritures saved to {output_html}")
 
-# Plot the GeoDataFrame with a background basemap using contextily
-ax = gdf.plot(figsize=(10, 10), color='red', marker='o', markersize=50, alpha=0.5)
 
-# Add a background basemap
-ctx.add_basemap(ax, crs=gdf.crs, source=ctx.providers.OpenStreetMap.Mapnik)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Map of cuisine=friture nodes and ways.')
+    # Specify the input PBF file
+    parser.add_argument('pbf', nargs='?', default='belgium-latest.osm.pbf')
+    parser.add_argument('--html', metavar='OUTPUT_HTML',
+                        help='write an interactive clustered map instead of the matplotlib plot')
+    args = parser.parse_args()
 
-# Customize the plot
-plt.title('Locations of Ways or Nodes with cuisine=friture')
-plt.xlabel('Longitude')
-plt.ylabel('Latitude')
+    # Initialize the OSMHandler and apply it to the input file
+    handler = OSMHandler()
+    handler.apply_file(args.pbf, locations=True)
 
-# Show the plot
-plt.show()
+    if not handler.tagged_locations:
+        print('No cuisine=friture found in the specified OSM file.')
+    elif args.html:
+        html_map(handler.tagged_locations, args.html)
+    else:
+        plot_map(handler.tagged_locations)
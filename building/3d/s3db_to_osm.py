@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+"""
+osm_3d_tags_<zone>.gpkg → fichiers OSM XML (.osm) ou osmChange (.osc) pour JOSM
+================================================================================
+Exporte les couches S3DB produites par urbis3dosm.py :
+
+  building_outline  → way fermé (ou relation multipolygon) building=yes
+  building_parts    → way fermé (ou relation multipolygon) building:part=yes
+
+Les sommets communs sont dédupliqués par hash de coordonnées (arrondies à
+1e-7°, la précision OSM) : l'outline et les parts d'un même bâtiment, ainsi
+que des bâtiments mitoyens, partagent donc les mêmes nœuds.
+
+La sortie est découpée en tuiles spatiales (grille de --tile-size degrés,
+subdivisée en quadtree tant qu'une tuile dépasse --max-features bâtiments).
+Toutes les parts d'un bâtiment tombent dans la tuile de son outline. Chaque
+tuile est écrite indépendamment : seule la table coordonnées → id des nœuds
+(quelques entiers par sommet) couvre toute la zone, ways et relations
+restent bornés par la taille d'une tuile.
+
+Les ids sont négatifs (objets nouveaux pour JOSM) et uniques sur l'ensemble
+des tuiles. La déduplication des nœuds vaut aussi entre tuiles : le sommet
+commun à deux bâtiments mitoyens de tuiles voisines garde le même id dans
+les deux fichiers. Il est écrit dans chacun pour que chaque tuile s'ouvre
+seule dans JOSM ; `osmium merge` des tuiles n'en garde qu'un.
+
+Usage :
+  python s3db_to_osm.py                               # auto-détection
+  python s3db_to_osm.py --zone 21004
+  python s3db_to_osm.py --format osc                  # osmChange <create>
+  python s3db_to_osm.py --tile-size 0.005 --max-features 1000
+"""
+
+import argparse
+import glob
+import json
+import logging
+import re
+import sqlite3
+import sys
+from pathlib import Path
+from xml.sax.saxutils import quoteattr
+
+from shapely import wkb
+from shapely.geometry import MultiPolygon, Polygon
+
+from urbis3dosm import gpkg_blob_to_wkb
+
+log = logging.getLogger(__name__)
+
+# ── Defaults ──────────────────────────────────────────────────────────────────
+DEFAULT_TILE_SIZE    = 0.01   # degrés (~1.1 km N-S, ~0.7 km E-O à Bruxelles)
+DEFAULT_MAX_FEATURES = 2000   # bâtiments (outlines) max par tuile
+COORD_SCALE          = 10_000_000  # précision OSM : 1e-7°
+
+# Colonnes de chaque couche reprises comme tags OSM (les autres — osm_ref,
+# part_type, cabanon, roof_shape_raw, cabanon_detected, action — sont internes).
+OUTLINE_TAGS = ("building", "height", "building:levels")
+PART_TAGS    = (
+    "building:part", "height", "min_height",
+    "roof:shape", "roof:height", "building:levels",
+)
+
+
+# ── Lecture GPKG (SQLite) ─────────────────────────────────────────────────────
+
+def detect_gpkg(zone_arg: str | None) -> tuple[str, Path]:
+    if zone_arg:
+        src = Path(f"osm_3d_tags_{zone_arg}.gpkg")
+        if not src.exists():
+            raise FileNotFoundError(f"Fichier source introuvable : {src}")
+        return zone_arg, src
+
+    candidates = sorted(glob.glob("osm_3d_tags_[0-9]*.gpkg"))
+    candidates = [c for c in candidates if "_delta" not in c]
+    if not candidates:
+        raise FileNotFoundError(
+            "Aucun fichier osm_3d_tags_XXXXX.gpkg trouvé dans le répertoire courant."
+        )
+    src = Path(candidates[0])
+    m = re.search(r"(\d{5})", src.stem)
+    if not m:
+        raise ValueError(f"Impossible d'extraire le code de zone depuis : {src}")
+    log.info("Zone détectée : %s  (%s)", m.group(1), src)
+    return m.group(1), src
+
+
+def layer_columns(con: sqlite3.Connection, layer: str) -> tuple[str, str]:
+    """Renvoie (colonne clé primaire, colonne géométrie) d'une couche GPKG."""
+    row = con.execute(
+        "SELECT column_name FROM gpkg_geometry_columns WHERE table_name = ?", (layer,)
+    ).fetchone()
+    if row is None:
+        raise ValueError(f"Couche introuvable dans le GeoPackage : {layer}")
+    geom_col = row[0]
+    pk_col = next(
+        (r[1] for r in con.execute(f'PRAGMA table_info("{layer}")') if r[5] == 1),
+        "fid",
+    )
+    return pk_col, geom_col
+
+
+def scan_outlines(con: sqlite3.Connection, layer: str) -> list[tuple[int, str, float, float]]:
+    """
+    Passe 1 : (fid, osm_ref, cx, cy) de chaque outline, cx/cy = centre de
+    l'emprise. Utilise l'index R-tree du GPKG quand il existe (pas de
+    décodage de géométrie), sinon décode le WKB.
+    """
+    pk, geom = layer_columns(con, layer)
+    rtree = f"rtree_{layer}_{geom}"
+    has_rtree = con.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = ?", (rtree,)
+    ).fetchone() is not None
+
+    items: list[tuple[int, str, float, float]] = []
+    if has_rtree:
+        rows = con.execute(
+            f'SELECT t."{pk}", t.osm_ref, r.minx, r.maxx, r.miny, r.maxy '
+            f'FROM "{layer}" t JOIN "{rtree}" r ON r.id = t."{pk}"'
+        )
+        for fid, ref, minx, maxx, miny, maxy in rows:
+            items.append((fid, str(ref), (minx + maxx) / 2, (miny + maxy) / 2))
+    else:
+        rows = con.execute(f'SELECT "{pk}", osm_ref, "{geom}" FROM "{layer}"')
+        for fid, ref, blob in rows:
+            if blob is None:
+                continue
+            minx, miny, maxx, maxy = wkb.loads(gpkg_blob_to_wkb(blob)).bounds
+            items.append((fid, str(ref), (minx + maxx) / 2, (miny + maxy) / 2))
+    return items
+
+
+def scan_parts(con: sqlite3.Connection, layer: str) -> dict[str, list[int]]:
+    """Passe 1 (parts) : osm_ref → liste des fid, sans décoder les géométries."""
+    pk, _ = layer_columns(con, layer)
+    by_ref: dict[str, list[int]] = {}
+    for fid, ref in con.execute(f'SELECT "{pk}", osm_ref FROM "{layer}"'):
+        by_ref.setdefault(str(ref), []).append(fid)
+    return by_ref
+
+
+def fetch_features(con: sqlite3.Connection, layer: str, fids: list[int], tag_keys):
+    """Passe 2 : géométries + tags des fid d'une tuile."""
+    pk, geom = layer_columns(con, layer)
+    present = {r[1] for r in con.execute(f'PRAGMA table_info("{layer}")')}
+    keys = [k for k in tag_keys if k in present]
+    cols = ", ".join(f'"{k}"' for k in keys)
+    select = f'SELECT "{geom}"{", " + cols if cols else ""} FROM "{layer}" WHERE "{pk}" IN '
+    for start in range(0, len(fids), 900):   # limite SQLite sur les paramètres
+        chunk = fids[start:start + 900]
+        rows = con.execute(select + f"({', '.join('?' * len(chunk))})", chunk)
+        for row in rows:
+            if row[0] is None:
+                continue
+            tags = {
+                k: str(v) for k, v in zip(keys, row[1:])
+                if v is not None and str(v) != ""
+            }
+            yield wkb.loads(gpkg_blob_to_wkb(row[0])), tags
+
+
+# ── Tuilage ───────────────────────────────────────────────────────────────────
+
+def build_tiles(items, tile_size: float, max_features: int) -> list[tuple[tuple, list]]:
+    """
+    Regroupe les outlines sur une grille régulière, puis subdivise en quadtree
+    chaque case qui dépasse max_features. Renvoie [(bbox, items), ...].
+    """
+    grid: dict[tuple[int, int], list] = {}
+    for it in items:
+        key = (int(it[2] // tile_size), int(it[3] // tile_size))
+        grid.setdefault(key, []).append(it)
+
+    tiles: list[tuple[tuple, list]] = []
+
+    def split(bbox, members, depth=0):
+        if len(members) <= max_features:
+            tiles.append((bbox, members))
+            return
+        if depth >= 16:
+            # Centres quasi confondus : la subdivision ne sépare plus rien
+            for start in range(0, len(members), max_features):
+                tiles.append((bbox, members[start:start + max_features]))
+            return
+        minx, miny, maxx, maxy = bbox
+        mx, my = (minx + maxx) / 2, (miny + maxy) / 2
+        quads = {(0, 0): [], (1, 0): [], (0, 1): [], (1, 1): []}
+        for it in members:
+            quads[(int(it[2] >= mx), int(it[3] >= my))].append(it)
+        for (qx, qy), sub in quads.items():
+            if sub:
+                split((
+                    mx if qx else minx, my if qy else miny,
+                    maxx if qx else mx, maxy if qy else my,
+                ), sub, depth + 1)
+
+    for (gx, gy), members in sorted(grid.items()):
+        split((gx * tile_size, gy * tile_size,
+               (gx + 1) * tile_size, (gy + 1) * tile_size), members)
+    return tiles
+
+
+# ── Écriture OSM ──────────────────────────────────────────────────────────────
+
+class IdAllocator:
+    """
+    Ids négatifs uniques sur tout l'export (nœuds, ways, relations), et
+    table coordonnées arrondies → id partagée par toutes les tuiles.
+    """
+
+    def __init__(self):
+        self.next_id = -1
+        self.node_ids: dict[tuple[int, int], int] = {}
+
+    def __call__(self) -> int:
+        i = self.next_id
+        self.next_id -= 1
+        return i
+
+    def node(self, key: tuple[int, int]) -> int:
+        nid = self.node_ids.get(key)
+        if nid is None:
+            nid = self.node_ids[key] = self()
+        return nid
+
+
+class TileWriter:
+    """
+    Accumule une tuile (ways, relations et les nœuds qu'ils référencent)
+    puis l'écrit. Les ids de nœuds viennent de l'IdAllocator commun.
+    """
+
+    def __init__(self, new_id: IdAllocator):
+        self.new_id    = new_id
+        self.node_ids: dict[tuple[int, int], int] = {}
+        self.ways:     list[str] = []
+        self.relations: list[str] = []
+
+    def node(self, lon: float, lat: float) -> int:
+        key = (round(lon * COORD_SCALE), round(lat * COORD_SCALE))
+        nid = self.node_ids.get(key)
+        if nid is None:
+            nid = self.node_ids[key] = self.new_id.node(key)
+        return nid
+
+    @staticmethod
+    def _tags_xml(tags: dict) -> str:
+        return "".join(
+            f"    <tag k={quoteattr(k)} v={quoteattr(v)}/>\n" for k, v in tags.items()
+        )
+
+    def ring(self, coords, tags: dict | None = None) -> int:
+        refs = [self.node(x, y) for x, y, *_ in coords]
+        if refs[0] != refs[-1]:
+            refs.append(refs[0])
+        # Sommets consécutifs confondus après arrondi : on les fusionne
+        refs = [r for i, r in enumerate(refs) if i == 0 or r != refs[i - 1]]
+        wid = self.new_id()
+        body = "".join(f'    <nd ref="{r}"/>\n' for r in refs)
+        self.ways.append(
+            f'  <way id="{wid}">\n{body}{self._tags_xml(tags or {})}  </way>\n'
+        )
+        return wid
+
+    def add(self, geom, tags: dict) -> None:
+        polys = list(geom.geoms) if isinstance(geom, MultiPolygon) else [geom]
+        polys = [p for p in polys if isinstance(p, Polygon) and not p.is_empty]
+        if not polys:
+            return
+        if len(polys) == 1 and not polys[0].interiors:
+            self.ring(polys[0].exterior.coords, tags)
+            return
+
+        members = []
+        for p in polys:
+            members.append(("outer", self.ring(p.exterior.coords)))
+            members += [("inner", self.ring(r.coords)) for r in p.interiors]
+        rid = self.new_id()
+        body = "".join(
+            f'    <member type="way" ref="{ref}" role="{role}"/>\n' for role, ref in members
+        )
+        self.relations.append(
+            f'  <relation id="{rid}">\n{body}'
+            f'{self._tags_xml({"type": "multipolygon", **tags})}  </relation>\n'
+        )
+
+    def write(self, path: Path, fmt: str) -> None:
+        with open(path, "w", encoding="utf-8", buffering=1 << 20) as fh:
+            fh.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+            if fmt == "osc":
+                fh.write('<osmChange version="0.6" generator="s3db_to_osm">\n<create>\n')
+            else:
+                fh.write('<osm version="0.6" generator="s3db_to_osm" upload="false">\n')
+            for (x, y), nid in self.node_ids.items():
+                fh.write(
+                    f'  <node id="{nid}" '
+                    f'lat="{y / COORD_SCALE:.7f}" lon="{x / COORD_SCALE:.7f}"/>\n'
+                )
+            fh.writelines(self.ways)
+            fh.writelines(self.relations)
+            fh.write("</create>\n</osmChange>\n" if fmt == "osc" else "</osm>\n")
+
+
+# ── Pipeline ──────────────────────────────────────────────────────────────────
+
+def export(
+    src: Path,
+    out_dir: Path,
+    fmt: str,
+    tile_size: float,
+    max_features: int,
+    outline_layer: str = "building_outline",
+    parts_layer: str | None = "building_parts",
+) -> list[Path]:
+    con = sqlite3.connect(f"file:{src}?mode=ro", uri=True)
+    try:
+        log.info("▶ Passe 1 — emprises de %s", outline_layer)
+        outlines = scan_outlines(con, outline_layer)
+        parts_by_ref = scan_parts(con, parts_layer) if parts_layer else {}
+        log.info("  %d bâtiments | %d parts",
+                 len(outlines), sum(len(v) for v in parts_by_ref.values()))
+
+        tiles = build_tiles(outlines, tile_size, max_features)
+        log.info("▶ Passe 2 — %d tuiles (≤ %d bâtiments chacune)", len(tiles), max_features)
+
+        out_dir.mkdir(parents=True, exist_ok=True)
+        new_id = IdAllocator()
+        written: list[Path] = []
+        index_features = []
+
+        for n, (bbox, members) in enumerate(tiles, start=1):
+            writer = TileWriter(new_id)
+            for geom, tags in fetch_features(
+                con, outline_layer, [it[0] for it in members], OUTLINE_TAGS
+            ):
+                writer.add(geom, tags)
+            if parts_layer:
+                part_fids = [f for it in members for f in parts_by_ref.get(it[1], ())]
+                for geom, tags in fetch_features(con, parts_layer, part_fids, PART_TAGS):
+                    writer.add(geom, tags)
+
+            path = out_dir / f"tile_{n:04d}.{fmt}"
+            writer.write(path, fmt)
+            written.append(path)
+            log.debug("  %s : %d bâtiments, %d nœuds", path, len(members), len(writer.node_ids))
+
+            minx, miny, maxx, maxy = bbox
+            index_features.append({
+                "type": "Feature",
+                "geometry": {"type": "Polygon", "coordinates": [[
+                    [minx, miny], [maxx, miny], [maxx, maxy], [minx, maxy], [minx, miny],
+                ]]},
+                "properties": {
+                    "file": path.name,
+                    "buildings": len(members),
+                    "nodes": len(writer.node_ids),
+                },
+            })
+    finally:
+        con.close()
+
+    index_path = out_dir / "tiles.geojson"
+    with open(index_path, "w", encoding="utf-8") as fh:
+        json.dump({"type": "FeatureCollection", "features": index_features}, fh)
+    log.info("Index des tuiles : %s", index_path)
+    return written
+
+
+# ── CLI ───────────────────────────────────────────────────────────────────────
+
+def main() -> None:
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s  %(levelname)-8s  %(message)s",
+        datefmt="%H:%M:%S",
+    )
+    parser = argparse.ArgumentParser(
+        description="osm_3d_tags_<zone>.gpkg → .osm / .osc tuilés pour JOSM",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("--zone", "-z",
+        help="Code de zone à 5 chiffres (ex: 21004). Auto-détecté si absent.")
+    parser.add_argument("--format", choices=("osm", "osc"), default="osm",
+        help="OSM XML (ids négatifs) ou osmChange (<create>).")
+    parser.add_argument("--tile-size", type=float, default=DEFAULT_TILE_SIZE, metavar="DEG",
+        help="Taille de la grille de tuilage en degrés.")
+    parser.add_argument("--max-features", type=int, default=DEFAULT_MAX_FEATURES, metavar="N",
+        help="Nombre max de bâtiments par tuile (subdivision quadtree au-delà).")
+    parser.add_argument("--no-parts", action="store_true",
+        help="N'exporter que les outlines (sans building_parts).")
+    parser.add_argument("--output-dir", "-o",
+        help="Dossier de sortie (défaut : osm_3d_<zone>/).")
+    parser.add_argument("--verbose", "-v", action="store_true",
+        help="Détail par tuile.")
+    args = parser.parse_args()
+
+    if args.verbose:
+        logging.getLogger().setLevel(logging.DEBUG)
+
+    try:
+        zone, src = detect_gpkg(args.zone)
+        out_dir = Path(args.output_dir or f"osm_3d_{zone}")
+        written = export(
+            src, out_dir, args.format,
+            tile_size=args.tile_size,
+            max_features=args.max_features,
+            parts_layer=None if args.no_parts else "building_parts",
+        )
+        log.info("✅  %d fichiers .%s écrits dans %s/", len(written), args.format, out_dir)
+    except (FileNotFoundError, ValueError, sqlite3.Error) as exc:
+        log.error("❌ %s", exc)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -54,14 +54,27 @@ Usage :
   python urbis_3d_to_osm.py --cabanon-threshold 2.0  # seuil cabanon
   python urbis_3d_to_osm.py --flat-threshold 0.5     # seuil toit plat
   python urbis_3d_to_osm.py --keep-temp
+  python urbis_3d_to_osm.py --incremental        # seuls les BUSOLID_ID modifiés
+
+Mode incrémental (--incremental) :
+  Chaque BUSOLID_ID reçoit une empreinte (hash du WKB + TYPE de ses faces),
+  conservée dans urbis3d_manifest_<zone>.json. D'une release UrbIS à l'autre,
+  seuls les bâtiments nouveaux ou modifiés repassent dans le pipeline ; les
+  bâtiments disparus sont listés dans urbis3d_removed_<zone>.txt.
+  osm_3d_tags_<zone>.gpkg est mis à jour en place et reçoit une couche
+  `diff` (action = create / modify / delete) prête pour un changeset.
 """
 
 import argparse
 import glob
+import hashlib
+import json
 import logging
 import re
+import sqlite3
 import subprocess
 import sys
+import tempfile
 from pathlib import Path
 
 # ── Logging ───────────────────────────────────────────────────────────────────
@@ -99,7 +112,7 @@ def detect_zone(zone_arg: str | None) -> tuple[str, Path]:
         return zone_arg, src
 
     candidates = sorted(glob.glob("UrbISBuildings3D_[0-9]*.gpkg"))
-    candidates = [c for c in candidates if "_work" not in c]
+    candidates = [c for c in candidates if "_work" not in c and "_delta" not in c]
     if not candidates:
         raise FileNotFoundError(
             "Aucun fichier UrbISBuildings3D_XXXXX.gpkg trouvé dans le répertoire courant."
@@ -120,6 +133,105 @@ def drop_layer(gpkg: str, layer: str) -> None:
     )
 
 
+def remove_delta_files(delta_zone: str) -> None:
+    """
+    Supprime les GPKG intermédiaires du mode incrémental (<...>_<zone>_delta*).
+    ogr2ogr les écrit sans -overwrite : des restes d'un run précédent feraient
+    échouer le suivant ou y mêleraient d'anciennes lignes.
+    """
+    for p in sorted(Path(".").glob(f"*_{delta_zone}*.gpkg")):
+        p.unlink()
+        log.info("Supprimé (intermédiaire) : %s", p)
+
+
+def run_sql_file(cmd: list[str], sql: str, step: str) -> None:
+    """
+    Exécute une commande ogr2ogr/ogrinfo dont le SQL est passé via « -sql @fichier ».
+    Les listes IN (...) de milliers de BUSOLID_ID dépassent vite la taille
+    maximale d'une ligne de commande.
+    """
+    with tempfile.NamedTemporaryFile("w", suffix=".sql", delete=False, encoding="utf-8") as fh:
+        fh.write(sql)
+        sql_path = fh.name
+    try:
+        run(cmd + ["-sql", f"@{sql_path}"], step)
+    finally:
+        Path(sql_path).unlink(missing_ok=True)
+
+
+# ── Empreintes par bâtiment (mode incrémental) ────────────────────────────────
+
+def gpkg_blob_to_wkb(blob: bytes) -> bytes:
+    """
+    Retire l'en-tête GeoPackage (magic, version, flags, srs_id, enveloppe)
+    pour ne garder que le WKB de la géométrie.
+    """
+    if blob is None or blob[:2] != b"GP":
+        return blob or b""
+    envelope_code = (blob[3] >> 1) & 0x07
+    envelope_len  = {0: 0, 1: 32, 2: 48, 3: 48, 4: 64}.get(envelope_code, 0)
+    return blob[8 + envelope_len:]
+
+
+def fingerprint_buildings(src: Path) -> dict[str, str]:
+    """
+    Empreinte SHA-1 par BUSOLID_ID : hash trié des (TYPE, WKB) de toutes ses faces.
+    Lecture directe en SQLite (un GPKG est une base SQLite), sans passer par ogr2ogr.
+    Le tri des empreintes de faces rend le résultat indépendant de l'ordre des
+    lignes dans la release.
+    """
+    log.info("▶ Empreintes BUSOLID_ID (%s)", src)
+    con = sqlite3.connect(f"file:{src}?mode=ro", uri=True)
+    try:
+        rows = con.execute(
+            "SELECT BUSOLID_ID, TYPE, geom FROM BuildingFaces ORDER BY BUSOLID_ID"
+        )
+        fingerprints: dict[str, str] = {}
+        current_id = None
+        face_digests: list[str] = []
+
+        def flush() -> None:
+            if current_id is not None:
+                h = hashlib.sha1("".join(sorted(face_digests)).encode("ascii"))
+                fingerprints[str(current_id)] = h.hexdigest()
+
+        for busolid_id, face_type, blob in rows:
+            if busolid_id != current_id:
+                flush()
+                current_id = busolid_id
+                face_digests = []
+            h = hashlib.sha1(str(face_type).encode("utf-8"))
+            h.update(gpkg_blob_to_wkb(blob))
+            face_digests.append(h.hexdigest())
+        flush()
+    finally:
+        con.close()
+
+    log.info("  %d bâtiments", len(fingerprints))
+    return fingerprints
+
+
+def load_manifest(path: Path) -> dict | None:
+    if not path.exists():
+        return None
+    with open(path, encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def write_manifest(path: Path, src: Path, params: dict, fingerprints: dict[str, str]) -> None:
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(
+            {"source": src.name, "params": params, "buildings": fingerprints},
+            fh,
+        )
+    log.info("Manifeste écrit : %s (%d bâtiments)", path, len(fingerprints))
+
+
+def sql_id_list(ids) -> str:
+    """Liste SQL de BUSOLID_ID comparés en texte (CAST(... AS TEXT) IN (...))."""
+    return ", ".join("'" + str(i).replace("'", "''") + "'" for i in sorted(ids))
+
+
 # ── SQL factories ─────────────────────────────────────────────────────────────
 
 def sql_ground_ref() -> str:
@@ -572,6 +684,141 @@ def process(
     return outputs
 
 
+def process_incremental(
+    zone: str,
+    src: Path,
+    floor_height: float,
+    cabanon_threshold: float,
+    flat_threshold: float,
+    keep_temp: bool = False,
+) -> dict[str, Path]:
+    """
+    Ne reconvertit que les BUSOLID_ID nouveaux ou modifiés depuis le dernier run.
+
+    Sans manifeste, sans osm_3d_tags_<zone>.gpkg ou si les seuils ont changé,
+    on retombe sur une conversion complète (qui initialise le manifeste).
+    """
+    manifest_path = Path(f"urbis3d_manifest_{zone}.json")
+    removed_path  = Path(f"urbis3d_removed_{zone}.txt")
+    osm_gpkg      = Path(f"osm_3d_tags_{zone}.gpkg")
+    params = {
+        "floor_height":      floor_height,
+        "cabanon_threshold": cabanon_threshold,
+        "flat_threshold":    flat_threshold,
+    }
+
+    current  = fingerprint_buildings(src)
+    previous = load_manifest(manifest_path)
+
+    if previous is None or previous.get("params") != params or not osm_gpkg.exists():
+        log.info("Pas de manifeste exploitable pour la zone %s → conversion complète.", zone)
+        outputs = process(
+            zone, src, floor_height, cabanon_threshold, flat_threshold, keep_temp,
+        )
+        write_manifest(manifest_path, src, params, current)
+        outputs["manifest"] = manifest_path
+        return outputs
+
+    old = previous["buildings"]
+    added   = {i for i in current if i not in old}
+    changed = {i for i in current if i in old and old[i] != current[i]}
+    deleted = {i for i in old if i not in current}
+    log.info(
+        "Release %s → %s : %d nouveaux | %d modifiés | %d supprimés | %d inchangés",
+        previous.get("source"), src.name, len(added), len(changed), len(deleted),
+        len(current) - len(added) - len(changed),
+    )
+
+    outputs = {"osm_tags": osm_gpkg, "manifest": manifest_path}
+    if not (added or changed or deleted):
+        log.info("Aucun changement — osm_3d_tags_%s.gpkg laissé tel quel.", zone)
+        write_manifest(manifest_path, src, params, current)
+        return outputs
+
+    # ── Diff : anciennes géométries des bâtiments supprimés (action=delete) ──
+    drop_layer(str(osm_gpkg), "diff")
+    run_sql_file([
+        "ogr2ogr", "-f", "GPKG", "-update",
+        str(osm_gpkg), str(osm_gpkg),
+        "-dialect", "SQLITE",
+        "-nln", "diff",
+        "-nlt", "MULTIPOLYGON",
+    ], f"""
+        SELECT *, 'delete' AS action
+        FROM   building_outline
+        WHERE  CAST(osm_ref AS TEXT) IN ({sql_id_list(deleted)})
+    """, "Incrémental — couche diff (suppressions)")
+
+    delta_outputs: dict[str, Path] = {}
+    delta_zone = f"{zone}_delta"
+    todo = added | changed
+    if todo:
+        # ── Source réduite aux bâtiments à (re)convertir ─────────────────────
+        remove_delta_files(delta_zone)   # restes d'un run interrompu
+        delta_src  = Path(f"UrbISBuildings3D_{delta_zone}.gpkg")
+        run_sql_file([
+            "ogr2ogr", "-f", "GPKG", "-overwrite",
+            str(delta_src), str(src),
+            "-dialect", "SQLITE",
+            "-nln", "BuildingFaces",
+        ], f"""
+            SELECT * FROM BuildingFaces
+            WHERE  CAST(BUSOLID_ID AS TEXT) IN ({sql_id_list(todo)})
+        """, f"Incrémental — extraction de {len(todo)} bâtiments")
+
+        delta_outputs = process(
+            delta_zone, delta_src,
+            floor_height, cabanon_threshold, flat_threshold, keep_temp,
+        )
+        delta_osm = delta_outputs["osm_tags"]
+
+        run_sql_file([
+            "ogr2ogr", "-f", "GPKG", "-update", "-append",
+            str(osm_gpkg), str(delta_osm),
+            "-dialect", "SQLITE",
+            "-nln", "diff",
+            "-nlt", "MULTIPOLYGON",
+        ], f"""
+            SELECT *,
+                   CASE WHEN CAST(osm_ref AS TEXT) IN ({sql_id_list(changed) or "NULL"})
+                        THEN 'modify' ELSE 'create' END AS action
+            FROM   building_outline
+        """, "Incrémental — couche diff (créations / modifications)")
+
+    # ── Mise à jour en place des couches OSM ──────────────────────────────────
+    stale = changed | deleted
+    if stale:
+        for layer in ("building_outline", "building_parts"):
+            run_sql_file(
+                ["ogrinfo", str(osm_gpkg)],
+                f"DELETE FROM {layer} WHERE CAST(osm_ref AS TEXT) IN ({sql_id_list(stale)})",
+                f"Incrémental — retrait de {len(stale)} bâtiments de {layer}",
+            )
+
+    if todo:
+        for layer in ("building_outline", "building_parts"):
+            run([
+                "ogr2ogr", "-f", "GPKG", "-update", "-append",
+                str(osm_gpkg), str(delta_outputs["osm_tags"]), layer,
+                "-nln", layer,
+                "-nlt", "MULTIPOLYGON",
+            ], f"Incrémental — ajout des bâtiments convertis dans {layer}")
+
+    with open(removed_path, "w", encoding="utf-8") as fh:
+        for i in sorted(deleted):
+            fh.write(f"{i}\n")
+    log.info("Liste de suppression : %s (%d BUSOLID_ID)", removed_path, len(deleted))
+    outputs["removed"] = removed_path
+
+    write_manifest(manifest_path, src, params, current)
+
+    # Même avec --keep-temp : seules la couche diff et la liste de
+    # suppression restent d'un run incrémental
+    remove_delta_files(delta_zone)
+
+    return outputs
+
+
 # ── CLI ───────────────────────────────────────────────────────────────────────
 
 def main() -> None:
@@ -594,7 +841,13 @@ def main() -> None:
             "Au-delà, roof:shape est omis (toit pentu / non détectable)."
         ))
     parser.add_argument("--keep-temp", action="store_true",
-        help="Conserver les fichiers intermédiaires.")
+        help="Conserver les fichiers intermédiaires (hors _delta du mode incrémental).")
+    parser.add_argument("--incremental", "-i", action="store_true",
+        help=(
+            "Ne reconvertir que les BUSOLID_ID nouveaux/modifiés depuis le run "
+            "précédent (manifeste urbis3d_manifest_<zone>.json) et mettre à jour "
+            "osm_3d_tags_<zone>.gpkg en place."
+        ))
     parser.add_argument("--verbose", "-v", action="store_true",
         help="Afficher les commandes ogr2ogr complètes.")
     args = parser.parse_args()
@@ -608,7 +861,7 @@ def main() -> None:
 
     try:
         zone, src = detect_zone(args.zone)
-        outputs = process(
+        outputs = (process_incremental if args.incremental else process)(
             zone, src,
             floor_height=args.floor_height,
             cabanon_threshold=args.cabanon_threshold,
@@ -631,6 +884,8 @@ def main() -> None:
         log.info("  building_outline : building=yes | height | building:levels | cabanon_detected")
         log.info("  building_parts   : building:part=yes | part_type (wall_body/roof_part/cabanon)")
         log.info("                     height | min_height | roof:shape | roof:height | building:levels")
+        if args.incremental:
+            log.info("  diff             : action (create/modify/delete) — bâtiments changés")
 
     except (FileNotFoundError, ValueError, RuntimeError) as exc:
         log.error("❌ %s", exc)
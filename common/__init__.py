@@ -0,0 +1,6 @@
+"""
+Shared helpers for the analysis / comparison scripts of this repository.
+
+The scripts are run directly (``python amenity/xxx.py``), so they add the
+repository root to ``sys.path`` before importing from ``common``.
+"""
@@ -0,0 +1,197 @@
+"""
+Point maps that stay small and fast with any number of points.
+
+folium.Marker + MarkerCluster writes one block of JavaScript per point and
+clusters everything again in the browser: tens of thousands of points give
+a multi-megabyte HTML page that takes seconds to open. Here the clusters
+are computed in Python, once per zoom level, on a grid of CELL_PX screen
+pixels (Web Mercator quadtree), and embedded as flat number arrays:
+
+- zoom <= max_zoom: the precomputed clusters of that zoom (count badge,
+  click to zoom in) and the points alone in their cell;
+- zoom >  max_zoom: the individual points, with their popup.
+
+Only what falls inside the current view is added to the map, on a canvas
+renderer, so the browser never handles more than a few hundred markers.
+
+Usage:
+    m = folium.Map(location=..., zoom_start=12, prefer_canvas=True)
+    add_precomputed_clusters(m, lats, lons, popups)
+    m.save("map.html")
+"""
+
+import json
+
+import numpy as np
+from branca.element import MacroElement
+from jinja2 import Template
+
+CELL_PX = 64        # cluster grid cell, in screen pixels (divides TILE_PX)
+TILE_PX = 256
+MIN_ZOOM = 0
+MAX_ZOOM = 16       # beyond this zoom, points are drawn one by one
+COORD_DECIMALS = 5  # ~1 m
+
+
+def web_mercator_unit(lats, lons) -> tuple[np.ndarray, np.ndarray]:
+    """(lat, lon) degrees -> Web Mercator (x, y) in [0, 1], y pointing south."""
+    lats = np.clip(np.asarray(lats, dtype=np.float64), -85.05112878, 85.05112878)
+    lons = np.asarray(lons, dtype=np.float64)
+    x = (lons + 180.0) / 360.0
+    lat_rad = np.radians(lats)
+    y = (1.0 - np.log(np.tan(lat_rad) + 1.0 / np.cos(lat_rad)) / np.pi) / 2.0
+    return x, y
+
+
+def grid_clusters(lats, lons, zoom: int, cell_px: int = CELL_PX, xy=None):
+    """
+    Groups the points by grid cell of cell_px pixels at the given zoom.
+
+    Returns (clusters, single): clusters is a flat [lat, lon, count, ...]
+    list for the cells holding several points, single a boolean array
+    marking the points alone in their cell.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    if not len(lats):
+        return [], np.zeros(0, dtype=bool)
+    x, y = xy if xy is not None else web_mercator_unit(lats, lons)
+
+    # cell_px divides the tile size, so every cell splits into exactly four
+    # cells at the next zoom: a point alone at one zoom stays alone above it
+    cells_per_axis = 2 ** zoom * (TILE_PX // cell_px)
+    cx = np.minimum((x * cells_per_axis).astype(np.int64), cells_per_axis - 1)
+    cy = np.minimum((y * cells_per_axis).astype(np.int64), cells_per_axis - 1)
+    _, inverse, counts = np.unique(cx * cells_per_axis + cy, return_inverse=True, return_counts=True)
+
+    multi = counts > 1
+    c_lat = np.bincount(inverse, weights=lats)[multi] / counts[multi]
+    c_lon = np.bincount(inverse, weights=lons)[multi] / counts[multi]
+    clusters = np.column_stack((
+        np.round(c_lat, COORD_DECIMALS), np.round(c_lon, COORD_DECIMALS), counts[multi],
+    ))
+    return clusters.ravel().tolist(), ~multi[inverse]
+
+
+def cluster_levels(lats, lons, min_zoom: int = MIN_ZOOM, max_zoom: int = MAX_ZOOM,
+                   cell_px: int = CELL_PX) -> tuple[dict[int, list], np.ndarray]:
+    """
+    grid_clusters() for every zoom level from min_zoom to max_zoom.
+
+    Returns ({zoom: clusters}, single_from), single_from being for each
+    point the first zoom at which it is drawn on its own (max_zoom + 1 if
+    it stays in a cluster up to max_zoom).
+    """
+    xy = web_mercator_unit(lats, lons)
+    single_from = np.full(len(xy[0]), max_zoom + 1, dtype=np.int64)
+    levels = {}
+    for z in range(max_zoom, min_zoom - 1, -1):
+        levels[z], single = grid_clusters(lats, lons, z, cell_px, xy)
+        single_from[single] = z
+    return dict(sorted(levels.items())), single_from
+
+
+def cluster_payload(lats, lons, popups=None, min_zoom: int = MIN_ZOOM, max_zoom: int = MAX_ZOOM,
+                    cell_px: int = CELL_PX) -> dict:
+    """Everything the map needs, as compact JSON-ready lists."""
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    levels, single_from = cluster_levels(lats, lons, min_zoom, max_zoom, cell_px)
+    payload = {
+        "minZoom": min_zoom,
+        "maxZoom": max_zoom,
+        "points": np.round(np.column_stack((lats, lons)), COORD_DECIMALS).ravel().tolist(),
+        "singleFrom": single_from.tolist(),
+        "levels": levels,
+        "popups": None,
+        "popupIdx": None,
+    }
+    if popups is not None:
+        # Many points share the same popup text: each distinct text is stored once
+        texts, idx = np.unique(np.asarray(popups, dtype=object).astype(str), return_inverse=True)
+        payload["popups"] = texts.tolist()
+        payload["popupIdx"] = idx.tolist()
+    return payload
+
+
+class PrecomputedClusters(MacroElement):
+    """folium layer drawing a cluster_payload() for the current zoom and view."""
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var map = {{ this._parent.get_name() }};
+            var data = {{ this.data }};
+            var P = data.points, popups = data.popups, popupIdx = data.popupIdx;
+            var color = {{ this.color|tojson }};
+            var renderer = L.canvas({padding: 0.5});
+            var layer = L.layerGroup().addTo(map);
+
+            function pointMarker(i) {
+                var m = L.circleMarker([P[2 * i], P[2 * i + 1]], {
+                    renderer: renderer, radius: 5, weight: 1, color: color, fillOpacity: 0.7
+                });
+                if (popups) { m.bindPopup(popups[popupIdx[i]]); }
+                return m;
+            }
+
+            function clusterMarker(lat, lon, n, zoom) {
+                var size = n < 100 ? 30 : (n < 1000 ? 36 : 44);
+                var m = L.marker([lat, lon], {icon: L.divIcon({
+                    className: "",
+                    iconSize: [size, size],
+                    html: '<div style="width:' + size + 'px;height:' + size + 'px;line-height:' + size +
+                          'px;border-radius:50%;text-align:center;font:bold 12px sans-serif;color:#fff;' +
+                          'background:' + color + ';opacity:0.8">' + n + '</div>'
+                })});
+                m.on("click", function() { map.setView([lat, lon], Math.min(zoom + 2, data.maxZoom + 1)); });
+                return m;
+            }
+
+            function redraw() {
+                layer.clearLayers();
+                var zoom = map.getZoom(), b = map.getBounds().pad(0.2);
+                var s = b.getSouth(), n = b.getNorth(), w = b.getWest(), e = b.getEast();
+                function inView(lat, lon) { return lat >= s && lat <= n && lon >= w && lon <= e; }
+
+                if (zoom > data.maxZoom) {
+                    for (var i = 0; i < P.length / 2; i++) {
+                        if (inView(P[2 * i], P[2 * i + 1])) { layer.addLayer(pointMarker(i)); }
+                    }
+                    return;
+                }
+                var level = Math.max(zoom, data.minZoom), c = data.levels[level];
+                for (var k = 0; k < c.length; k += 3) {
+                    if (inView(c[k], c[k + 1])) {
+                        layer.addLayer(clusterMarker(c[k], c[k + 1], c[k + 2], zoom));
+                    }
+                }
+                for (var j = 0; j < data.singleFrom.length; j++) {
+                    if (data.singleFrom[j] <= level && inView(P[2 * j], P[2 * j + 1])) {
+                        layer.addLayer(pointMarker(j));
+                    }
+                }
+            }
+
+            map.on("moveend", redraw);
+            redraw();
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, payload: dict, color: str = "#3388ff"):
+        super().__init__()
+        self._name = "PrecomputedClusters"
+        # "<" escaped so popup text can never close the <script> element
+        self.data = json.dumps(payload, separators=(",", ":")).replace("<", "\\u003c")
+        self.color = color
+
+
+def add_precomputed_clusters(m, lats, lons, popups=None, color: str = "#3388ff",
+                             max_zoom: int = MAX_ZOOM, cell_px: int = CELL_PX) -> PrecomputedClusters:
+    """Adds the points to folium map m as a precomputed cluster layer."""
+    layer = PrecomputedClusters(
+        cluster_payload(lats, lons, popups, max_zoom=max_zoom, cell_px=cell_px), color,
+    )
+    layer.add_to(m)
+    return layer
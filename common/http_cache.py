@@ -0,0 +1,172 @@
+"""
+Caching HTTP client for the open-data endpoints used by the compare scripts.
+
+- one pooled requests.Session per process (keep-alive, gzip accepted);
+- responses stored on disk (body + .meta.json) and served without any
+  network I/O while younger than their TTL;
+- older entries are revalidated with a conditional GET (If-None-Match /
+  If-Modified-Since): a 304 only refreshes the timestamp;
+- if the network fails, a cached copy is served with a warning;
+- offline mode ($OSM_BE_OFFLINE=1 or set_offline(True)) only reads the
+  cache, and fails on a miss;
+- download() streams large files (archives) to a path chosen by the caller,
+  through the same session and offline switch, without keeping them in memory.
+
+Cache directory: $OSM_BE_HTTP_CACHE_DIR, default $OSM_BE_CACHE_DIR/http
+(~/.cache/osm-python-analyse-belgium/http). Pointing it at a directory of
+recorded responses and enabling offline mode lets CI run on fixtures.
+"""
+
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from common.paths import OSM_BE_CACHE_DIR
+
+CACHE_DIR = Path(os.environ.get("OSM_BE_HTTP_CACHE_DIR", OSM_BE_CACHE_DIR / "http"))
+
+DEFAULT_TTL = 3600  # seconds
+
+_offline = os.environ.get("OSM_BE_OFFLINE") == "1"
+_session: requests.Session | None = None
+
+
+class OfflineCacheMiss(requests.RequestException):
+    """Offline mode and no cached response for this URL."""
+
+
+def set_offline(offline: bool = True) -> None:
+    global _offline
+    _offline = offline
+
+
+def is_offline() -> bool:
+    return _offline
+
+
+def session() -> requests.Session:
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=8, max_retries=2)
+        _session.mount("https://", adapter)
+        _session.mount("http://", adapter)
+        _session.headers["Accept-Encoding"] = "gzip, deflate"
+    return _session
+
+
+class CachedResponse:
+    """Subset of requests.Response used by the scripts."""
+
+    def __init__(self, url: str, content: bytes, meta: dict, from_cache: bool):
+        self.url = url
+        self.content = content
+        self.status_code = 200
+        self.headers = {"Content-Type": meta.get("content_type") or ""}
+        self.from_cache = from_cache
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8")
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self) -> None:
+        pass
+
+
+def _paths(url: str) -> tuple[Path, Path]:
+    key = hashlib.sha1(url.encode()).hexdigest()
+    return CACHE_DIR / f"{key}.body", CACHE_DIR / f"{key}.meta.json"
+
+
+def _serve(url: str, body: Path, meta: dict, from_cache: bool) -> CachedResponse:
+    return CachedResponse(url, body.read_bytes(), meta, from_cache)
+
+
+def get(url: str, ttl: float = DEFAULT_TTL, timeout: float = 60) -> CachedResponse:
+    """
+    GET url through the cache. ttl (seconds) is how long a stored response
+    is served without contacting the server; 0 always revalidates.
+    """
+    body, meta_path = _paths(url)
+    meta = json.loads(meta_path.read_text()) if meta_path.exists() and body.exists() else {}
+
+    if meta and (_offline or time.time() - meta.get("fetched_at", 0) < ttl):
+        return _serve(url, body, meta, from_cache=True)
+    if _offline:
+        raise OfflineCacheMiss(f"offline mode: {url} is not cached in {CACHE_DIR}")
+
+    headers = {}
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+
+    try:
+        r = session().get(url, headers=headers, timeout=timeout)
+        if r.status_code != 304:
+            r.raise_for_status()
+    except requests.RequestException as exc:
+        if not meta:
+            raise
+        print(f"  ! {exc} — serving cached copy of {url}")
+        return _serve(url, body, meta, from_cache=True)
+
+    if r.status_code == 304:
+        meta["fetched_at"] = time.time()
+        meta_path.write_text(json.dumps(meta, indent=2))
+        return _serve(url, body, meta, from_cache=True)
+
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    part = body.with_name(body.name + ".part")
+    part.write_bytes(r.content)
+    os.replace(part, body)
+    meta = {
+        "url":           url,
+        "etag":          r.headers.get("ETag"),
+        "last_modified": r.headers.get("Last-Modified"),
+        "content_type":  r.headers.get("Content-Type"),
+        "fetched_at":    time.time(),
+    }
+    meta_path.write_text(json.dumps(meta, indent=2))
+    return CachedResponse(url, r.content, meta, from_cache=False)
+
+
+def download(url: str, dest: Path, timeout: float = 600, chunk_size: int = 1 << 20) -> Path:
+    """
+    Stream url into dest (written as dest.part, renamed when complete).
+    Nothing is kept in the response cache: the caller decides what to keep
+    of dest. Offline mode raises OfflineCacheMiss, an incomplete transfer
+    a RequestException.
+    """
+    if _offline:
+        raise OfflineCacheMiss(f"offline mode: cannot download {url}")
+    dest = Path(dest)
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    part = dest.with_name(dest.name + ".part")
+    with session().get(url, stream=True, timeout=timeout) as r:
+        r.raise_for_status()
+        # Content-Length counts encoded bytes: only comparable when not gzipped
+        total = 0 if r.headers.get("Content-Encoding") else int(r.headers.get("Content-Length", 0))
+        done = 0
+        with open(part, "wb") as fh:
+            for chunk in r.iter_content(chunk_size=chunk_size):
+                fh.write(chunk)
+                done += len(chunk)
+                if total:
+                    print(f"\r  {done >> 20} MB / {total >> 20} MB ({done * 100 // total}%)",
+                          end="", flush=True)
+    if total:
+        print()
+    if total and done != total:
+        part.unlink()
+        raise requests.RequestException(f"incomplete download of {url}: {done} / {total} bytes")
+    os.replace(part, dest)
+    return dest
@@ -0,0 +1,83 @@
+"""
+Optimal one-to-one matching between two point sets.
+
+Nearest-neighbour matching lets several reference points claim the same OSM
+object, and greedy "best per row" matching hands out pairs in input order.
+Here candidate pairs within a radius form a sparse bipartite graph, and
+each connected component of that graph is solved exactly with
+scipy.sparse.csgraph.min_weight_full_bipartite_matching: the result
+maximises the number of pairs, then minimises their total distance.
+
+Components are small in practice (a few points around each street corner),
+so whole cities stay tractable: the cost is driven by the radius query,
+not by the n x m distance matrix.
+"""
+
+import numpy as np
+from scipy.sparse import coo_matrix, csr_matrix, hstack, identity
+from scipy.sparse.csgraph import connected_components, min_weight_full_bipartite_matching
+from scipy.spatial import cKDTree
+
+
+def optimal_assignment(rows, cols, dists, n_rows: int, n_cols: int) -> list[tuple[int, int, float]]:
+    """
+    Exclusive pairs from candidate edges (rows[k], cols[k], dists[k]).
+
+    Returns (row, col, dist) triples; every row and every column appears at
+    most once. Rows or columns without candidate edges are left unmatched.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    cols = np.asarray(cols, dtype=np.int64)
+    dists = np.asarray(dists, dtype=float)
+    if not len(rows):
+        return []
+
+    # Components of the bipartite graph: rows are 0..n_rows-1, columns follow
+    graph = coo_matrix(
+        (np.ones(len(rows)), (rows, cols + n_rows)),
+        shape=(n_rows + n_cols, n_rows + n_cols),
+    )
+    _, labels = connected_components(graph, directed=False)
+    edge_label = labels[rows]
+
+    pairs: list[tuple[int, int, float]] = []
+    order = np.argsort(edge_label, kind="stable")
+    bounds = np.flatnonzero(np.diff(edge_label[order])) + 1
+    for chunk in np.split(order, bounds):
+        r, c, d = rows[chunk], cols[chunk], dists[chunk]
+        if len(chunk) == 1:
+            pairs.append((int(r[0]), int(c[0]), float(d[0])))
+            continue
+
+        ur, r_loc = np.unique(r, return_inverse=True)
+        uc, c_loc = np.unique(c, return_inverse=True)
+        if len(ur) == 1 or len(uc) == 1:
+            best = int(np.argmin(d))
+            pairs.append((int(r[best]), int(c[best]), float(d[best])))
+            continue
+
+        # +1 keeps zero distances as explicit edges; one private dummy column
+        # per row costs more than any set of real edges, so the solver first
+        # maximises the number of real pairs, then minimises their distance.
+        real = csr_matrix((d + 1.0, (r_loc, c_loc)), shape=(len(ur), len(uc)))
+        penalty = float(real.sum()) + 1.0
+        dummy = identity(len(ur), format="csr") * penalty
+        row_ind, col_ind = min_weight_full_bipartite_matching(hstack([real, dummy]).tocsr())
+
+        weight = {(a, b): x for a, b, x in zip(r_loc, c_loc, d)}
+        for a, b in zip(row_ind, col_ind):
+            if b < len(uc):
+                pairs.append((int(ur[a]), int(uc[b]), float(weight[(a, b)])))
+
+    return pairs
+
+
+def optimal_pairs(a_xy: np.ndarray, b_xy: np.ndarray, radius: float) -> list[tuple[int, int, float]]:
+    """
+    Exclusive pairs between projected point sets a and b (metres), only
+    between points closer than radius.
+    """
+    if not len(a_xy) or not len(b_xy):
+        return []
+    dok = cKDTree(a_xy).sparse_distance_matrix(cKDTree(b_xy), radius, output_type="ndarray")
+    return optimal_assignment(dok["i"], dok["j"], dok["v"], len(a_xy), len(b_xy))
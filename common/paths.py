@@ -0,0 +1,15 @@
+"""
+On-disk locations shared by the scripts.
+
+OSM_BE_CACHE_DIR is the root of every local cache ($OSM_BE_CACHE_DIR,
+default ~/.cache/osm-python-analyse-belgium). Each store keeps its own
+subdirectory (pbf/, http/, conflation/, wikidata/, trees/) and builds it
+from this constant, never from another store's directory.
+"""
+
+import os
+from pathlib import Path
+
+OSM_BE_CACHE_DIR = Path(
+    os.environ.get("OSM_BE_CACHE_DIR", Path.home() / ".cache" / "osm-python-analyse-belgium")
+)
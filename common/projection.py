@@ -0,0 +1,97 @@
+"""
+Vectorised projections for the compare and QA scripts.
+
+Every function takes and returns NumPy arrays (scalars work too), so a
+whole column of coordinates is projected in one call instead of one
+Python call per point:
+
+- equirectangular() / equirectangular_inverse(): local plane in metres,
+  good enough at city scale (a few km around ref_lat);
+- to_lambert72() / from_lambert72(): exact EPSG:4326 <-> EPSG:31370
+  (Belgian Lambert 72) through pyproj, with transformers built once;
+- transform_geometry(): applies one of the above to all coordinates of a
+  shapely geometry in a single call (shapely.transform).
+
+Coordinate order is always (lon, lat) / (x, y), like pyproj with
+always_xy=True and shapely.
+"""
+
+import math
+from functools import lru_cache
+
+import numpy as np
+
+M_PER_DEG_LAT = 110_540.0
+M_PER_DEG_LON = 111_320.0
+
+
+def _lon_scale(ref_lat: float) -> float:
+    return M_PER_DEG_LON * math.cos(math.radians(ref_lat))
+
+
+def equirectangular(lons, lats, ref_lat: float | None = None,
+                    m_per_deg_lat: float = M_PER_DEG_LAT) -> tuple[np.ndarray, np.ndarray]:
+    """(lon, lat) degrees -> (x, y) metres. ref_lat defaults to the mean latitude."""
+    lons = np.asarray(lons, dtype=np.float64)
+    lats = np.asarray(lats, dtype=np.float64)
+    if ref_lat is None:
+        ref_lat = float(lats.mean()) if lats.size else 0.0
+    return lons * _lon_scale(ref_lat), lats * m_per_deg_lat
+
+
+def equirectangular_inverse(x, y, ref_lat: float,
+                            m_per_deg_lat: float = M_PER_DEG_LAT) -> tuple[np.ndarray, np.ndarray]:
+    """(x, y) metres -> (lon, lat) degrees, inverse of equirectangular()."""
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    return x / _lon_scale(ref_lat), y / m_per_deg_lat
+
+
+@lru_cache(maxsize=None)
+def transformer(src: str, dst: str):
+    """pyproj Transformer, built once per (src, dst) pair and process."""
+    from pyproj import Transformer
+    return Transformer.from_crs(src, dst, always_xy=True)
+
+
+def to_lambert72(lons, lats) -> tuple[np.ndarray, np.ndarray]:
+    """WGS84 (lon, lat) -> Belgian Lambert 72 (x, y), exact."""
+    x, y = transformer("EPSG:4326", "EPSG:31370").transform(
+        np.asarray(lons, dtype=np.float64), np.asarray(lats, dtype=np.float64))
+    return np.asarray(x), np.asarray(y)
+
+
+def from_lambert72(x, y) -> tuple[np.ndarray, np.ndarray]:
+    """Belgian Lambert 72 (x, y) -> WGS84 (lon, lat), exact."""
+    lons, lats = transformer("EPSG:31370", "EPSG:4326").transform(
+        np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64))
+    return np.asarray(lons), np.asarray(lats)
+
+
+def transform_geometry(geom, func):
+    """
+    Apply func(xs, ys) -> (xs, ys) to every coordinate of a shapely geometry
+    (or array of geometries) in a single vectorised call.
+    """
+    import shapely
+
+    def apply(coords: np.ndarray) -> np.ndarray:
+        xs, ys = func(coords[:, 0], coords[:, 1])
+        return np.column_stack((xs, ys))
+
+    return shapely.transform(geom, apply)
+
+
+def buffer_wgs84(geom, meters: float, resolution: int = 32):
+    """
+    Buffer a WGS84 geometry by an approximate metric distance, through a
+    local equirectangular plane centred on the geometry.
+    """
+    ref_lat = geom.centroid.y
+    # 111 320 m per degree on both axes: the historical setting of the
+    # extract scripts, kept so the clipped snapshots do not move.
+    projected = transform_geometry(
+        geom, lambda x, y: equirectangular(x, y, ref_lat, m_per_deg_lat=M_PER_DEG_LON))
+    buffered = projected.buffer(meters, resolution=resolution)
+    return transform_geometry(
+        buffered, lambda x, y: equirectangular_inverse(x, y, ref_lat, m_per_deg_lat=M_PER_DEG_LON))
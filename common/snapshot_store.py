@@ -0,0 +1,187 @@
+"""
+Local store for the Brussels PBF snapshots published in pbf_analyse/history/.
+
+All comparison scripts resolve their PBF through snapshot_path(), which
+returns a verified local file and only downloads when the published file
+has changed:
+
+1. history-list.json (a few KB) gives the published size and date of every
+   snapshot. A local copy — the repository checkout (LFS) or the cache —
+   whose size matches is used as is, without touching the PBF URL.
+2. Otherwise the cached copy is revalidated with a conditional GET
+   (If-None-Match / If-Modified-Since) on the raw GitHub URL; the file is
+   streamed to disk only on a 200.
+3. If the network is unavailable, an existing local copy is used with a
+   warning.
+
+Resolved paths are memoised per process: several comparisons run in the
+same session share one file and one check.
+
+Cache directory: $OSM_BE_CACHE_DIR/pbf (default ~/.cache/osm-python-analyse-belgium/pbf).
+"""
+
+import json
+import os
+import sys
+from pathlib import Path
+
+import requests
+
+from common.paths import OSM_BE_CACHE_DIR
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+REPO_HISTORY_DIR = REPO_ROOT / "pbf_analyse" / "history"
+
+RAW_BASE = (
+    "https://raw.githubusercontent.com/PasLoin/"
+    "Osm-python-analyse_Belgium/main/pbf_analyse"
+)
+# Files tracked with Git LFS are served as pointers on raw.githubusercontent.com
+MEDIA_BASE = (
+    "https://media.githubusercontent.com/media/PasLoin/"
+    "Osm-python-analyse_Belgium/main/pbf_analyse"
+)
+HISTORY_LIST_URL = f"{RAW_BASE}/history-list.json"
+
+DAILY_FILENAME = "Brussels-daily.pbf"
+
+CACHE_DIR = OSM_BE_CACHE_DIR / "pbf"
+
+LFS_POINTER_PREFIX = b"version https://git-lfs"
+
+_resolved: dict[str, str] = {}
+_history: list[dict] | None = None
+
+
+def is_lfs_pointer(path: Path) -> bool:
+    with open(path, "rb") as fh:
+        return fh.read(len(LFS_POINTER_PREFIX)) == LFS_POINTER_PREFIX
+
+
+def fetch_history_list() -> list[dict]:
+    """
+    history-list.json, fetched once per process. Falls back to the copy in
+    the repository checkout, then to an empty list.
+    """
+    global _history
+    if _history is None:
+        try:
+            r = requests.get(HISTORY_LIST_URL, timeout=30)
+            r.raise_for_status()
+            _history = r.json()
+        except (requests.RequestException, ValueError) as exc:
+            print(f"  ! history-list.json unavailable: {exc}")
+            local = REPO_HISTORY_DIR.parent / "history-list.json"
+            _history = json.loads(local.read_text()) if local.exists() else []
+    return _history
+
+
+def _meta_path(path: Path) -> Path:
+    return path.with_name(path.name + ".meta.json")
+
+
+def _read_meta(path: Path) -> dict:
+    meta = _meta_path(path)
+    return json.loads(meta.read_text()) if meta.exists() else {}
+
+
+def _download(urls: list[str], dest: Path, meta: dict) -> bool:
+    """
+    Conditional streamed download of the first usable URL into dest.
+    Returns True if dest was (re)written, False on 304 Not Modified.
+    """
+    headers = {}
+    if dest.exists():
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    for url in urls:
+        with requests.get(url, headers=headers, stream=True, timeout=600) as r:
+            if r.status_code == 304:
+                return False
+            r.raise_for_status()
+            total = int(r.headers.get("content-length", 0))
+            part = dest.with_name(dest.name + ".part")
+            written = 0
+            with open(part, "wb") as fh:
+                for chunk in r.iter_content(chunk_size=1 << 20):
+                    fh.write(chunk)
+                    written += len(chunk)
+            if total and written != total:
+                part.unlink()
+                raise requests.RequestException(
+                    f"incomplete download of {url} ({written}/{total} bytes)"
+                )
+            if is_lfs_pointer(part):
+                part.unlink()
+                headers = {}   # the pointer's ETag says nothing about the media file
+                continue
+            os.replace(part, dest)
+            meta.update({
+                "url":           url,
+                "etag":          r.headers.get("ETag"),
+                "last_modified": r.headers.get("Last-Modified"),
+                "size_bytes":    written,
+            })
+            return True
+    raise requests.RequestException(f"no usable PBF behind {urls[0]}")
+
+
+def snapshot_path(filename: str = DAILY_FILENAME, offline: bool | None = None) -> str:
+    """
+    Local, verified path of a published snapshot (Brussels-daily.pbf or a
+    dated DD_MM_YYYY_brussels_capital_region.pbf). Downloads only if the
+    published file differs from every local copy. offline defaults to
+    $OSM_BE_OFFLINE=1, like common.http_cache.
+    """
+    if offline is None:
+        offline = os.environ.get("OSM_BE_OFFLINE") == "1"
+    if filename in _resolved:
+        return _resolved[filename]
+
+    cached = CACHE_DIR / filename
+    checkout = REPO_HISTORY_DIR / filename
+    local = [p for p in (checkout, cached) if p.exists() and not is_lfs_pointer(p)]
+
+    entry = None
+    if not offline:
+        entry = next((e for e in fetch_history_list() if e.get("filename") == filename), None)
+
+    if entry is not None:
+        for p in local:
+            same_size = p.stat().st_size == entry.get("size_bytes")
+            same_date = p == checkout or _read_meta(p).get("date") == entry.get("date")
+            if same_size and same_date:
+                print(f"Snapshot {filename} : local copy up to date ({p})")
+                _resolved[filename] = str(p)
+                return str(p)
+
+    if offline:
+        if not local:
+            sys.exit(f"Snapshot {filename} not available locally (offline mode).")
+        _resolved[filename] = str(local[0])
+        return str(local[0])
+
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    meta = _read_meta(cached)
+    urls = [entry["url"]] if entry and entry.get("url") else [f"{RAW_BASE}/history/{filename}"]
+    urls.append(f"{MEDIA_BASE}/history/{filename}")
+    try:
+        print(f"Snapshot {filename} : checking {urls[0]} …")
+        changed = _download(urls, cached, meta)
+    except requests.RequestException as exc:
+        if not local:
+            sys.exit(f"Unable to download snapshot {filename}: {exc}")
+        print(f"  ! {exc} — using local copy {local[0]}")
+        _resolved[filename] = str(local[0])
+        return str(local[0])
+
+    if entry is not None:
+        meta["date"] = entry.get("date")
+    _meta_path(cached).write_text(json.dumps(meta, indent=2))
+    size_mb = cached.stat().st_size / 1_048_576
+    print(f"  -> {'downloaded' if changed else 'not modified (304)'}: {cached} ({size_mb:.1f} MB)")
+    _resolved[filename] = str(cached)
+    return str(cached)
@@ -0,0 +1,381 @@
+"""
+Street-coverage route on the real road graph, computed offline from a PBF.
+
+streets_names_to_tsp_resolution.py orders the streets by crow-flies distance
+and leaves the actual routing to ORS / BRouter. Here the route is built on
+the highway ways of the PBF itself, as a rural postman problem: every way of
+a requested street must be travelled, the rest of the road network is only
+used to go from one street to the next.
+
+  1. one pass over the PBF keeps the routable highway ways (node refs and
+     locations) and flags the ways of the requested streets;
+  2. the ways are split at intersections into segments; the graph of
+     intersections is stored as a CSR matrix (scipy.sparse), segment
+     geometry stays in flat NumPy arrays;
+  3. rural postman heuristic (Frederickson): the requested segments are
+     joined by a minimum spanning tree of shortest paths between their
+     connected pieces, odd-degree vertices are paired by shortest paths
+     (minimum-weight matching, greedy for very large sets), and an Euler
+     circuit of the result gives one closed route;
+  4. the circuit is expanded back to node coordinates: one continuous track.
+
+The graph is undirected (oneway and access are ignored): it is meant for a
+survey on foot or by bike.
+
+Usage:
+    python streets_names_to_tsp_resolution.py --coverage --streets rues.txt \\
+        --pbf brussels_capital_region.pbf --gpx coverage.gpx
+"""
+
+from array import array
+from dataclasses import dataclass
+
+import networkx as nx
+import numpy as np
+import osmium
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components, dijkstra, minimum_spanning_tree
+
+EARTH_RADIUS_M = 6_371_008.8
+# highway=* values that are not part of the travelled network
+NOT_ROUTABLE = {
+    'proposed', 'construction', 'abandoned', 'disused', 'razed', 'platform', 'bus_stop',
+    'elevator', 'raceway', 'rest_area', 'services', 'emergency_bay', 'via_ferrata',
+}
+EXACT_MATCHING_MAX = 200   # odd vertices; above this they are paired greedily
+DIJKSTRA_CHUNK = 64        # sources per dijkstra call (rows of n_vertices floats)
+MATCH_RADIUS_M = 3000.0    # odd vertices are first paired within this distance
+
+
+# ── PBF scan ───────────────────────────────────────────────────────────────────
+class RoadGraphHandler(osmium.SimpleHandler):
+    """
+    Routable highway ways, one pass. match_name(tags) returns the requested
+    street a way belongs to, or None.
+    """
+
+    def __init__(self, match_name):
+        super(RoadGraphHandler, self).__init__()
+        self.match_name = match_name
+        # Way nodes of all ways, concatenated; way_starts[i] = first position of way i
+        self.refs = array('q')
+        self.lats = array('d')
+        self.lons = array('d')
+        self.way_starts = array('q')
+        self.way_street: list[str | None] = []
+
+    def way(self, w):
+        highway = w.tags.get('highway')
+        if highway is None or highway in NOT_ROUTABLE:
+            return
+        # Nodes outside the extract have no location: they are left out
+        nodes = [(n.ref, n.lat, n.lon) for n in w.nodes if n.location.valid()]
+        if len(nodes) < 2:
+            return
+        self.way_starts.append(len(self.refs))
+        self.way_street.append(self.match_name(w.tags))
+        for ref, lat, lon in nodes:
+            self.refs.append(ref)
+            self.lats.append(lat)
+            self.lons.append(lon)
+
+
+# ── Road graph ─────────────────────────────────────────────────────────────────
+@dataclass
+class RoadGraph:
+    """
+    Intersection graph of the road network.
+
+    Segment i runs from vertex seg_u[i] to seg_v[i] along the way nodes
+    pos_lat/pos_lon[seg_a[i]:seg_b[i] + 1]. csr holds, for every pair of
+    adjacent vertices, the length of the shortest segment between them,
+    pair_segment gives that segment.
+    """
+    vertex_refs: np.ndarray
+    pos_lat: np.ndarray
+    pos_lon: np.ndarray
+    seg_a: np.ndarray
+    seg_b: np.ndarray
+    seg_u: np.ndarray
+    seg_v: np.ndarray
+    seg_len: np.ndarray
+    seg_street: np.ndarray    # index in street_names, -1 outside the requested streets
+    street_names: list
+    csr: csr_matrix
+    pair_segment: dict
+
+    @property
+    def n_vertices(self) -> int:
+        return len(self.vertex_refs)
+
+    def segment_coords(self, i: int, from_vertex: int) -> np.ndarray:
+        """(lat, lon) points of segment i, travelled from from_vertex."""
+        coords = np.column_stack((self.pos_lat[self.seg_a[i]:self.seg_b[i] + 1],
+                                  self.pos_lon[self.seg_a[i]:self.seg_b[i] + 1]))
+        return coords if from_vertex == self.seg_u[i] else coords[::-1]
+
+
+def step_lengths(lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Haversine length (m) between consecutive points."""
+    lat, lon = np.radians(lats), np.radians(lons)
+    a = (np.sin(np.diff(lat) / 2) ** 2
+         + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lon) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def build_road_graph(handler: RoadGraphHandler) -> RoadGraph:
+    refs = np.frombuffer(handler.refs, dtype=np.int64)
+    lats = np.frombuffer(handler.lats, dtype=np.float64)
+    lons = np.frombuffer(handler.lons, dtype=np.float64)
+    starts = np.frombuffer(handler.way_starts, dtype=np.int64)
+    ends = np.append(starts[1:], len(refs))
+    way_of_pos = np.repeat(np.arange(len(starts)), ends - starts)
+
+    # Vertices: nodes shared by several ways (or twice by one) and way ends
+    _, inverse, counts = np.unique(refs, return_inverse=True, return_counts=True)
+    is_vertex = counts[inverse] > 1
+    is_vertex[starts] = True
+    is_vertex[ends - 1] = True
+
+    # Cumulated length along the concatenated ways, reset between ways
+    steps = step_lengths(lats, lons)
+    steps[way_of_pos[1:] != way_of_pos[:-1]] = 0.0
+    cum = np.concatenate(([0.0], np.cumsum(steps)))
+
+    # Segments: consecutive vertex positions of the same way
+    vpos = np.flatnonzero(is_vertex)
+    same_way = way_of_pos[vpos[:-1]] == way_of_pos[vpos[1:]]
+    seg_a, seg_b = vpos[:-1][same_way], vpos[1:][same_way]
+    seg_len = cum[seg_b] - cum[seg_a]
+
+    vertex_refs = np.unique(refs[vpos])
+    seg_u = np.searchsorted(vertex_refs, refs[seg_a])
+    seg_v = np.searchsorted(vertex_refs, refs[seg_b])
+    street_names = sorted({s for s in handler.way_street if s is not None})
+    code = {name: i for i, name in enumerate(street_names)}
+    way_street = np.array([code.get(s, -1) for s in handler.way_street], dtype=np.int64)
+    seg_street = way_street[way_of_pos[seg_a]]
+
+    # CSR adjacency: shortest segment per vertex pair, loops left out
+    lo, hi = np.minimum(seg_u, seg_v), np.maximum(seg_u, seg_v)
+    edge = np.flatnonzero(lo != hi)
+    edge = edge[np.lexsort((seg_len[edge], hi[edge], lo[edge]))]
+    first = np.ones(len(edge), dtype=bool)
+    first[1:] = (lo[edge][1:] != lo[edge][:-1]) | (hi[edge][1:] != hi[edge][:-1])
+    edge = edge[first]
+    # csgraph reads an explicit 0 as "no edge": zero-length segments get 1 mm
+    weight = np.maximum(seg_len[edge], 1e-3)
+    n = len(vertex_refs)
+    csr = csr_matrix(
+        (np.concatenate((weight, weight)),
+         (np.concatenate((lo[edge], hi[edge])), np.concatenate((hi[edge], lo[edge])))),
+        shape=(n, n),
+    )
+    pair_segment = dict(zip(zip(lo[edge].tolist(), hi[edge].tolist()), edge.tolist()))
+
+    return RoadGraph(vertex_refs, lats, lons, seg_a, seg_b, seg_u, seg_v, seg_len,
+                     seg_street, street_names, csr, pair_segment)
+
+
+def read_road_graph(pbf_file: str, match_name, node_index: str = 'flex_mem') -> RoadGraph:
+    handler = RoadGraphHandler(match_name)
+    # filters= (pyosmium >= 4.0): only highway ways reach the Python handler
+    handler.apply_file(pbf_file, locations=True, idx=node_index,
+                       filters=[osmium.filter.KeyFilter('highway')])
+    return build_road_graph(handler)
+
+
+# ── Shortest paths ─────────────────────────────────────────────────────────────
+# csr is symmetric: dijkstra(directed=True) walks it as is, directed=False
+# would convert it again on every call.
+def walk_back(predecessors: np.ndarray, target: int) -> list[int]:
+    """Vertex path ending at target, from a dijkstra predecessor row."""
+    path = [target]
+    while predecessors[path[-1]] >= 0:
+        path.append(int(predecessors[path[-1]]))
+    return path[::-1]
+
+
+def pairwise_distances(graph: RoadGraph, vertices: np.ndarray, limit: float = np.inf) -> np.ndarray:
+    """Shortest-path distances between the given vertices (inf beyond limit), a few sources at a time."""
+    out = np.empty((len(vertices), len(vertices)))
+    for i in range(0, len(vertices), DIJKSTRA_CHUNK):
+        dist = dijkstra(graph.csr, directed=True, indices=vertices[i:i + DIJKSTRA_CHUNK], limit=limit)
+        out[i:i + DIJKSTRA_CHUNK] = dist[:, vertices]
+    return out
+
+
+def paths_between(graph: RoadGraph, pairs: list[tuple[int, int]], lengths: list[float]) -> list[list[int]]:
+    """Shortest vertex path of every (source, target) pair, lengths being their known distances."""
+    paths = []
+    for i in range(0, len(pairs), DIJKSTRA_CHUNK):
+        chunk = pairs[i:i + DIJKSTRA_CHUNK]
+        # Nothing farther than the longest path of the chunk needs exploring
+        limit = max(lengths[i:i + DIJKSTRA_CHUNK]) * 1.001 + 1.0
+        _, pred = dijkstra(graph.csr, directed=True, indices=[s for s, _ in chunk],
+                           return_predecessors=True, limit=limit)
+        paths += [walk_back(pred[k], t) for k, (_, t) in enumerate(chunk)]
+    return paths
+
+
+def odd_vertex_pairs(distances: np.ndarray) -> list[tuple[int, int]]:
+    """
+    Minimum-weight matching of the odd vertices (index pairs). Pairs at an
+    infinite distance are never formed: some vertices may stay unmatched.
+    """
+    n = len(distances)
+    iu, ju = np.triu_indices(n, k=1)
+    finite = np.isfinite(distances[iu, ju])
+    iu, ju = iu[finite], ju[finite]
+    if n <= EXACT_MATCHING_MAX:
+        g = nx.Graph()
+        g.add_weighted_edges_from(zip(iu.tolist(), ju.tolist(), distances[iu, ju].tolist()))
+        return sorted(tuple(sorted(p)) for p in nx.min_weight_matching(g))
+    # Greedy: closest remaining pair first
+    order = np.argsort(distances[iu, ju], kind='stable')
+    used = np.zeros(n, dtype=bool)
+    pairs = []
+    for i, j in zip(iu[order].tolist(), ju[order].tolist()):
+        if not used[i] and not used[j]:
+            used[i] = used[j] = True
+            pairs.append((i, j))
+            if len(pairs) == n // 2:
+                break
+    return pairs
+
+
+def match_odd_vertices(graph: RoadGraph, odd: np.ndarray) -> list[tuple[int, int, float]]:
+    """
+    Pairs the odd vertices by shortest paths: first among vertices less than
+    MATCH_RADIUS_M apart (short dijkstra runs), then the few left over
+    without limit. Returns (vertex, vertex, distance) triples.
+    """
+    result = []
+    todo = odd
+    for limit in (MATCH_RADIUS_M, np.inf):
+        if not len(todo):
+            break
+        distances = pairwise_distances(graph, todo, limit)
+        pairs = odd_vertex_pairs(distances)
+        result += [(int(todo[i]), int(todo[j]), float(distances[i, j])) for i, j in pairs]
+        matched = np.zeros(len(todo), dtype=bool)
+        matched[[i for p in pairs for i in p]] = True
+        todo = todo[~matched]
+    return result
+
+
+# ── Rural postman ──────────────────────────────────────────────────────────────
+@dataclass
+class CoverageRoute:
+    coords: np.ndarray        # (lat, lon) of the closed route, in order
+    required_m: float         # length of the requested streets
+    deadhead_m: float         # length travelled outside them, or twice
+    streets: list[str]        # requested streets covered by the route
+    unreachable: list[str]    # requested streets cut off from the rest
+
+
+def coverage_route(graph: RoadGraph) -> CoverageRoute:
+    required = np.flatnonzero(graph.seg_street >= 0)
+    if not len(required):
+        raise ValueError("none of the requested streets is on a routable highway way")
+
+    # Only the part of the network holding most of the requested length is routed
+    _, road_comp = connected_components(graph.csr, directed=False)
+    weight = np.bincount(road_comp[graph.seg_u[required]], weights=graph.seg_len[required])
+    main = int(weight.argmax())
+    in_main = road_comp[graph.seg_u[required]] == main
+    unreachable = sorted(graph.street_names[i] for i in
+                         set(graph.seg_street[required[~in_main]]) - set(graph.seg_street[required[in_main]]))
+    required = required[in_main]
+    u, v = graph.seg_u[required], graph.seg_v[required]
+
+    # Connected pieces of the requested segments
+    n = graph.n_vertices
+    req_csr = csr_matrix((np.ones(len(required)), (u, v)), shape=(n, n))
+    _, piece = connected_components(req_csr, directed=False)
+    terminals = np.unique(np.concatenate((u, v)))
+    piece_ids = np.unique(piece[terminals])
+
+    # 1. Join the pieces: MST over the shortest links between them. One
+    #    multi-source dijkstra gives every vertex its nearest piece; each road
+    #    edge between two such regions is a candidate link (Mehlhorn).
+    extra_paths = []
+    if len(piece_ids) > 1:
+        dist, pred, source = dijkstra(graph.csr, directed=True, indices=terminals, min_only=True,
+                                      return_predecessors=True)
+        piece_index = np.full(n, -1)
+        piece_index[terminals] = np.searchsorted(piece_ids, piece[terminals])
+        owner = np.where(source >= 0, piece_index[np.maximum(source, 0)], -1)
+        adj = graph.csr.tocoo()
+        a, b = adj.row, adj.col
+        link = (owner[a] >= 0) & (owner[b] >= 0) & (owner[a] < owner[b])
+        a, b = a[link], b[link]
+        cost = dist[a] + adj.data[link] + dist[b]
+        pa, pb = owner[a], owner[b]
+        best = np.lexsort((cost, pb, pa))
+        first = np.ones(len(best), dtype=bool)
+        first[1:] = (pa[best][1:] != pa[best][:-1]) | (pb[best][1:] != pb[best][:-1])
+        best = best[first]
+        mst = minimum_spanning_tree(csr_matrix((cost[best], (pa[best], pb[best])),
+                                               shape=(len(piece_ids), len(piece_ids)))).tocoo()
+        chosen = {(p, q): e for p, q, e in zip(pa[best].tolist(), pb[best].tolist(), best.tolist())}
+        for p, q in zip(mst.row.tolist(), mst.col.tolist()):
+            e = chosen[(min(p, q), max(p, q))]
+            extra_paths.append(walk_back(pred, int(a[e])) + walk_back(pred, int(b[e]))[::-1])
+
+    # 2. Even degrees: pair the odd vertices by shortest paths
+    ends = np.concatenate([u, v] + [[p[0], p[-1]] for p in extra_paths])
+    odd = np.flatnonzero(np.bincount(ends, minlength=n) % 2)
+    if len(odd):
+        matches = match_odd_vertices(graph, odd)
+        extra_paths += paths_between(graph, [(x, y) for x, y, _ in matches], [d for _, _, d in matches])
+
+    # 3. Euler circuit over requested segments + extra paths
+    multigraph = nx.MultiGraph()
+    for i in required.tolist():
+        multigraph.add_edge(int(graph.seg_u[i]), int(graph.seg_v[i]), segment=i)
+    for path in extra_paths:
+        if len(path) > 1:
+            multigraph.add_edge(path[0], path[-1], path=path)
+
+    start = int(u[0])
+    parts = []
+    deadhead = 0.0
+    for x, y, key in nx.eulerian_circuit(multigraph, source=start, keys=True):
+        data = multigraph.edges[x, y, key]
+        if 'segment' in data:
+            parts.append(graph.segment_coords(data['segment'], x))
+            continue
+        path = data['path'] if data['path'][0] == x else data['path'][::-1]
+        for a, b in zip(path[:-1], path[1:]):
+            seg = graph.pair_segment[(min(a, b), max(a, b))]
+            parts.append(graph.segment_coords(seg, a))
+            deadhead += graph.seg_len[seg]
+
+    # Consecutive parts share their junction point
+    coords = np.concatenate([parts[0]] + [p[1:] for p in parts[1:]]) if parts else np.zeros((0, 2))
+    return CoverageRoute(
+        coords=coords,
+        required_m=float(graph.seg_len[required].sum()),
+        deadhead_m=deadhead,
+        streets=[graph.street_names[i] for i in np.unique(graph.seg_street[required])],
+        unreachable=unreachable,
+    )
+
+
+def route_length(coords: np.ndarray) -> float:
+    """Length (m) of a (lat, lon) polyline."""
+    if len(coords) < 2:
+        return 0.0
+    return float(step_lengths(coords[:, 0], coords[:, 1]).sum())
+
+
+def describe(route: CoverageRoute) -> str:
+    total = route.required_m + route.deadhead_m
+    share = 100.0 * route.deadhead_m / total if total else 0.0
+    return (f"{len(route.streets)} streets, {route.required_m / 1000:.2f} km of street to cover, "
+            f"{route.deadhead_m / 1000:.2f} km to link them ({share:.0f} %), "
+            f"route {total / 1000:.2f} km, {len(route.coords)} points"
+            + (f"\nUnreachable from the rest of the network: {', '.join(route.unreachable)}"
+               if route.unreachable else ""))
+
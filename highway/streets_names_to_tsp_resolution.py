@@ -1,9 +1,18 @@
-# This script read a list of streets in a txt format (separated by a return) find them in the provided pbf file. (read name:fr)
-# Generate a distance matrix file (can be use on other tsp solver) 
+# This script read a list of streets in a txt format (separated by a return) find them in the provided pbf file.
+# (read name:fr, name, name:nl, name:de; accents, case and apostrophes are ignored when comparing)
+# Generate a distance matrix file, NumPy .npy in km (can be use on other tsp solver, np.load)
+# --metric: first vertex of each street, nearest way ends, or nearest vertices of the streets
 # Perform a TSP resolution with OR-Tools and return the streets name in ordered solution.
+# --solver: routing library + guided local search (default), sparse k-nearest CP-SAT, dense CP-SAT, or compare
 # Export the result to a gpx file ( including all nodes of each street : you should post-process the gpx file with tools like ORS or https://brouter.m11n.de)
 # Purpose of gpx file is to ensure that all street parts are covered for a ground survey. <trkpt inside street section IS NOT optimised and it's not the goal of this script
+# --coverage: one continuous route on the road graph of the PBF covering every street instead, no ORS / BRouter needed (see street_coverage.py)
 
+import argparse
+import os
+import sys
+import time
+import unicodedata
 import numpy as np
 import osmium
 import networkx as nx
@@ -11,68 +20,390 @@ import folium
 import gpxpy
 import gpxpy.gpx
 from ortools.sat.python import cp_model
-from geopy.distance import geodesic
+from scipy.spatial import cKDTree
 import seaborn as sns
 import matplotlib.pyplot as plt
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.projection import equirectangular  # noqa: E402
+from street_coverage import coverage_route, describe, read_road_graph  # noqa: E402
+
 route_info2 = {'Street Name Route': None}
 
+EARTH_RADIUS_KM = 6371.0088
+METRICS = ('first', 'endpoints', 'nearest')
+CLOSE_RADIUS_M = 300.0  # metrics 'endpoints'/'nearest': exact street distance below this
+SOLVERS = ('routing', 'knn', 'cpsat')
+DEFAULT_TIME_LIMIT = 10.0   # seconds per solver
+DEFAULT_KNN = 10
+DENSE_CPSAT_MAX = 200       # streets; above this the dense CP-SAT model gets too large
+KNN_CPSAT_MAX = 300         # streets; above this knn CP-SAT rarely improves on its greedy hint
+STREET_NAME_KEYS = ('name:fr', 'name', 'name:nl', 'name:de')
+
+
+# ── Distance matrix ────────────────────────────────────────────────────────────
+def haversine_matrix(lats1, lons1, lats2, lons2):
+    """Great-circle distances (km) between every point of set 1 and every point of set 2."""
+    lat1 = np.radians(np.asarray(lats1, dtype=np.float64))[:, None]
+    lon1 = np.radians(np.asarray(lons1, dtype=np.float64))[:, None]
+    lat2 = np.radians(np.asarray(lats2, dtype=np.float64))[None, :]
+    lon2 = np.radians(np.asarray(lons2, dtype=np.float64))[None, :]
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def haversine_pairs(lats1, lons1, lats2, lons2):
+    """Great-circle distances (km) between point pairs, element-wise."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lats1, lons1, lats2, lons2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def street_points(street_graph, key):
+    """
+    Concatenated (lat, lon) points of every street, street after street,
+    with the index of the first point of each street.
+    """
+    # Consecutive ways of a street share their end nodes: each point kept once
+    groups = [np.array(list(dict.fromkeys(data[key])), dtype=np.float64).reshape(-1, 2)
+              for _, data in street_graph.nodes(data=True)]
+    starts = np.cumsum([0] + [len(g) for g in groups[:-1]])
+    points = np.concatenate(groups) if groups else np.zeros((0, 2))
+    return points, starts
+
+
+def lower_close_pairs(matrix, points, starts, radius_m):
+    """
+    Lower matrix[a, b] in place to the distance (km) between the closest
+    points of streets a and b, for every point pair closer than radius_m.
+
+    The pairs come from a KD-tree on the projected points, so memory grows
+    with the number of close pairs, never with points x points.
+    """
+    n = len(matrix)
+    street_of = np.repeat(np.arange(n), np.diff(np.append(starts, len(points))))
+    xy = np.column_stack(equirectangular(points[:, 1], points[:, 0]))
+    pairs = cKDTree(xy).query_pairs(radius_m, output_type='ndarray')
+    pairs = pairs[street_of[pairs[:, 0]] != street_of[pairs[:, 1]]]
+    if len(pairs):
+        i, j = pairs[:, 0], pairs[:, 1]
+        d = haversine_pairs(points[i, 0], points[i, 1], points[j, 0], points[j, 1])
+        np.minimum.at(matrix, (street_of[i], street_of[j]), d)
+        np.minimum.at(matrix, (street_of[j], street_of[i]), d)
+
+
+def street_distance_matrix(street_graph, metric='first', radius_m=CLOSE_RADIUS_M):
+    """
+    Street-to-street distance matrix in km, computed for all pairs at once.
+
+    metric:
+      'first'     - distance between the first vertex of each street (historical);
+      'endpoints' - minimum distance between the end nodes of the streets' ways;
+      'nearest'   - minimum distance between any two vertices of the streets.
+
+    'endpoints' and 'nearest' are exact for streets that come closer than
+    radius_m; farther streets keep the 'first' distance, an upper bound since
+    the first vertex is also an end node. Order of far-apart streets hardly
+    moves the tour, and this keeps the cost linear in the number of points.
+    """
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric {metric!r}, expected one of {METRICS}")
+    n = street_graph.number_of_nodes()
+    if n == 0:
+        return np.zeros((0, 0))
+
+    first = np.array([data['coords'][0] for _, data in street_graph.nodes(data=True)], dtype=np.float64)
+    matrix = haversine_matrix(first[:, 0], first[:, 1], first[:, 0], first[:, 1])
+    if metric != 'first':
+        lower_close_pairs(matrix, *street_points(street_graph, 'endpoints'), radius_m)
+    if metric == 'nearest':
+        lower_close_pairs(matrix, *street_points(street_graph, 'coords'), radius_m)
+
+    np.fill_diagonal(matrix, 0.0)
+    return matrix
+
+
+# ── Street names ───────────────────────────────────────────────────────────────
+# Typographic apostrophes and dashes, as the plain ASCII ones
+_PUNCTUATION = str.maketrans({'\u2019': "'", '\u2018': "'", '`': "'", '\u00b4': "'",
+                              '\u2010': '-', '\u2011': '-', '\u2013': '-', '\u2014': '-'})
+
+
+def normalize_street_name(name):
+    """
+    Comparison key of a street name: accents removed, case folded, typographic
+    apostrophes and dashes unified, spaces collapsed.
+    "Avenue de l’Hippodrome" and "avenue de l'hippodrome" give the same key.
+    """
+    decomposed = unicodedata.normalize('NFKD', name)
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return ' '.join(stripped.translate(_PUNCTUATION).casefold().split())
+
+
+class StreetNameIndex:
+    """
+    Requested streets, looked up by normalized name in a dict.
+
+    A way matches on name:fr, name, name:nl or name:de, and on each half of
+    a bilingual Brussels name ("Rue de la Loi - Wetstraat"). The requested
+    spelling, as written in the street list, is returned.
+    """
+
+    def __init__(self, street_names):
+        self.by_key = {}
+        for name in street_names:
+            if name.strip():
+                self.by_key.setdefault(normalize_street_name(name), name)
+        self._cache = {}
+
+    def __len__(self):
+        return len(self.by_key)
+
+    def lookup(self, name):
+        """Requested street for one tag value, or None (memoised per distinct value)."""
+        try:
+            return self._cache[name]
+        except KeyError:
+            pass
+        match = self.by_key.get(normalize_street_name(name))
+        if match is None and ' - ' in name:
+            for part in name.split(' - '):
+                match = self.by_key.get(normalize_street_name(part))
+                if match is not None:
+                    break
+        self._cache[name] = match
+        return match
+
+    def match(self, tags):
+        """Requested street of an OSM object, or None."""
+        for key in STREET_NAME_KEYS:
+            value = tags.get(key)
+            if value:
+                match = self.lookup(value)
+                if match is not None:
+                    return match
+        return None
+
+
 class OSMStreetGraphBuilder(osmium.SimpleHandler):
-    def __init__(self, street_names, pbf_file):
+    """
+    Highway ways of the requested streets, in one pass over the PBF.
+
+    Node locations are resolved by osmium's own index (locations=True, idx
+    picks the index type, e.g. 'sparse_file_array' to keep it on disk for
+    large extracts); only the matched ways are kept in Python.
+    """
+
+    def __init__(self, street_names, pbf_file, node_index='flex_mem'):
         super(OSMStreetGraphBuilder, self).__init__()
         self.street_names = street_names
+        self.name_index = StreetNameIndex(street_names)
         self.pbf_file = pbf_file
+        self.node_index = node_index
         self.street_graph = nx.Graph()
-        self.node_locations = {}
 
     def way(self, w):
-        street_name = None
-
-        if 'name:fr' in w.tags:
-            street_name = w.tags['name:fr']
-        elif 'name' in w.tags:
-            street_name = w.tags['name']
-
-        if street_name is None or street_name not in self.street_names:
-            return  # Skip the street if no suitable name is found or it's not in the list
+        street_name = self.name_index.match(w.tags)
+        if street_name is None:
+            return  # Skip the way if none of its names is in the list
 
         osm_id = w.id
-        coords = [(self.node_locations[n.ref].lat, self.node_locations[n.ref].lon)
-                  for n in w.nodes if n.ref in self.node_locations]
+        # Nodes outside the extract have no location: they are left out
+        coords = [(n.lat, n.lon) for n in w.nodes if n.location.valid()]
 
-        if not coords or any(None in coord[:2] for coord in coords):
+        if not coords:
             print(f"Skipping way {osm_id} for street {street_name} due to missing or invalid coordinates.")
             return
 
         if street_name not in self.street_graph:
-            self.street_graph.add_node(street_name, osm_ids=[], coords=[])
+            self.street_graph.add_node(street_name, osm_ids=[], coords=[], endpoints=[])
         self.street_graph.nodes[street_name]['osm_ids'].append(osm_id)
         self.street_graph.nodes[street_name]['coords'].extend(coords)
-
-    def node(self, n):
-        self.node_locations[n.id] = n.location
-
-    def relation(self, r):
-        pass
+        self.street_graph.nodes[street_name]['endpoints'].extend([coords[0], coords[-1]])
 
     def build_street_graph(self):
-        self.apply_file(self.pbf_file)
-
-    def haversine(self, coord1, coord2):
-        return geodesic(coord1, coord2).meters
-
-    def build_distance_matrix(self):
-        num_nodes = len(self.street_graph.nodes)
-        distance_matrix = np.zeros((num_nodes, num_nodes))
+        # filters= (pyosmium >= 4.0): only highway ways reach the Python handler
+        self.apply_file(self.pbf_file, locations=True, idx=self.node_index,
+                        filters=[osmium.filter.KeyFilter('highway')])
+        missing = [name for name in self.name_index.by_key.values() if name not in self.street_graph]
+        print(f"{self.street_graph.number_of_nodes()}/{len(self.name_index)} streets found"
+              + (f", missing: {', '.join(missing)}" if missing else ""))
+
+    def build_distance_matrix(self, metric='first', radius_m=CLOSE_RADIUS_M):
+        """Street-to-street distances in km, see street_distance_matrix()."""
+        return street_distance_matrix(self.street_graph, metric, radius_m)
+
+
+# ── TSP solvers ────────────────────────────────────────────────────────────────
+def integer_matrix(distance_km):
+    """km -> whole metres: OR-Tools solvers only take integer costs."""
+    return np.rint(np.asarray(distance_km, dtype=np.float64) * 1000.0).astype(np.int64)
+
+
+def tour_length(matrix, tour):
+    tour = np.asarray(tour)
+    return int(matrix[tour[:-1], tour[1:]].sum())
+
+
+def nearest_neighbour_tour(matrix, start=0):
+    """Greedy closed tour, used as the CP-SAT hint and to keep the kNN model feasible."""
+    n = len(matrix)
+    visited = np.zeros(n, dtype=bool)
+    visited[start] = True
+    tour = [start]
+    for _ in range(n - 1):
+        row = np.where(visited, np.iinfo(np.int64).max, matrix[tour[-1]])
+        nxt = int(row.argmin())
+        visited[nxt] = True
+        tour.append(nxt)
+    return tour + [start]
+
+
+def solve_routing(matrix, time_limit):
+    """
+    OR-Tools routing library: cheapest-arc first solution, then guided local
+    search until time_limit. Returns (tour, [(seconds, length_m), ...]).
+    """
+    from ortools.constraint_solver import pywrapcp, routing_enums_pb2
+
+    manager = pywrapcp.RoutingIndexManager(len(matrix), 1, 0)
+    routing = pywrapcp.RoutingModel(manager)
+    # Whole matrix handed over at once: no Python callback per arc evaluation
+    transit = routing.RegisterTransitMatrix(matrix.tolist())
+    routing.SetArcCostEvaluatorOfAllVehicles(transit)
+
+    params = pywrapcp.DefaultRoutingSearchParameters()
+    params.first_solution_strategy = routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC
+    params.local_search_metaheuristic = routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH
+    params.time_limit.FromMilliseconds(int(time_limit * 1000))
+
+    trajectory = []
+    t0 = time.perf_counter()
+    routing.AddAtSolutionCallback(
+        lambda: trajectory.append((time.perf_counter() - t0, routing.CostVar().Value())))
+    solution = routing.SolveWithParameters(params)
+    if solution is None:
+        raise RuntimeError("OR-Tools routing found no solution")
+
+    tour = []
+    index = routing.Start(0)
+    while not routing.IsEnd(index):
+        tour.append(manager.IndexToNode(index))
+        index = solution.Value(routing.NextVar(index))
+    return tour + [manager.IndexToNode(index)], trajectory
+
+
+class _CpSatProgress(cp_model.CpSolverSolutionCallback):
+    """Records (wall time, objective) of every CP-SAT solution."""
+
+    def __init__(self):
+        super().__init__()
+        self.trajectory = []
+
+    def on_solution_callback(self):
+        self.trajectory.append((self.WallTime(), self.ObjectiveValue()))
+
+
+def solve_cpsat(matrix, time_limit, knn=None):
+    """
+    CP-SAT circuit model. knn=None: one arc per ordered street pair (dense,
+    n^2 Booleans); knn=k: only the arcs to the k nearest streets of each
+    street, both ways, plus the arcs of a greedy tour so the model always
+    has a solution. Returns (tour, [(seconds, length_m), ...], bound_m);
+    bound_m is a lower bound of the full problem only for the dense model.
+    """
+    n = len(matrix)
+    hint = nearest_neighbour_tour(matrix)
+    hint_next = dict(zip(hint[:-1], hint[1:]))
+
+    if knn is None:
+        rows, cols = np.nonzero(~np.eye(n, dtype=bool))
+        arcs = list(zip(rows.tolist(), cols.tolist()))
+    else:
+        k = min(knn, n - 1)
+        masked = matrix.astype(np.float64)
+        np.fill_diagonal(masked, np.inf)
+        nearest = np.argpartition(masked, k - 1, axis=1)[:, :k]
+        rows = np.repeat(np.arange(n), k).tolist()
+        cols = nearest.ravel().tolist()
+        arcs = set(zip(rows, cols)) | set(zip(cols, rows)) | set(hint_next.items())
+        arcs = sorted(arcs)
 
-        for i, (street_name_i, data_i) in enumerate(self.street_graph.nodes(data=True)):
-            for j, (street_name_j, data_j) in enumerate(self.street_graph.nodes(data=True)):
-                if i != j and 'coords' in data_i and 'coords' in data_j:
-                    coord_i, coord_j = data_i['coords'][0], data_j['coords'][0]
-                    distance = self.haversine(coord_i, coord_j) / 1000.0  # Convert meters to kilometers
-                    distance_matrix[i, j] = distance
+    model = cp_model.CpModel()
+    literals = {(i, j): model.NewBoolVar(f"{j} follows {i}") for i, j in arcs}
+    model.AddCircuit([(i, j, lit) for (i, j), lit in literals.items()])
+    model.Minimize(cp_model.LinearExpr.WeightedSum(
+        list(literals.values()), [int(matrix[i, j]) for i, j in literals]))
+    for (i, j), lit in literals.items():
+        model.AddHint(lit, hint_next[i] == j)
 
-        return distance_matrix
+    solver = cp_model.CpSolver()
+    solver.parameters.max_time_in_seconds = time_limit
+    solver.parameters.linearization_level = 2
+    progress = _CpSatProgress()
+    status = solver.Solve(model, progress)
+    if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        raise RuntimeError(f"CP-SAT found no solution ({solver.StatusName(status)})")
+
+    successor = {i: j for (i, j), lit in literals.items() if solver.BooleanValue(lit)}
+    tour = [0]
+    while len(tour) == 1 or tour[-1] != 0:
+        tour.append(successor[tour[-1]])
+    bound = solver.BestObjectiveBound() if knn is None else None
+    return tour, progress.trajectory, bound
+
+
+def solve_tsp(matrix, solver='routing', time_limit=DEFAULT_TIME_LIMIT, knn=DEFAULT_KNN):
+    """
+    Runs one solver on the integer matrix (metres) and prints how the tour
+    length improved over time. Returns {'tour', 'length', 'seconds', 'bound'}.
+    """
+    n = len(matrix)
+    t0 = time.perf_counter()
+    bound = None
+    if n <= 3:
+        # Every closed tour has the same length
+        tour, trajectory = list(range(n)) + [0], []
+    elif solver == 'routing':
+        tour, trajectory = solve_routing(matrix, time_limit)
+    elif solver == 'knn':
+        if n > KNN_CPSAT_MAX:
+            print(f"Warning: knn CP-SAT on {n} streets rarely improves on its nearest-neighbour start, "
+                  "consider --solver routing.")
+        tour, trajectory, bound = solve_cpsat(matrix, time_limit, knn)
+    elif solver == 'cpsat':
+        if n > DENSE_CPSAT_MAX:
+            print(f"Warning: dense CP-SAT on {n} streets ({n * (n - 1)} arcs) may not finish in time, "
+                  "consider --solver routing or knn.")
+        tour, trajectory, bound = solve_cpsat(matrix, time_limit)
+    else:
+        raise ValueError(f"Unknown solver {solver!r}, expected one of {SOLVERS}")
+    seconds = time.perf_counter() - t0
+    length = tour_length(matrix, tour)
+
+    label = f"{solver} (k={knn})" if solver == 'knn' else solver
+    gap = f", {100.0 * (length - bound) / length:.2f} % above lower bound" if bound and length else ""
+    print(f"\n[{label}] {n} streets: {length / 1000:.3f} km in {seconds:.2f} s{gap}")
+    improvements = []
+    for t, value in trajectory:
+        if not improvements or value < improvements[-1][1]:
+            improvements.append((t, value))
+    if len(improvements) > 12:
+        keep = np.unique(np.linspace(0, len(improvements) - 1, 12).astype(int))
+        improvements = [improvements[i] for i in keep]
+    for t, value in improvements:
+        print(f"  {t:8.2f} s  {value / 1000:10.3f} km")
+    return {'tour': tour, 'length': length, 'seconds': seconds, 'bound': bound}
+
+
+def print_comparison(results):
+    best = min(r['length'] for r in results.values())
+    print("\nsolver       time (s)   length (km)   vs best")
+    for solver, r in results.items():
+        excess = 100.0 * (r['length'] - best) / best if best else 0.0
+        print(f"{solver:10s} {r['seconds']:10.2f} {r['length'] / 1000:13.3f} {excess:+8.2f} %")
 
 
 class OSMStreetGraphPlotter:
@@ -120,12 +451,70 @@ class OSMStreetGraphPlotter:
         print(f"Sorted segments exported to '{output_filename}'.")
 
 
+def run_coverage(pbf_file, street_names, output_filename, node_index='flex_mem'):
+    """Street-coverage route on the road graph, written as one GPX track."""
+    name_index = StreetNameIndex(street_names)
+
+    t0 = time.perf_counter()
+    graph = read_road_graph(pbf_file, name_index.match, node_index)
+    print(f"Road graph: {graph.n_vertices} intersections, {len(graph.seg_len)} segments "
+          f"({time.perf_counter() - t0:.1f} s)")
+    missing = sorted(set(name_index.by_key.values()) - set(graph.street_names))
+    if missing:
+        print(f"Not found on a routable way: {', '.join(missing)}")
+
+    t0 = time.perf_counter()
+    route = coverage_route(graph)
+    print(f"Coverage route ({time.perf_counter() - t0:.1f} s): {describe(route)}")
+
+    gpx = gpxpy.gpx.GPX()
+    track = gpxpy.gpx.GPXTrack(name='Street coverage')
+    gpx.tracks.append(track)
+    segment = gpxpy.gpx.GPXTrackSegment()
+    track.segments.append(segment)
+    segment.points.extend(gpxpy.gpx.GPXTrackPoint(lat, lon) for lat, lon in route.coords.tolist())
+    with open(output_filename, 'w', encoding='utf-8') as gpx_file:
+        gpx_file.write(gpx.to_xml())
+    print(f"GPX file saved as '{output_filename}'.")
+
+
 def main():
-    with open('rues.txt', 'r', encoding='utf-8') as street_file:
+    parser = argparse.ArgumentParser(description="Order a list of streets for a ground survey (TSP).")
+    parser.add_argument("--streets", default='rues.txt', help="street names, one per line")
+    parser.add_argument("--pbf", default='brussels_capital_region.pbf')
+    parser.add_argument("--metric", choices=METRICS, default='first',
+                        help="street-to-street distance: first vertex, nearest way ends, "
+                             f"or nearest vertices, the last two exact below {CLOSE_RADIUS_M:.0f} m (default: first)")
+    parser.add_argument("--matrix", default='distance_matrix.npy',
+                        help="distance matrix output (NumPy .npy, km)")
+    parser.add_argument("--solver", choices=SOLVERS + ('compare',), default='routing',
+                        help="routing: OR-Tools routing with guided local search (default); "
+                             f"knn: CP-SAT on the arcs to the nearest streets only (up to ~{KNN_CPSAT_MAX} streets); "
+                             f"cpsat: CP-SAT on all arcs (up to ~{DENSE_CPSAT_MAX} streets); "
+                             "compare: run them all and report length against time, "
+                             "skipping the CP-SAT models above those sizes")
+    parser.add_argument("--time-limit", type=float, default=DEFAULT_TIME_LIMIT,
+                        help="seconds per solver (default: %(default)s)")
+    parser.add_argument("--knn", type=int, default=DEFAULT_KNN,
+                        help="knn solver: arcs to the k nearest streets (default: %(default)s)")
+    parser.add_argument("--coverage", action="store_true",
+                        help="instead of the TSP: one closed route on the road graph of the PBF "
+                             "travelling every way of the streets (rural postman, offline)")
+    parser.add_argument("--gpx", default='output.gpx', help="GPX output (default: %(default)s)")
+    parser.add_argument("--node-index", default='flex_mem',
+                        help="osmium node location index (default: flex_mem; "
+                             "sparse_file_array,<file> keeps it on disk for Belgium-size extracts)")
+    args = parser.parse_args()
+
+    with open(args.streets, 'r', encoding='utf-8') as street_file:
         street_names = street_file.read().splitlines()
 
-    pbf_file = 'brussels_capital_region.pbf'
-    builder = OSMStreetGraphBuilder(street_names, pbf_file)
+    if args.coverage:
+        run_coverage(args.pbf, street_names, args.gpx, args.node_index)
+        return
+
+    pbf_file = args.pbf
+    builder = OSMStreetGraphBuilder(street_names, pbf_file, args.node_index)
     builder.build_street_graph()
     street_graph = builder.street_graph
 
@@ -135,97 +524,43 @@ def main():
     plotter.plot_street_graph()
 
     # Calculate distance matrix using the build_distance_matrix method
-    distance_matrix = builder.build_distance_matrix()
+    t0 = time.perf_counter()
+    distance_matrix = builder.build_distance_matrix(args.metric)
+    print(f"Distance matrix ({args.metric}): {distance_matrix.shape[0]} streets "
+          f"in {(time.perf_counter() - t0) * 1000:.1f} ms")
 
-    # Save matrix to txt file for future use
-    with open('distance_matrix.txt', 'w') as file:
-        file.write('[')
-        for row in distance_matrix:
-            file.write('[' + ', '.join(f'{value:.8f}' for value in row) + '],\n')
-        file.write(']')
+    # Save matrix for future use (np.load, or any other TSP solver)
+    np.save(args.matrix, distance_matrix)
+    print(f"Distance matrix saved to '{args.matrix}'.")
 
     # Solve TSP
-    with open('distance_matrix.txt', 'r') as file:
-        distance_matrix_str = file.read()
-
-    DISTANCE_MATRIX = eval(distance_matrix_str)
-
-    num_nodes = len(DISTANCE_MATRIX)
-    all_nodes = range(num_nodes)
+    names = list(street_graph.nodes)
+    num_nodes = len(names)
     print("Num Streets =", num_nodes)
-
-    # Model.
-    model = cp_model.CpModel()
-
-    obj_vars = []
-    obj_coeffs = []
-
-    # Create the circuit constraint.
-    arcs = []
-    arc_literals = {}
-    for i in all_nodes:
-        for j in all_nodes:
-            if i == j:
-                continue
-
-            lit = model.NewBoolVar("%i follows %i" % (j, i))
-            arcs.append((i, j, lit))
-            arc_literals[i, j] = lit
-
-            obj_vars.append(lit)
-            obj_coeffs.append(DISTANCE_MATRIX[i][j])
-
-    model.AddCircuit(arcs)
-
-
-    # Minimize weighted sum of arcs.
-    model.Minimize(sum(obj_vars[i] * obj_coeffs[i] for i in range(len(obj_vars))))
-
-    # Solve and print out the solution.
-    solver = cp_model.CpSolver()
-    solver.parameters.log_search_progress = True
-    solver.parameters.linearization_level = 2
-
-    solver.Solve(model)
-    print(solver.ResponseStats())
-
-    current_node = 0
-    num_order_route = "%i" % current_node
-    street_name_route = street_names[current_node]
-    route_is_finished = False
-    route_distance = 0
-
-    while not route_is_finished:
-        for i in all_nodes:
-            if i == current_node:
-                continue
-            if solver.BooleanValue(arc_literals[current_node, i]):
-                num_order_route += f" -> {i}"
-                street_name_route += f" -> {street_names[i]}"
-                route_distance += DISTANCE_MATRIX[current_node][i]
-                current_node = i
-                if current_node == 0:
-                    route_is_finished = True
-                break
-   
-            
-    print("Numerical Order Route:", num_order_route)
+    if num_nodes == 0:
+        print("None of the streets was found in the PBF file.")
+        return
+
+    matrix_m = integer_matrix(distance_matrix)
+    # compare: CP-SAT models only where they still have a chance to finish
+    limits = {'knn': KNN_CPSAT_MAX, 'cpsat': DENSE_CPSAT_MAX}
+    solvers = [args.solver] if args.solver != 'compare' else [
+        s for s in SOLVERS if num_nodes <= limits.get(s, num_nodes)]
+    results = {}
+    for solver in solvers:
+        results[solver] = solve_tsp(matrix_m, solver, args.time_limit, args.knn)
+    if len(results) > 1:
+        print_comparison(results)
+    tour = min(results.values(), key=lambda r: r['length'])['tour']
+
+    route_distance = tour_length(matrix_m, tour) / 1000.0
+    print("Numerical Order Route:", " -> ".join(str(i) for i in tour))
+    street_name_route = " -> ".join(names[i] for i in tour)
     print("Street Name Route:", street_name_route)
     print("Travelled distance as the crow flies : ", route_distance)
 
-   
     route_info2['Street Name Route'] = street_name_route
-
-    # Extract street names directly from Street Name Route
-    cleaned_street_names = [name.strip() for name in route_info2['Street Name Route'].split("->")]
-
-    # Create a new dictionary with the extracted street names
-    street_names_dict = {'Street Names': cleaned_street_names}
-
-
-    for cleaned_street_name in cleaned_street_names:
-        if cleaned_street_name in street_graph.nodes:
-            street_data = street_graph.nodes[cleaned_street_name]
+    cleaned_street_names = [names[i] for i in tour]
 
     # Create a GPX object
     gpx = gpxpy.gpx.GPX()
@@ -255,7 +590,7 @@ def main():
                     unique_coords.add(coord)
 
     # Save the GPX file
-    output_filename = 'output.gpx'
+    output_filename = args.gpx
     with open(output_filename, 'w', encoding='utf-8') as gpx_file:
         gpx_file.write(gpx.to_xml())
 
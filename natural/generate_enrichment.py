@@ -2,13 +2,30 @@
 ## Add additional info on trees , use in combinaison with trees_bxl_mobility_matching_from_csv.py
 ### Run this script first.
 
-import pandas as pd
-import requests
+import argparse
+import json
+import os
 import re
+import sys
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import http_cache  # noqa: E402
+from common.paths import OSM_BE_CACHE_DIR  # noqa: E402
 
 SPARQL_ENDPOINT = "https://query.wikidata.org/sparql"
 
+# Wikidata Query Service : 5 requêtes simultanées max par client, on reste en dessous
+BATCH_SIZE = 50
+MAX_WORKERS = 3
+MAX_RETRIES = 4
+
+# Résultats par nom d'espèce normalisé, conservés entre les exécutions
+WIKIDATA_CACHE = OSM_BE_CACHE_DIR / "wikidata" / "species.json"
+
 LEAF_RETENTION_MAP = {
     'Q188235': 'deciduous',
     'Q107294': 'evergreen',
@@ -85,15 +102,44 @@ def normalize_species_name(species):
     return re.sub(r'(?<=[a-zA-Z])\s+x\s+(?=[a-zA-Z])', ' × ', species)
 
 
-def query_wikidata_sparql(species_name):
+# ── Cache persistant ───────────────────────────────────────────────────────────
+def load_cache(path=WIKIDATA_CACHE):
+    """{nom normalisé: {'qid', 'genus', 'leaf_cycle', 'fetched_at'}}"""
+    if path.exists():
+        return json.loads(path.read_text(encoding='utf-8'))
+    return {}
+
+
+def save_cache(cache, path=WIKIDATA_CACHE):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + '.part')
+    tmp.write_text(json.dumps(cache, ensure_ascii=False, indent=1, sort_keys=True), encoding='utf-8')
+    os.replace(tmp, path)
+
+
+# ── Requêtes SPARQL groupées ───────────────────────────────────────────────────
+def _sparql_literal(value):
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def _qid(binding, key):
+    return binding[key]['value'].split('/')[-1] if key in binding else None
+
+
+def query_wikidata_batch(normalized_names):
     """
+    Une requête SPARQL pour tout un lot de noms (déjà normalisés), via VALUES.
     Utilise wdt:P225 pour récupérer le nom scientifique du genre.
-    Normalise le nom pour gérer les hybrides (× au lieu de x).
+
+    Retourne {nom: (qid, genus, leaf_cycle)} ; un nom absent de Wikidata
+    donne (None, None, None). Lève une exception si la requête échoue,
+    après quelques tentatives en cas de limitation (HTTP 429 / 503).
     """
-    normalized = normalize_species_name(species_name)
+    values = ' '.join(_sparql_literal(n) for n in normalized_names)
     query = f"""
-    SELECT ?taxon ?genusName ?leafRetention ?genusLeafRetention WHERE {{
-      ?taxon wdt:P225 "{normalized}" .
+    SELECT ?name ?taxon ?genusName ?leafRetention ?genusLeafRetention WHERE {{
+      VALUES ?name {{ {values} }}
+      ?taxon wdt:P225 ?name .
       OPTIONAL {{
         ?taxon wdt:P171* ?genus .
         ?genus wdt:P105 wd:Q34740 .
@@ -102,37 +148,96 @@ def query_wikidata_sparql(species_name):
       }}
       OPTIONAL {{ ?taxon wdt:P3014 ?leafRetention . }}
     }}
-    LIMIT 1
     """
     headers = {
         'Accept': 'application/sparql-results+json',
         'User-Agent': 'OSMTreeMatcher/1.0 (openstreetmap import script)'
     }
-    try:
-        r = requests.get(SPARQL_ENDPOINT, params={'query': query}, headers=headers, timeout=15)
-        r.raise_for_status()
-        bindings = r.json()['results']['bindings']
-        if not bindings:
-            return None, None, None
-
-        b = bindings[0]
-        qid = b['taxon']['value'].split('/')[-1] if 'taxon' in b else None
-        genus = b['genusName']['value'] if 'genusName' in b else None
+    for attempt in range(MAX_RETRIES):
+        r = http_cache.session().post(SPARQL_ENDPOINT, data={'query': query}, headers=headers, timeout=60)
+        if r.status_code not in (429, 503):
+            break
+        # Limitation de débit : Wikidata indique le délai à respecter
+        delay = float(r.headers.get('Retry-After', 2 ** (attempt + 2)))
+        print(f"  [WAIT] HTTP {r.status_code}, nouvelle tentative dans {delay:.0f} s")
+        time.sleep(delay)
+    r.raise_for_status()
+
+    # Plusieurs lignes par nom (plusieurs taxons ou genres) : on garde la plus
+    # complète, à défaut la première
+    best = {}
+    for b in r.json()['results']['bindings']:
+        name = b['name']['value']
+        score = ('leafRetention' in b, 'genusLeafRetention' in b, 'genusName' in b)
+        if name not in best or score > best[name][0]:
+            best[name] = (score, b)
+
+    results = {}
+    for name in normalized_names:
+        if name not in best:
+            results[name] = (None, None, None)
+            continue
+        b = best[name][1]
+        retention_qid = _qid(b, 'leafRetention') or _qid(b, 'genusLeafRetention')
+        results[name] = (
+            _qid(b, 'taxon'),
+            b['genusName']['value'] if 'genusName' in b else None,
+            LEAF_RETENTION_MAP.get(retention_qid) if retention_qid else None,
+        )
+    return results
 
-        retention_qid = None
-        if 'leafRetention' in b:
-            retention_qid = b['leafRetention']['value'].split('/')[-1]
-        elif 'genusLeafRetention' in b:
-            retention_qid = b['genusLeafRetention']['value'].split('/')[-1]
-
-        leaf_cycle = LEAF_RETENTION_MAP.get(retention_qid) if retention_qid else None
-        return qid, genus, leaf_cycle
 
+def query_wikidata_sparql(species_name):
+    """Requête pour une seule espèce (voir query_wikidata_batch)."""
+    normalized = normalize_species_name(species_name)
+    try:
+        return query_wikidata_batch([normalized])[normalized]
     except Exception as e:
         print(f"  [WARN] SPARQL failed for '{species_name}': {e}")
         return None, None, None
 
 
+def lookup_species(species_list, batch_size=BATCH_SIZE, workers=MAX_WORKERS, refresh=False):
+    """
+    (qid, genus, leaf_cycle) pour chaque espèce, depuis le cache persistant ;
+    seules les espèces jamais vues sont demandées à Wikidata, par lots,
+    avec au plus `workers` requêtes simultanées.
+    """
+    cache = {} if refresh else load_cache()
+    wanted = sorted({normalize_species_name(s) for s in species_list})
+    missing = [n for n in wanted if n not in cache]
+    print(f"{len(wanted) - len(missing)} espèces en cache, {len(missing)} à interroger sur Wikidata.")
+
+    if missing and http_cache.is_offline():
+        print("  [WARN] mode hors-ligne : espèces non trouvées dans le cache ignorées")
+        missing = []
+
+    batches = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+    if batches:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(query_wikidata_batch, batch): batch for batch in batches}
+            for k, fut in enumerate(as_completed(futures), 1):
+                batch = futures[fut]
+                try:
+                    found = fut.result()
+                except Exception as e:
+                    # Non mis en cache : ces espèces seront redemandées au prochain lancement
+                    print(f"  [WARN] SPARQL failed for {len(batch)} species ({batch[0]} ...): {e}")
+                    continue
+                now = time.time()
+                for name, (qid, genus, leaf_cycle) in found.items():
+                    cache[name] = {'qid': qid, 'genus': genus, 'leaf_cycle': leaf_cycle, 'fetched_at': now}
+                # Sauvegarde au fil de l'eau : une interruption ne perd rien
+                save_cache(cache)
+                print(f"  lot {k}/{len(batches)} : {sum(1 for v in found.values() if v[0])}/{len(batch)} trouvées")
+
+    results = {}
+    for species in species_list:
+        entry = cache.get(normalize_species_name(species))
+        results[species] = (entry['qid'], entry['genus'], entry['leaf_cycle']) if entry else (None, None, None)
+    return results
+
+
 def resolve_leaf_cycle(leaf_cycle_sparql, genus, species):
     """Priorité : override espèce > Wikidata SPARQL > fallback genre."""
     if species in SPECIES_LEAF_CYCLE_OVERRIDE:
@@ -151,7 +256,8 @@ def resolve_leaf_type(genus):
     return 'broadleaved'
 
 
-def generate_enrichment_csv(csv_path, output_path='species_enrichment.csv'):
+def generate_enrichment_csv(csv_path, output_path='species_enrichment.csv',
+                            batch_size=BATCH_SIZE, workers=MAX_WORKERS, refresh=False):
     cols = ['FID', 'gid', 'geom', 'numident', 'annee_plant', 'circumference', 'commune',
             'couverture', 'crown_diam', 'essence', 'hauteur', 'multitronc',
             'structure_couronne', 'status', 'espace_de_plantation', 'distribution', 'voirie']
@@ -165,17 +271,17 @@ def generate_enrichment_csv(csv_path, output_path='species_enrichment.csv'):
             unique_species.add(species)
 
     print(f"{len(unique_species)} espèces uniques trouvées.\n")
+    found = lookup_species(unique_species, batch_size=batch_size, workers=workers, refresh=refresh)
 
     rows = []
     for i, species in enumerate(sorted(unique_species)):
-        print(f"[{i+1}/{len(unique_species)}] {species} ...", end=' ', flush=True)
-
-        qid, genus, leaf_cycle_sparql = query_wikidata_sparql(species)
+        qid, genus, leaf_cycle_sparql = found[species]
         leaf_cycle, lc_source = resolve_leaf_cycle(leaf_cycle_sparql, genus, species)
         leaf_type = resolve_leaf_type(genus)
 
-        found = "Wikidata" if qid else "non trouvé"
-        print(f"{found} | QID={qid} | genus={genus} | leaf_cycle={leaf_cycle} [{lc_source}] | leaf_type={leaf_type}")
+        status = "Wikidata" if qid else "non trouvé"
+        print(f"[{i+1}/{len(unique_species)}] {species} ... {status} | QID={qid} | genus={genus} | "
+              f"leaf_cycle={leaf_cycle} [{lc_source}] | leaf_type={leaf_type}")
 
         rows.append({
             'species':          species,
@@ -185,8 +291,6 @@ def generate_enrichment_csv(csv_path, output_path='species_enrichment.csv'):
             'leaf_type':        leaf_type,
         })
 
-        time.sleep(1.0)
-
     result = pd.DataFrame(rows)
     result.to_csv(output_path, index=False)
     print(f"\nEnrichment CSV saved: {output_path}")
@@ -194,4 +298,14 @@ def generate_enrichment_csv(csv_path, output_path='species_enrichment.csv'):
 
 
 if __name__ == '__main__':
-    generate_enrichment_csv('trees.csv')
+    parser = argparse.ArgumentParser(description="Enrichissement Wikidata des espèces d'arbres.")
+    parser.add_argument('csv', nargs='?', default='trees.csv')
+    parser.add_argument('--output', default='species_enrichment.csv')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help=f"espèces par requête SPARQL (défaut {BATCH_SIZE})")
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS,
+                        help=f"requêtes simultanées (défaut {MAX_WORKERS})")
+    parser.add_argument('--refresh', action='store_true',
+                        help=f"ignore le cache {WIKIDATA_CACHE} et réinterroge toutes les espèces")
+    args = parser.parse_args()
+    generate_enrichment_csv(args.csv, args.output, args.batch_size, args.workers, args.refresh)
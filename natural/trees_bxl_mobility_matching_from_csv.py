@@ -2,53 +2,146 @@
 ## https://data.mobility.brussels/fr/info/trees/
 ### Purpose of this script is to find trees in OSM and matching them with opendata to update them.
 ### Use csv lat/lon
+### Usage :
+###   python trees_bxl_mobility_matching_from_csv.py --threshold 0.5 --ref-filter no_ref
+###   python trees_bxl_mobility_matching_from_csv.py --config trees.json
+###   python trees_bxl_mobility_matching_from_csv.py --sweep-thresholds 0.2 0.5 1 2 --sweep-one-to-one
 
 #!pip install osmium
-#!pip install rtree
 
+import argparse
+import gzip
+import json
 import os
-import requests
+import sys
+from array import array
+import numpy as np
 import pandas as pd
 import osmium as o
 import xml.sax.saxutils as saxutils
-from math import radians, sin, cos, sqrt, atan2
-from rtree import index
+from scipy.spatial import cKDTree
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import http_cache  # noqa: E402
+from common.matching import optimal_pairs  # noqa: E402
+from common.paths import OSM_BE_CACHE_DIR  # noqa: E402
+from common.projection import to_lambert72  # noqa: E402
+from common.snapshot_store import DAILY_FILENAME, snapshot_path  # noqa: E402
+
+WRITE_BUFFER = 1 << 20  # tampon d'écriture des fichiers OSM (octets)
+
+# Dernière release OpenData traitée, pour le mode incrémental
+RELEASE_STORE = OSM_BE_CACHE_DIR / "trees" / "mobility_trees.parquet"
+RELEASE_COLUMNS = ['numident', 'lat', 'lon', 'circumference', 'hauteur', 'status', 'essence']
+CHANGE_COLUMNS = ['circumference', 'hauteur', 'status', 'essence']
+
+
+def load_release(path=RELEASE_STORE):
+    """Release précédente indexée par numident, None si aucune n'a été enregistrée."""
+    if not os.path.exists(path):
+        return None
+    return pd.read_parquet(path).set_index('numident')
+
+
+def save_release(csv_data, path=RELEASE_STORE):
+    """Enregistre les colonnes utiles de la release (essence et status en catégories)."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    release = csv_data.dropna(subset=['numident']).drop_duplicates('numident')[RELEASE_COLUMNS].copy()
+    release['circumference'] = pd.to_numeric(release['circumference'], errors='coerce')
+    release['hauteur'] = pd.to_numeric(release['hauteur'], errors='coerce')
+    for col in ('status', 'essence'):
+        release[col] = release[col].astype('category')
+    tmp = f"{path}.part"
+    release.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+    print(f"Release enregistrée : {path} ({len(release)} arbres)")
+
+
+def diff_releases(previous, csv_data):
+    """
+    Compare la release courante à la précédente, par numident.
+
+    Retourne (changes, delta_mask) :
+      - changes : une ligne par arbre ajouté, supprimé ou modifié
+        (numident, change, fields) ;
+      - delta_mask : masque des lignes de csv_data ajoutées ou modifiées.
+    Les lignes sans numident sont toujours considérées comme ajoutées.
+    """
+    current = csv_data[['numident', *CHANGE_COLUMNS]].copy()
+    for col in ('circumference', 'hauteur'):
+        current[col] = pd.to_numeric(current[col], errors='coerce')
+    old = previous[CHANGE_COLUMNS].copy()
+    for col in ('status', 'essence'):
+        old[col] = old[col].astype(object)
+
+    merged = current.join(old, on='numident', rsuffix='_old')
+    known = merged['numident'].isin(previous.index)
+
+    changed_fields = pd.Series('', index=merged.index)
+    for col in CHANGE_COLUMNS:
+        a, b = merged[col], merged[f'{col}_old']
+        differs = known & (a != b) & ~(a.isna() & b.isna())
+        changed_fields[differs] = changed_fields[differs] + col + ' '
+    changed_fields = changed_fields.str.strip()
+
+    added = ~known
+    changed = known & (changed_fields != '')
+    removed = previous.index.difference(csv_data['numident'].dropna())
+
+    changes = pd.concat([
+        pd.DataFrame({'numident': merged.loc[added, 'numident'], 'change': 'added', 'fields': ''}),
+        pd.DataFrame({'numident': merged.loc[changed, 'numident'], 'change': 'changed',
+                      'fields': changed_fields[changed]}),
+        pd.DataFrame({'numident': removed, 'change': 'removed', 'fields': ''}),
+    ], ignore_index=True)
+    return changes, added | changed
+
+
+class TreeNodeHandler(o.SimpleHandler):
+    """
+    Ne garde que les nœuds natural=tree, en colonnes : id, version,
+    coordonnées et les deux tags utilisés par le matching (ref, species).
+    La mémoire dépend du nombre d'arbres, pas du nombre de nœuds du PBF.
+    """
 
-
-def haversine_distance(coord1, coord2):
-    R = 6371.0
-    lat1, lon1 = map(radians, coord1)
-    lat2, lon2 = map(radians, coord2)
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = sin(dlat / 2)**2 + cos(lat1) * cos(lat2) * sin(dlon / 2)**2
-    c = 2 * atan2(sqrt(a), sqrt(1 - a))
-    return R * c
-
-
-class Node:
-    def __init__(self, node_id, location, tags, version):
-        self.node_id = node_id
-        self.location = location
-        self.tags = tags
-        self.version = version
-
-
-class NodeCacheHandler(o.SimpleHandler):
     def __init__(self):
         super().__init__()
-        self.node_cache = {}
+        self.ids = array('q')
+        self.versions = array('l')
+        self.lats = array('d')
+        self.lons = array('d')
+        self.refs = []
+        self.species = []
 
     def node(self, n):
-        if n.location.valid():
-            loc = (n.location.lat, n.location.lon)
-            self.node_cache[n.id] = Node(n.id, loc, dict(n.tags), n.version)
+        tags = n.tags
+        if tags.get('natural') != 'tree' or not n.location.valid():
+            return
+        self.ids.append(n.id)
+        self.versions.append(n.version)
+        self.lats.append(n.location.lat)
+        self.lons.append(n.location.lon)
+        self.refs.append(tags.get('ref'))
+        self.species.append(tags.get('species', ''))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def to_frame(self):
+        """DataFrame indexé par id de nœud : lat, lon, version, ref, species."""
+        return pd.DataFrame({
+            'lat':     np.frombuffer(self.lats, dtype=np.float64),
+            'lon':     np.frombuffer(self.lons, dtype=np.float64),
+            'version': np.frombuffer(self.versions, dtype=np.dtype(f'i{self.versions.itemsize}')),
+            'ref':     self.refs,
+            'species': self.species,
+        }, index=pd.Index(np.frombuffer(self.ids, dtype=np.int64), name='Node_ID'))
 
 
 class OSMTreeMatcher:
     def __init__(self, osm_path, csv_path, osm_out, csv_out,
                  threshold_meters=0.2, max_tree_nodes=None, ref_filter='all',
-                 species_filter='same'):
+                 species_filter='same', one_to_one=False):
         self.osm_path = osm_path
         self.csv_path = csv_path
         self.osm_out = osm_out
@@ -58,12 +151,16 @@ class OSMTreeMatcher:
         self.max_tree_nodes = max_tree_nodes
         self.ref_filter = ref_filter  # 'all', 'no_ref', 'with_ref'
         self.species_filter = species_filter  # 'same', 'all', 'different'
+        self.one_to_one = one_to_one  # True : paires exclusives optimales (un nœud OSM par arbre CSV)
 
-        self.handler = NodeCacheHandler()
+        self.handler = TreeNodeHandler()
         self.csv_data = None
-        self.tree_nodes = {}
-        self.spatial_index = None
+        self.tree_nodes = None  # DataFrame des arbres OSM retenus, indexé par id de nœud
+        self.tree_xy = None     # arbres OSM en Lambert 72 (mètres), même ordre que tree_nodes
+        self.kdtree = None
         self.enrichment = {}
+        self.release = None   # release complète lue par read_csv (mode incrémental)
+        self.changes = None   # arbres ajoutés / supprimés / modifiés depuis la release précédente
         self.matched_data = pd.DataFrame(columns=[
             'Node_ID', 'CSV_index', 'Distance_km', 'Numident', 'Circ_cm'
         ])
@@ -110,12 +207,13 @@ class OSMTreeMatcher:
             print("[WARN] species_enrichment.csv non trouvé, enrichissement ignoré.")
 
     def read_osm(self):
-        """Lit le fichier OSM (PBF ou XML .osm) via osmium."""
+        """Lit les nœuds natural=tree du fichier OSM (PBF ou XML .osm) via osmium."""
         print(f"Lecture du fichier OSM : {self.osm_path}")
-        reader = o.io.Reader(self.osm_path)
+        # Seuls les nœuds sont décodés : ways et relations sont ignorés à la lecture
+        reader = o.io.Reader(self.osm_path, o.osm.osm_entity_bits.NODE)
         o.apply(reader, self.handler)
         reader.close()
-        print(f"Nodes chargés depuis OSM : {len(self.handler.node_cache)}")
+        print(f"Arbres chargés depuis OSM : {len(self.handler)}")
 
     def read_csv(self):
         cols = ['FID', 'gid', 'geom', 'numident', 'annee_plant', 'circumference', 'commune',
@@ -123,115 +221,258 @@ class OSMTreeMatcher:
                 'structure_couronne', 'status', 'espace_de_plantation', 'distribution', 'voirie']
         dtype = {'numident': str, 'crown_diam': str}
         self.csv_data = pd.read_csv(self.csv_path, names=cols, skiprows=1, dtype=dtype, decimal=',')
+        # Géométries WKT "POINT (lon lat)" décodées en une passe
+        lon_lat = self.csv_data['geom'].str.extract(r'\(\s*(\S+)\s+([^\s)]+)')
+        self.csv_data['lon'] = lon_lat[0].astype(float)
+        self.csv_data['lat'] = lon_lat[1].astype(float)
 
-    @staticmethod
-    def extract_lat_lon(geom_str):
-        lon, lat = map(float, geom_str.split('(')[-1].split(')')[0].split())
-        return lat, lon
-
-    def search_pbf_nodes(self):
-        counter = 0
-        direction = input("Sorting direction (asc/desc)? [desc]: ").lower() or 'desc'
-        if direction not in ('asc', 'desc'):
-            direction = 'desc'
-
-        sorted_items = sorted(self.handler.node_cache.items(), key=lambda x: x[0],
-                              reverse=(direction == 'desc'))
-
-        for nid, node in sorted_items:
-            if isinstance(node.location, tuple) and node.tags.get('natural') == 'tree':
-                self.tree_nodes[nid] = {
-                    'location': node.location,
-                    'tags': {k: v for k, v in node.tags.items() if k != 'natural'},
-                    'version': node.version
-                }
-                if counter < 10:
-                    print(f"[DEBUG] Node {nid}: loc={node.location}, ver={node.version}")
-                    counter += 1
-                if self.max_tree_nodes and len(self.tree_nodes) >= self.max_tree_nodes:
-                    break
+    def restrict_to_changes(self, store=RELEASE_STORE):
+        """
+        Mode incrémental : ne garde dans csv_data que les arbres ajoutés ou
+        modifiés (circonférence, hauteur, statut, essence) depuis la release
+        enregistrée dans store. Sans release précédente, tout est traité.
+        """
+        self.release = self.csv_data
+        previous = load_release(store)
+        if previous is None:
+            print(f"Aucune release précédente ({store}) : traitement complet.")
+            self.changes = pd.DataFrame({'numident': self.csv_data['numident'], 'change': 'added', 'fields': ''})
+            return
+
+        self.changes, delta = diff_releases(previous, self.csv_data)
+        counts = self.changes['change'].value_counts()
+        print(f"Depuis la release précédente : {counts.get('added', 0)} ajoutés, "
+              f"{counts.get('changed', 0)} modifiés, {counts.get('removed', 0)} supprimés")
+        self.csv_data = self.csv_data[delta]
+
+    def write_changes(self, path='tree_changes.csv'):
+        """Rapport des changements, avec le nœud OSM portant ref=numident s'il existe."""
+        if self.changes is None:
+            return
+        report = self.changes
+        if self.tree_nodes is not None:
+            by_ref = (self.tree_nodes['ref'].dropna().reset_index()
+                      .drop_duplicates('ref').set_index('ref')['Node_ID'])
+            report = report.assign(osm_node_id=report['numident'].map(by_ref).astype('Int64'))
+        report.to_csv(path, index=False)
+        print(f"Changes saved: {path} ({len(report)} rows)")
+
+    def save_release(self, store=RELEASE_STORE):
+        """Enregistre la release lue comme référence du prochain passage incrémental."""
+        save_release(self.release if self.release is not None else self.csv_data, store)
+
+    def eligible_rows(self):
+        """Masque des arbres CSV à traiter : vivants et de circonférence non nulle."""
+        circ = pd.to_numeric(self.csv_data['circumference'], errors='coerce')
+        return (self.csv_data['status'] == 'en vie') & (circ != 0)
+
+    def search_pbf_nodes(self, direction='desc'):
+        """
+        Sélectionne les arbres à matcher parmi ceux lus par read_osm().
+        direction : 'asc' / 'desc' trie par id de nœud avant d'appliquer
+        max_tree_nodes (desc : les arbres les plus récents), None garde
+        l'ordre du fichier.
+        """
+        trees = self.handler.to_frame()
+        if direction in ('asc', 'desc'):
+            trees = trees.sort_index(ascending=(direction == 'asc'))
+        if self.max_tree_nodes:
+            trees = trees.head(self.max_tree_nodes)
+        self.tree_nodes = trees
+
+        for nid, t in trees.head(10).iterrows():
+            print(f"[DEBUG] Node {nid}: loc={(t['lat'], t['lon'])}, ver={t['version']}")
 
         print(f"Total trees indexed: {len(self.tree_nodes)}")
-        if not self.tree_nodes:
+        if self.tree_nodes.empty:
             print("Aucun arbre OSM trouvé. Arrêt du processus de matching.")
             return
-        self.build_rtree_index()
+        self.build_kdtree()
 
-    def build_rtree_index(self):
-        prop = index.Property()
-        prop.dimension = 2
-        idx = index.Index(properties=prop)
-        for nid, info in self.tree_nodes.items():
-            lat, lon = info['location']
-            idx.insert(int(nid), (lon, lat, lon, lat))
-        self.spatial_index = idx
+    def build_kdtree(self):
+        x, y = to_lambert72(self.tree_nodes['lon'].to_numpy(), self.tree_nodes['lat'].to_numpy())
+        self.tree_xy = np.column_stack((x, y))
+        self.kdtree = cKDTree(self.tree_xy)
 
     def match_trees(self):
-        if not self.tree_nodes or self.spatial_index is None:
+        """
+        Matching de tous les arbres CSV en une fois : projection Lambert 72,
+        plus proche arbre OSM par cKDTree.query (ou paires exclusives
+        optimales si one_to_one), seuil appliqué sur la distance en mètres.
+        """
+        if self.tree_nodes is None or self.tree_nodes.empty or self.kdtree is None:
             print("Pas d'index spatial disponible. Veuillez exécuter search_pbf_nodes() avec des résultats valides.")
             return
 
-        matches = []
-        seen = set()
-        deg_buffer = self.threshold_km / 111.32
-
-        for i, row in self.csv_data.iterrows():
-            if row['status'] != 'en vie' or row['circumference'] == '0':
-                continue
-
-            lat, lon = self.extract_lat_lon(row['geom'])
-            minx, miny = lon - deg_buffer, lat - deg_buffer
-            maxx, maxy = lon + deg_buffer, lat + deg_buffer
-            candidates = list(self.spatial_index.intersection((minx, miny, maxx, maxy)))
-
-            best = None
-            best_dist = float('inf')
-
-            for cid in candidates:
-                info = self.tree_nodes.get(cid)
-                if not info:
-                    continue
-                d = haversine_distance((lat, lon), info['location'])
-                if d < self.threshold_km and d < best_dist:
-                    best_dist = d
-                    best = {
-                        'Node_ID': cid,
-                        'CSV_index': i,
-                        'Distance_km': d,
-                        'Numident': row['numident'],
-                        'Circ_cm': row['circumference']
-                    }
-            if best:
-                matches.append(best)
-                seen.add(i)
-
-        self.matched_data = pd.DataFrame(matches, columns=[
-            'Node_ID', 'CSV_index', 'Distance_km', 'Numident', 'Circ_cm'
-        ])
-        print(f"Matched rows: {len(seen)}")
-
-    def write_species_tags(self, f, essence):
-        """Écrit species et taxon:cultivar."""
+        csv = self.csv_data[self.eligible_rows()]
+        x, y = to_lambert72(csv['lon'].to_numpy(), csv['lat'].to_numpy())
+        csv_xy = np.column_stack((x, y))
+
+        if self.one_to_one:
+            # Le meilleur nœud par ligne CSV peut être attribué à plusieurs arbres :
+            # on résout l'affectation exclusive optimale sur le graphe des candidats.
+            pairs = np.array(optimal_pairs(csv_xy, self.tree_xy, self.threshold_m), dtype=float).reshape(-1, 3)
+            rows, nodes, dist = pairs[:, 0].astype(np.int64), pairs[:, 1].astype(np.int64), pairs[:, 2]
+        else:
+            dist, nodes = self.kdtree.query(csv_xy, k=1, distance_upper_bound=self.threshold_m)
+            rows = np.arange(len(csv))
+
+        ok = dist < self.threshold_m
+        rows, nodes, dist = rows[ok], nodes[ok], dist[ok]
+        order = np.argsort(rows, kind='stable')
+        rows, nodes, dist = rows[order], nodes[order], dist[order]
+
+        matched = csv.iloc[rows]
+        self.matched_data = pd.DataFrame({
+            'Node_ID':     self.tree_nodes.index.to_numpy()[nodes],
+            'CSV_index':   matched.index,
+            'Distance_km': dist / 1000.0,
+            'Numident':    matched['numident'].to_numpy(),
+            'Circ_cm':     matched['circumference'].to_numpy(),
+        })
+        print(f"Matched rows: {len(self.matched_data)}")
+
+    def species_block(self, essence):
+        """
+        Tags species / taxon:cultivar et tags d'enrichissement (genus,
+        species:wikidata, leaf_cycle, leaf_type) d'une essence, déjà échappés.
+        """
+        lines = []
         species, cultivar = self.parse_species(essence)
         if species:
-            f.write(f'    <tag k="species" v="{self.escape_xml(species)}" />\n')
+            lines.append(f'    <tag k="species" v="{self.escape_xml(species)}" />\n')
         if cultivar:
-            f.write(f'    <tag k="taxon:cultivar" v="{self.escape_xml(cultivar)}" />\n')
+            lines.append(f'    <tag k="taxon:cultivar" v="{self.escape_xml(cultivar)}" />\n')
+        if essence and not pd.isna(essence):
+            data = self.enrichment.get(str(essence).split("'")[0].strip(), {})
+            for key in ('genus', 'species:wikidata', 'leaf_cycle', 'leaf_type'):
+                val = data.get(key, '')
+                if val:
+                    lines.append(f'    <tag k="{key}" v="{self.escape_xml(val)}" />\n')
+        return ''.join(lines)
+
+    def write_nodes(self, path, action, trees, ids, lats, lons, versions):
+        """
+        Écrit un nœud natural=tree par ligne CSV de `trees`, action modify ou create.
 
-    def write_enrichment_tags(self, f, essence):
-        """Écrit genus, species:wikidata, leaf_cycle, leaf_type depuis le CSV d'enrichissement."""
-        if not essence or pd.isna(essence):
-            return
-        species = str(essence).split("'")[0].strip()
-        data = self.enrichment.get(species, {})
-        for key in ('genus', 'species:wikidata', 'leaf_cycle', 'leaf_type'):
-            val = data.get(key, '')
-            if val:
-                f.write(f'    <tag k="{key}" v="{self.escape_xml(val)}" />\n')
+        Les blocs de tags d'espèce sont calculés une fois par essence distincte
+        (quelques centaines pour ~100k arbres). Sortie compressée si path finit
+        par .gz, au format osmChange si le nom contient .osc.
+        """
+        essences = trees['essence'].fillna('')
+        blocks = {e: self.species_block(e) for e in essences.drop_duplicates()}
+        heights = [
+            f'    <tag k="height" v="{self.escape_xml(h)}" />\n' if pd.notna(h) else ''
+            for h in trees['hauteur'].tolist()
+        ]
+        refs = [self.escape_xml(v) for v in trees['numident'].tolist()]
+        circ_m = (pd.to_numeric(trees['circumference']) / 100.0).tolist()
+
+        osc = '.osc' in os.path.basename(path)
+        action_attr = '' if osc else f' action="{action}"'
+        nodes = (
+            f'  <node id="{nid}"{action_attr} lat="{lat}" lon="{lon}" version="{ver}">\n'
+            '    <tag k="natural" v="tree" />\n'
+            f'    <tag k="circumference" v="{circ}" />\n'
+            f'{height}{blocks[essence]}'
+            f'    <tag k="ref" v="{ref}" />\n'
+            '  </node>\n'
+            for nid, lat, lon, ver, circ, height, essence, ref in zip(
+                ids, lats, lons, versions, circ_m, heights, essences.tolist(), refs)
+        )
+
+        if path.endswith('.gz'):
+            f = gzip.open(path, 'wt', encoding='utf-8', compresslevel=6)
+        else:
+            f = open(path, 'w', encoding='utf-8', buffering=WRITE_BUFFER)
+        with f:
+            if osc:
+                f.write(f'<?xml version="1.0" encoding="UTF-8"?>\n<osmChange version="0.6">\n<{action}>\n')
+                f.writelines(nodes)
+                f.write(f'</{action}>\n</osmChange>\n')
+            else:
+                f.write('<?xml version="1.0" encoding="UTF-8"?>\n<osm version="0.6">\n')
+                f.writelines(nodes)
+                f.write('</osm>')
+
+    def filter_matches(self):
+        """
+        Arbres matchés à écrire, après les filtres ref_filter et species_filter.
+
+        Une seule jointure match -> arbre OSM -> ligne CSV (colonnes CSV
+        suffixées _csv en cas de conflit), puis les filtres en masques.
+        """
+        unique = self.matched_data.drop_duplicates('Node_ID')
+        m = (unique[['Node_ID', 'CSV_index']]
+             .join(self.tree_nodes, on='Node_ID')
+             .join(self.csv_data[['lat', 'lon', 'circumference', 'hauteur', 'essence', 'numident']],
+                   on='CSV_index', rsuffix='_csv'))
+
+        # Filtre sur la clé ref dans les tags OSM existants
+        has_ref = m['ref'].notna()
+        if self.ref_filter == 'no_ref':
+            m = m[~has_ref]
+        elif self.ref_filter == 'with_ref':
+            m = m[has_ref]
+
+        # Filtre sur la correspondance species OSM vs CSV
+        if self.species_filter != 'all':
+            osm_species = m['species'].str.strip().str.lower()
+            essences = m['essence'].fillna('')
+            csv_species_of = {e: (self.parse_species(e)[0] or '').strip().lower()
+                              for e in essences.drop_duplicates()}
+            csv_species = essences.map(csv_species_of)
+            # Si l'un des deux est vide, pas de comparaison possible → exclu
+            keep = (osm_species != '') & (csv_species != '')
+            if self.species_filter == 'same':
+                keep &= osm_species == csv_species
+            elif self.species_filter == 'different':
+                keep &= osm_species != csv_species
+            m = m[keep]
+        return m
+
+    def sweep(self, thresholds, ref_filters=('all',), species_filters=('all',), one_to_one_modes=(False,)):
+        """
+        Nombre de matchs pour chaque combinaison de paramètres, sans rien écrire.
+
+        Le fichier OSM, le CSV et le KD-tree ne sont chargés / construits
+        qu'une fois : seuls le matching (une requête cKDTree par seuil) et
+        les filtres sont rejoués. Retourne un DataFrame, une ligne par
+        configuration.
+        """
+        saved = (self.threshold_m, self.threshold_km, self.ref_filter, self.species_filter,
+                 self.one_to_one, self.matched_data)
+        eligible = int(self.eligible_rows().sum())
+        rows = []
+        try:
+            for one_to_one in one_to_one_modes:
+                for threshold in sorted(thresholds):
+                    self.threshold_m, self.threshold_km = threshold, threshold / 1000.0
+                    self.one_to_one = one_to_one
+                    self.match_trees()
+                    matched_csv = self.matched_data['CSV_index'].nunique()
+                    for ref_filter in ref_filters:
+                        for species_filter in species_filters:
+                            self.ref_filter, self.species_filter = ref_filter, species_filter
+                            rows.append({
+                                'threshold_m': threshold,
+                                'one_to_one': one_to_one,
+                                'ref_filter': ref_filter,
+                                'species_filter': species_filter,
+                                'csv_eligible': eligible,
+                                'matched_csv': matched_csv,
+                                'unmatched_csv': eligible - matched_csv,
+                                'matched_osm': len(self.filter_matches()),
+                            })
+        finally:
+            (self.threshold_m, self.threshold_km, self.ref_filter, self.species_filter,
+             self.one_to_one, self.matched_data) = saved
+        return pd.DataFrame(rows)
 
     def generate_outputs(self, coord_source='csv', unmatched_out='new_trees.osm'):
         if self.matched_data.empty:
-            print("Aucune correspondance trouvée. Fichiers de sortie non générés.")
+            print("Aucune correspondance trouvée. Fichiers des arbres matchés non générés.")
+            self.generate_unmatched_osm(unmatched_out)
             return
 
         # CSV des matchs
@@ -240,184 +481,201 @@ class OSMTreeMatcher:
         print(f"CSV saved: {self.csv_out}")
 
         # OSM des arbres matchés (modification)
-        with open(self.osm_out, 'w', encoding='utf-8') as f:
-            f.write('<?xml version="1.0" encoding="UTF-8"?>\n<osm version="0.6">\n')
-            try:
-                seen_nodes = set()
-                for _, r in self.matched_data.iterrows():
-                    try:
-                        nid = r['Node_ID']
-                        if nid in seen_nodes:
-                            continue
-                        seen_nodes.add(nid)
-
-                        # Filtre sur la clé ref dans les tags OSM existants
-                        osm_tags = self.tree_nodes[nid]['tags']
-                        has_ref = 'ref' in osm_tags
-                        if self.ref_filter == 'no_ref' and has_ref:
-                            continue
-                        if self.ref_filter == 'with_ref' and not has_ref:
-                            continue
-
-                        # Filtre sur la correspondance species OSM vs CSV
-                        if self.species_filter != 'all':
-                            osm_species = osm_tags.get('species', '').strip().lower()
-                            csv_essence = self.csv_data.loc[r['CSV_index'], 'essence']
-                            csv_species, _ = self.parse_species(csv_essence)
-                            csv_species = (csv_species or '').strip().lower()
-                            # Si l'un des deux est vide, pas de comparaison possible → exclu
-                            if not osm_species or not csv_species:
-                                continue
-                            if self.species_filter == 'same' and osm_species != csv_species:
-                                continue
-                            if self.species_filter == 'different' and osm_species == csv_species:
-                                continue
-
-                        if coord_source == 'csv':
-                            lat, lon = self.extract_lat_lon(self.csv_data.loc[r['CSV_index'], 'geom'])
-                        else:
-                            lat, lon = self.tree_nodes[nid]['location']
-                        ver = self.tree_nodes[nid]['version']
-                        circ_m = float(r['Circ_cm']) / 100.0
-                        essence = self.csv_data.loc[r['CSV_index'], 'essence']
-
-                        f.write(f'  <node id="{nid}" action="modify" lat="{lat}" lon="{lon}" version="{ver}">\n')
-                        f.write('    <tag k="natural" v="tree" />\n')
-                        f.write(f'    <tag k="circumference" v="{circ_m}" />\n')
-                        if pd.notna(self.csv_data.loc[r['CSV_index'], 'hauteur']):
-                            f.write(f'    <tag k="height" v="{self.escape_xml(self.csv_data.loc[r["CSV_index"], "hauteur"])}" />\n')
-                        self.write_species_tags(f, essence)
-                        self.write_enrichment_tags(f, essence)
-                        f.write(f'    <tag k="ref" v="{self.escape_xml(self.csv_data.loc[r["CSV_index"], "numident"])}" />\n')
-                        f.write('  </node>\n')
-                    except Exception as e:
-                        print(f"[SKIP matched] index {r['CSV_index']} — {e}")
-                        continue
-            finally:
-                f.write('</osm>')
+        m = self.filter_matches()
+
+        # Circonférences non numériques : ligne ignorée
+        bad = pd.to_numeric(m['circumference'], errors='coerce').isna() & m['circumference'].notna()
+        for i in m.loc[bad, 'CSV_index']:
+            print(f"[SKIP matched] index {i} — circonférence invalide")
+        m = m[~bad]
+
+        lat_col, lon_col = ('lat_csv', 'lon_csv') if coord_source == 'csv' else ('lat', 'lon')
+        self.write_nodes(self.osm_out, 'modify', m, m['Node_ID'].tolist(),
+                         m[lat_col].tolist(), m[lon_col].tolist(), m['version'].tolist())
         print(f"OSM saved: {self.osm_out}")
 
         # OSM des arbres non matchés (création)
         self.generate_unmatched_osm(unmatched_out)
 
     def generate_unmatched_osm(self, unmatched_out='new_trees.osm'):
-        matched_csv_indices = set(self.matched_data['CSV_index'].tolist())
+        new = self.csv_data[self.eligible_rows() & ~self.csv_data.index.isin(self.matched_data['CSV_index'])]
 
-        with open(unmatched_out, 'w', encoding='utf-8') as f:
-            f.write('<?xml version="1.0" encoding="UTF-8"?>\n<osm version="0.6">\n')
-            new_id = -1
-            count = 0
-            try:
-                for i, row in self.csv_data.iterrows():
-                    try:
-                        if row['status'] != 'en vie' or row['circumference'] == '0':
-                            continue
-                        if i in matched_csv_indices:
-                            continue
-
-                        lat, lon = self.extract_lat_lon(row['geom'])
-                        circ_m = float(row['circumference']) / 100.0
-                        essence = row['essence']
-
-                        f.write(f'  <node id="{new_id}" action="create" lat="{lat}" lon="{lon}" version="0">\n')
-                        f.write('    <tag k="natural" v="tree" />\n')
-                        f.write(f'    <tag k="circumference" v="{circ_m}" />\n')
-                        if pd.notna(row['hauteur']):
-                            f.write(f'    <tag k="height" v="{self.escape_xml(row["hauteur"])}" />\n')
-                        self.write_species_tags(f, essence)
-                        self.write_enrichment_tags(f, essence)
-                        f.write(f'    <tag k="ref" v="{self.escape_xml(row["numident"])}" />\n')
-                        f.write('  </node>\n')
-
-                        new_id -= 1
-                        count += 1
-                    except Exception as e:
-                        print(f"[SKIP unmatched] index {i} — {e}")
-                        continue
-            finally:
-                f.write('</osm>')
+        bad = pd.to_numeric(new['circumference'], errors='coerce').isna() & new['circumference'].notna()
+        for i in new.index[bad]:
+            print(f"[SKIP unmatched] index {i} — circonférence invalide")
+        new = new[~bad]
 
+        count = len(new)
+        self.write_nodes(unmatched_out, 'create', new, range(-1, -count - 1, -1),
+                         new['lat'].tolist(), new['lon'].tolist(), [0] * count)
         print(f"Unmatched trees saved: {unmatched_out} ({count} nodes)")
 
 
-if __name__ == '__main__':
-    # --- Choix du format OSM en entrée ---
-    SUPPORTED_OSM_EXTENSIONS = ('.pbf', '.osm', '.osm.xml', '.osm.pbf', '.osm.bz2', '.osm.gz')
-
-    print("Format OSM en entrée :")
-    print("  1 — PBF (téléchargement automatique depuis GitHub, défaut)")
-    print("  2 — Fichier local (PBF ou OSM XML)")
-    osm_format = input("Choix [1]: ").strip() or '1'
-
-    if osm_format == '2':
-        osm_input = input("Chemin du fichier OSM (.pbf, .osm, .osm.xml, .osm.bz2, .osm.gz) : ").strip()
-        if not os.path.isfile(osm_input):
-            print(f"Erreur : fichier introuvable — {osm_input}")
-            exit(1)
-        if not any(osm_input.lower().endswith(ext) for ext in SUPPORTED_OSM_EXTENSIONS):
+SUPPORTED_OSM_EXTENSIONS = ('.pbf', '.osm', '.osm.xml', '.osm.pbf', '.osm.bz2', '.osm.gz')
+CSV_URL = ("https://data.mobility.brussels/geoserver/bm_public_space/wfs?service=wfs&version=1.1.0"
+           "&request=GetFeature&typeName=bm_public_space:trees&outputFormat=csv&srsName=EPSG:4326")
+REF_FILTERS = ('all', 'no_ref', 'with_ref')
+SPECIES_FILTERS = ('same', 'all', 'different')
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Matching des arbres OpenData Brussels Mobility <-> natural=tree OSM",
+        epilog="Les options peuvent aussi venir d'un fichier JSON (--config), dont les clés "
+               "sont les noms des options (ex. {\"threshold\": 0.5, \"ref_filter\": \"no_ref\"}) ; "
+               "la ligne de commande a priorité sur le fichier.",
+    )
+    parser.add_argument("--config", help="Fichier JSON de paramètres")
+    parser.add_argument("--osm", help="Fichier OSM local, PBF ou XML (défaut : Brussels-daily.pbf "
+                                      "depuis GitHub, téléchargé seulement s'il a changé)")
+    parser.add_argument("--csv", help="CSV opendata local (défaut : téléchargé dans trees.csv)")
+    parser.add_argument("--offline", action="store_true",
+                        help="Aucun accès réseau : CSV et PBF depuis le cache local")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Distance maximale en mètres (défaut : 0.2)")
+    parser.add_argument("--max-nodes", type=int, help="Nombre maximal d'arbres OSM à charger")
+    parser.add_argument("--direction", choices=('asc', 'desc'), default='desc',
+                        help="Tri des arbres OSM par id avant --max-nodes (défaut : desc, les plus récents)")
+    parser.add_argument("--coords", choices=('csv', 'pbf'), default='csv',
+                        help="Coordonnées écrites pour les arbres matchés (défaut : csv)")
+    parser.add_argument("--ref-filter", choices=REF_FILTERS, default='all',
+                        help="Arbres matchés : tous, sans tag ref, avec tag ref (défaut : all)")
+    parser.add_argument("--species-filter", choices=SPECIES_FILTERS, default='same',
+                        help="Arbres matchés : species OSM = CSV, tous, ou species différente (défaut : same)")
+    parser.add_argument("--one-to-one", action=argparse.BooleanOptionalAction, default=False,
+                        help="Paires exclusives optimales, chaque arbre OSM utilisé une fois")
+    parser.add_argument("--incremental", action=argparse.BooleanOptionalAction, default=False,
+                        help="Seulement les arbres ajoutés/modifiés depuis la release précédente")
+    parser.add_argument("--enrichment", default='species_enrichment.csv')
+    parser.add_argument("--out-csv", default='matched_data.csv')
+    parser.add_argument("--out-osm", default='matched_data.osm')
+    parser.add_argument("--out-unmatched", default='new_trees.osm')
+    parser.add_argument("--out-changes", default='tree_changes.csv')
+
+    sweep = parser.add_argument_group(
+        "balayage", "Évalue plusieurs configurations sur un seul chargement du PBF et un seul "
+                    "KD-tree, et n'écrit que le tableau des comptes (aucun fichier OSM)")
+    sweep.add_argument("--sweep-thresholds", type=float, nargs="+", metavar="M",
+                       help="Seuils à évaluer, en mètres")
+    sweep.add_argument("--sweep-ref-filters", nargs="+", choices=REF_FILTERS)
+    sweep.add_argument("--sweep-species-filters", nargs="+", choices=SPECIES_FILTERS)
+    sweep.add_argument("--sweep-one-to-one", action="store_true",
+                       help="Évaluer les modes plus-proche-voisin et one-to-one")
+    sweep.add_argument("--sweep-output", default='tree_sweep.csv')
+    return parser
+
+
+def config_value(action, value):
+    """
+    Valeur du fichier --config convertie et contrôlée comme argparse le fait
+    pour la ligne de commande (type, nargs, choices). ValueError sinon.
+    """
+    if action.nargs == 0:
+        # store_true / --x/--no-x : un booléen JSON, pas une chaîne
+        if not isinstance(value, bool):
+            raise ValueError(f"{value!r} n'est pas un booléen (true/false)")
+        return value
+    if value is None:
+        return None
+    many = action.nargs in ('+', '*')
+    values = (value if isinstance(value, list) else [value]) if many else [value]
+    if action.type is not None:
+        try:
+            values = [action.type(v) for v in values]
+        except (TypeError, ValueError):
+            raise ValueError(f"{value!r} n'est pas un {action.type.__name__} valide") from None
+    if action.choices is not None:
+        invalid = [v for v in values if v not in action.choices]
+        if invalid:
+            raise ValueError(f"{invalid[0]!r} invalide (choix : {', '.join(action.choices)})")
+    return values if many else values[0]
+
+
+def parse_args(argv=None):
+    """Options de la ligne de commande, par-dessus celles du fichier --config."""
+    parser = build_parser()
+    pre, _ = parser.parse_known_args(argv)
+    if pre.config:
+        with open(pre.config, encoding='utf-8') as fh:
+            config = json.load(fh)
+        actions = {a.dest: a for a in parser._actions}
+        unknown = sorted(k for k in config if k.replace('-', '_') not in actions)
+        if unknown:
+            parser.error(f"clés inconnues dans {pre.config} : {', '.join(unknown)}")
+        # Les valeurs du fichier ne passent pas par les contrôles d'argparse
+        defaults = {}
+        for key, value in config.items():
+            dest = key.replace('-', '_')
+            try:
+                defaults[dest] = config_value(actions[dest], value)
+            except ValueError as exc:
+                parser.error(f"{key} dans {pre.config} : {exc}")
+        parser.set_defaults(**defaults)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.offline:
+        http_cache.set_offline()
+
+    # --- Fichier OSM en entrée ---
+    if args.osm:
+        if not os.path.isfile(args.osm):
+            sys.exit(f"Erreur : fichier introuvable — {args.osm}")
+        if not args.osm.lower().endswith(SUPPORTED_OSM_EXTENSIONS):
             print(f"Attention : extension non reconnue. Extensions supportées : {', '.join(SUPPORTED_OSM_EXTENSIONS)}")
-            confirm = input("Continuer quand même ? (o/n) [n]: ").strip().lower()
-            if confirm != 'o':
-                exit(1)
+        osm_input = args.osm
     else:
-        osm_input = 'brussels_capital_region.pbf'
-        url = "https://raw.githubusercontent.com/PasLoin/Osm-python-analyse_Belgium/main/pbf_analyse/history/Brussels-daily.pbf"
-        print(f"Téléchargement du PBF depuis {url}…")
-        r = requests.get(url)
-        with open(osm_input, "wb") as f:
+        osm_input = snapshot_path(DAILY_FILENAME, offline=http_cache.is_offline())
+
+    # --- CSV opendata ---
+    csvf = args.csv
+    if not csvf:
+        csvf = 'trees.csv'
+        print("Téléchargement du CSV opendata…")
+        # Cache HTTP partagé : revalidé au plus une fois par jour ($OSM_BE_OFFLINE=1 : cache seul)
+        r = http_cache.get(CSV_URL, ttl=24 * 3600, timeout=300)
+        with open(csvf, "wb") as f:
             f.write(r.content)
-        print(f"PBF téléchargé : {osm_input} ({len(r.content) / 1024 / 1024:.1f} Mo)")
-
-    # --- Téléchargement CSV opendata  ---
-    csvf = 'trees.csv'
-    csv_url = "https://data.mobility.brussels/geoserver/bm_public_space/wfs?service=wfs&version=1.1.0&request=GetFeature&typeName=bm_public_space:trees&outputFormat=csv&srsName=EPSG:4326"
-    print(f"Téléchargement du CSV opendata…")
-    r = requests.get(csv_url)
-    with open(csvf, "wb") as f:
-        f.write(r.content)
-    print(f"CSV téléchargé : {csvf}")
-
-    # --- Paramètres ---
-    out_csv = 'matched_data.csv'
-    out_osm = 'matched_data.osm'
-    out_unmatched = 'new_trees.osm'
-    enrichment_csv = 'species_enrichment.csv'
-
-    max_nodes = input("Max tree nodes to load? (enter for no limit): ")
-    max_nodes = int(max_nodes) if max_nodes.strip() else None
-
-    thresh = input("Threshold distance in meters [0.2]: ")
-    thresh = float(thresh) if thresh.strip() else 0.2
-
-    coord_src = input("Coordinates from csv or pbf? [csv]: ").lower() or 'csv'
-
-    print("\nRef filter for matched trees:")
-    print("  1 — All trees (default)")
-    print("  2 — Only trees WITHOUT ref tag in OSM")
-    print("  3 — Only trees WITH ref tag in OSM")
-    ref_choice = input("Choice [1]: ").strip() or '1'
-    ref_filter_map = {'1': 'all', '2': 'no_ref', '3': 'with_ref'}
-    ref_filter = ref_filter_map.get(ref_choice, 'all')
-    print(f"→ ref_filter = {ref_filter}")
-
-    print("\nSpecies filter for matched trees:")
-    print("  1 — Only where OSM species = CSV species (default)")
-    print("  2 — All, regardless of species")
-    print("  3 — Only where OSM species ≠ CSV species")
-    species_choice = input("Choice [1]: ").strip() or '1'
-    species_filter_map = {'1': 'same', '2': 'all', '3': 'different'}
-    species_filter = species_filter_map.get(species_choice, 'same')
-    print(f"→ species_filter = {species_filter}")
+        print(f"CSV téléchargé : {csvf}")
+
+    sweeping = bool(args.sweep_thresholds or args.sweep_ref_filters
+                    or args.sweep_species_filters or args.sweep_one_to_one)
+    print(f"→ threshold = {args.threshold} m, ref_filter = {args.ref_filter}, "
+          f"species_filter = {args.species_filter}, one_to_one = {args.one_to_one}")
 
     # --- Exécution ---
-    matcher = OSMTreeMatcher(osm_input, csvf, out_osm, out_csv,
-                             threshold_meters=thresh,
-                             max_tree_nodes=max_nodes,
-                             ref_filter=ref_filter,
-                             species_filter=species_filter)
-    matcher.load_enrichment(enrichment_csv)
+    matcher = OSMTreeMatcher(osm_input, csvf, args.out_osm, args.out_csv,
+                             threshold_meters=args.threshold,
+                             max_tree_nodes=args.max_nodes,
+                             ref_filter=args.ref_filter,
+                             species_filter=args.species_filter,
+                             one_to_one=args.one_to_one)
+    matcher.load_enrichment(args.enrichment)
     matcher.read_osm()
-    matcher.search_pbf_nodes()
+    matcher.search_pbf_nodes(args.direction)
     matcher.read_csv()
+    if args.incremental:
+        matcher.restrict_to_changes()
+
+    if sweeping:
+        report = matcher.sweep(
+            args.sweep_thresholds or [args.threshold],
+            args.sweep_ref_filters or [args.ref_filter],
+            args.sweep_species_filters or [args.species_filter],
+            [False, True] if args.sweep_one_to_one else [args.one_to_one],
+        )
+        report.to_csv(args.sweep_output, index=False)
+        print("\n" + report.to_string(index=False))
+        print(f"Sweep saved: {args.sweep_output} ({len(report)} configurations)")
+        return
+
     matcher.match_trees()
-    matcher.generate_outputs(coord_source=coord_src, unmatched_out=out_unmatched)
+    matcher.generate_outputs(coord_source=args.coords, unmatched_out=args.out_unmatched)
+    if args.incremental:
+        matcher.write_changes(args.out_changes)
+        matcher.save_release()
+
+
+if __name__ == '__main__':
+    main()
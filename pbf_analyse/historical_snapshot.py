@@ -14,14 +14,15 @@ clips it to the buffered Brussels-Capital Region boundary, and writes
 ./output/01_01_2022_brussels_capital_region.pbf
 """
 
-import math
 import os
 import subprocess
 import sys
 import urllib.request
 
 from shapely.geometry import Polygon, MultiPolygon
-from shapely.ops import transform
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.projection import buffer_wgs84  # noqa: E402
 
 # ── Configuration ──────────────────────────────────────────────────
 GEOFABRIK_BASE = "https://download.geofabrik.de/europe/"
@@ -111,25 +112,6 @@ def build_geometry(rings: list) -> Polygon | MultiPolygon:
     return MultiPolygon(polys) if len(polys) > 1 else polys[0]
 
 
-def buffer_wgs84(geom, meters: float):
-    """
-    Buffer a WGS84 geometry by an approximate metric distance.
-
-    Projects to a local equirectangular approximation (good enough for
-    city-scale polygons at mid-latitudes).
-    """
-    center_lat = geom.centroid.y
-    m_per_deg_lat = 111_320
-    m_per_deg_lon = 111_320 * math.cos(math.radians(center_lat))
-
-    to_meters = lambda x, y: (x * m_per_deg_lon, y * m_per_deg_lat)
-    to_degrees = lambda x, y: (x / m_per_deg_lon, y / m_per_deg_lat)
-
-    projected = transform(to_meters, geom)
-    buffered = projected.buffer(meters, resolution=32)
-    return transform(to_degrees, buffered)
-
-
 def write_poly_file(geom, path: str):
     """Write a Shapely geometry as an Osmosis .poly file."""
     if isinstance(geom, Polygon):